@@ -0,0 +1,241 @@
+"""
+Content-addressed storage for bot answers.
+
+Replies come from a small set of templates (greetings, follow-up questions,
+diagnosis blocks), so chat_history stores each distinct answer once in the
+shard's `answers` table, keyed by its BLAKE2b hash, and references it by
+answer_id. Long answers are zlib-compressed against a fixed dictionary of the
+recurring diagnosis phrases.
+
+Each answer row also records the top illness of a diagnosis reply, which
+feedback analytics group ratings by (see feedback.py), and whether it is a
+failed reply. The failed flag comes from the caller (backend.chat_turn knows
+when it produced ERROR_REPLY or the dialogue engine fell back to asking for
+more information); it is never guessed from the text, since ordinary Hindi
+diagnoses start with the same warning sign as the error reply.
+
+Rows written before this change keep their text in chat_history.answer;
+readers resolve either form with resolve(). `python answers.py migrate`
+moves those legacy rows over.
+
+ZDICT_V1 must never change once rows are written with codec 1: add a new
+dictionary and codec number instead.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+
+# WELLBOT_ANSWER_CODEC=plain stores new answers uncompressed.
+COMPRESS = os.environ.get("WELLBOT_ANSWER_CODEC", "zlib") != "plain"
+MIN_COMPRESS_BYTES = 96
+
+CODEC_PLAIN = 0
+CODEC_ZLIB_V1 = 1
+
+# What /analytics used to count as a failed query. Only rows written before the
+# explicit flag are classified by it, see legacy_failed().
+FAILED_PREFIX = "⚠️"
+
+# Diagnosis replies list their illnesses, best match first, after one of these.
+ILLNESS_MARKERS = ("**Possible conditions:** ", "संभावित बीमारियां: ")
+
+# Recurring text of diagnosis replies; zlib matches against the end of the
+# dictionary first, so the most common phrases come last.
+ZDICT_V1 = (
+    "💊 उपचार:\n  • \n⚠️ चेतावनी: \n\n🩺 बीमारी: \n🔹 विवरण: \n💡 लक्षण: "
+    "⚠️ कृपया डॉक्टर से परामर्श लें। संभावित बीमारियां: "
+    "fever, बुखार, cough, खांसी, headache, सिरदर्द, fatigue, थकान, nausea, मितली, "
+    "body pain, शरीर दर्द, chills, ठंड लगना, cold, जुकाम, "
+    "Seek urgent care for Seek immediate care for difficulty breathing, "
+    "Consult a doctor if severe or persistent.\n  • Rest and fluids.\n"
+    "\n\n**Possible conditions:** "
+    "\n💊 Treatment:\n  • \n⚠️ Warning: \n\n🩺 Illness: \n🔹 Description: \n💡 Symptoms: "
+    " *Disclaimer:* I'm not a medical professional. "
+    "I can only suggest possible conditions based on your symptoms, "
+    "but please consult a healthcare provider for accurate diagnosis.\n\n🩺 Illness: "
+).encode("utf-8")
+
+ANSWER_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS answers(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash BLOB UNIQUE,
+    body BLOB,
+    codec INTEGER,
+    failed INTEGER,
+    illness TEXT
+)""",
+]
+
+# SQL fragments for reading turns with their answer.
+TURN_JOIN = "chat_history ch LEFT JOIN answers a ON a.id = ch.answer_id"
+ANSWER_COLUMNS = "ch.answer, a.body, a.codec"
+# 0 or 1, never NULL: deduplicated turns have no ch.answer, legacy ones no answers row.
+FAILED_SQL = (
+    f"(COALESCE(a.failed, 0) = 1 OR (COALESCE(ch.answer, '') LIKE '{FAILED_PREFIX}%'"
+    f" AND ch.answer NOT LIKE '%{ILLNESS_MARKERS[1]}%'))"
+)
+
+# Bounded per-connection cache of hash -> id; a few hundred distinct answers
+# cover almost all traffic.
+CACHE_SIZE = 4096
+
+
+def migrate_schema(conn: sqlite3.Connection):
+    for ddl in ANSWER_SCHEMA:
+        conn.execute(ddl)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_history)")]
+    if "answer_id" not in columns:
+        conn.execute("ALTER TABLE chat_history ADD COLUMN answer_id INTEGER REFERENCES answers(id)")
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(answers)")]
+    if "illness" not in columns:
+        conn.execute("ALTER TABLE answers ADD COLUMN illness TEXT")
+
+
+def answer_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def encode(text: str):
+    raw = text.encode("utf-8")
+    if COMPRESS and len(raw) >= MIN_COMPRESS_BYTES:
+        c = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=ZDICT_V1)
+        packed = c.compress(raw) + c.flush()
+        if len(packed) < len(raw):
+            return packed, CODEC_ZLIB_V1
+    return raw, CODEC_PLAIN
+
+
+@lru_cache(maxsize=1024)
+def decode(body: bytes, codec: int) -> str:
+    if codec == CODEC_ZLIB_V1:
+        d = zlib.decompressobj(-15, zdict=ZDICT_V1)
+        return (d.decompress(body) + d.flush()).decode("utf-8")
+    return bytes(body).decode("utf-8")
+
+
+def top_illness(text: str) -> Optional[str]:
+    """Best-matching illness of a diagnosis reply; None for other answers."""
+    for marker in ILLNESS_MARKERS:
+        start = text.find(marker)
+        if start >= 0:
+            names = text[start + len(marker):].split("\n", 1)[0]
+            return names.split(",")[0].strip() or None
+    return None
+
+
+def legacy_failed(text: str) -> bool:
+    """Failed flag for answers stored before callers passed one; diagnoses never failed."""
+    return text.startswith(FAILED_PREFIX) and top_illness(text) is None
+
+
+def resolve(legacy: Optional[str], body: Optional[bytes], codec: Optional[int]) -> str:
+    """Answer text of a turn selected with ANSWER_COLUMNS."""
+    return legacy if body is None else decode(body, codec)
+
+
+def intern(conn: sqlite3.Connection, text: str, cache: Dict[bytes, int] = None, failed: bool = False) -> int:
+    """
+    Return the answers.id for text, inserting it on first sight (caller commits).
+    A stored flag that disagrees with `failed` is corrected, which also fixes
+    answers interned while the flag was still guessed from the text.
+    """
+    key = answer_hash(text)
+    if cache is not None and key in cache:
+        return cache[key]
+    row = conn.execute("SELECT id, failed FROM answers WHERE hash=?", (key,)).fetchone()
+    if row is None:
+        body, codec = encode(text)
+        answer_id = conn.execute(
+            "INSERT INTO answers(hash, body, codec, failed, illness) VALUES (?, ?, ?, ?, ?)",
+            (key, body, codec, int(failed), top_illness(text)),
+        ).lastrowid
+    else:
+        answer_id = row[0]
+        if row[1] != int(failed):
+            conn.execute("UPDATE answers SET failed=? WHERE id=?", (int(failed), answer_id))
+    if cache is not None:
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        cache[key] = answer_id
+    return answer_id
+
+
+def insert_turn(conn: sqlite3.Connection, user_id: str, question: str, answer: str,
+                cache: Dict[bytes, int] = None, timestamp: str = None, failed: bool = False) -> int:
+    """Insert one turn (caller commits); returns its chat_history id. `failed` marks error and fallback replies."""
+    answer_id = intern(conn, answer, cache, failed)
+    if timestamp is None:
+        return conn.execute(
+            "INSERT INTO chat_history(user_id, question, answer_id) VALUES (?, ?, ?)",
+            (user_id, question, answer_id),
+        ).lastrowid
+    return conn.execute(
+        "INSERT INTO chat_history(user_id, question, answer_id, timestamp) VALUES (?, ?, ?, ?)",
+        (user_id, question, answer_id, timestamp),
+    ).lastrowid
+
+
+# -------------------- Legacy migration -------------------- #
+def label_illnesses(conn: sqlite3.Connection) -> int:
+    """
+    Fill answers.illness for answers interned before the column existed, and
+    clear the failed flag the text prefix put on Hindi diagnoses (caller commits).
+    """
+    rows = conn.execute("SELECT id, body, codec FROM answers WHERE illness IS NULL").fetchall()
+    labels = [(top_illness(decode(body, codec)), answer_id) for answer_id, body, codec in rows]
+    conn.executemany("UPDATE answers SET illness=?, failed=0 WHERE id=?", [(i, a) for i, a in labels if i])
+    return sum(1 for i, _ in labels if i)
+
+
+def migrate_rows(conn: sqlite3.Connection, batch: int = 5000) -> int:
+    """Move answer text of pre-dedup rows into `answers`; returns rows converted."""
+    migrate_schema(conn)
+    with conn:
+        label_illnesses(conn)
+    cache = {}
+    converted = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, answer FROM chat_history WHERE answer_id IS NULL AND answer IS NOT NULL LIMIT ?", (batch,)
+        ).fetchall()
+        if not rows:
+            break
+        with conn:
+            conn.executemany(
+                "UPDATE chat_history SET answer_id=?, answer=NULL WHERE id=?",
+                [(intern(conn, answer, cache, legacy_failed(answer)), row_id) for row_id, answer in rows],
+            )
+        converted += len(rows)
+    return converted
+
+
+def main(argv=None):
+    from sharding import shard_paths
+
+    parser = argparse.ArgumentParser(description="Deduplicate chat_history answers written before the answers table.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM each shard afterwards to return the space")
+    args = parser.parse_args(argv)
+
+    for path in shard_paths(args.db, args.shards):
+        conn = sqlite3.connect(path, timeout=30)
+        n = migrate_rows(conn)
+        distinct = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if args.vacuum:
+            conn.execute("VACUUM")
+        conn.close()
+        print(f"{path}: {n} rows converted, {distinct} distinct answers", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+from typing import Optional
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = os.environ.get("WELLBOT_API_URL", "http://localhost:8000")
+
+# (connect, read) seconds; chat replies can take a while under load.
+TIMEOUT = (3.05, 30)
+
+PROFILE_TTL = 300
+ANALYTICS_TTL = 60
+KB_TTL = 300
+
+
+# --- Pooled session (one per Streamlit server process) ---
+@st.cache_resource
+def get_session() -> requests.Session:
+    session = requests.Session()
+    # Only idempotent calls are retried; POST /chat must not be sent twice.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "PUT", "DELETE"],
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get(path: str, **kwargs) -> requests.Response:
+    return get_session().get(f"{API_URL}{path}", timeout=TIMEOUT, **kwargs)
+
+
+def post(path: str, payload: dict) -> requests.Response:
+    return get_session().post(f"{API_URL}{path}", json=payload, timeout=TIMEOUT)
+
+
+def put(path: str, payload: dict) -> requests.Response:
+    return get_session().put(f"{API_URL}{path}", json=payload, timeout=TIMEOUT)
+
+
+def delete(path: str) -> requests.Response:
+    return get_session().delete(f"{API_URL}{path}", timeout=TIMEOUT)
+
+
+# --- Cached reads ---
+@st.cache_data(ttl=PROFILE_TTL, show_spinner=False)
+def fetch_profile(username: str) -> Optional[dict]:
+    r = get(f"/profile/{username}")
+    return r.json() if r.status_code == 200 else None
+
+
+@st.cache_data(ttl=ANALYTICS_TTL, show_spinner=False)
+def fetch_analytics() -> Optional[dict]:
+    r = get("/analytics")
+    return r.json() if r.status_code == 200 else None
+
+
+@st.cache_data(ttl=KB_TTL, show_spinner=False)
+def fetch_kb() -> list:
+    r = get("/kb")
+    return r.json() if r.status_code == 200 else []
+
+
+# --- Writes (invalidate the matching cache) ---
+def save_profile(profile: dict) -> requests.Response:
+    r = post("/profile", profile)
+    fetch_profile.clear()
+    return r
+
+
+def add_kb(question: str, answer: str) -> requests.Response:
+    r = post("/kb", {"question": question, "answer": answer})
+    fetch_kb.clear()
+    return r
+
+
+def edit_kb(entry_id: int, question: str, answer: str) -> requests.Response:
+    r = put(f"/kb/{entry_id}", {"question": question, "answer": answer})
+    fetch_kb.clear()
+    return r
+
+
+def delete_kb(entry_id: int) -> requests.Response:
+    r = delete(f"/kb/{entry_id}")
+    fetch_kb.clear()
+    return r
+
+
+def send_feedback(feedback: dict) -> requests.Response:
+    r = post("/feedback", feedback)
+    fetch_analytics.clear()
+    return r
+
+
+def send_chat(user_id: str, message: str) -> requests.Response:
+    # Analytics counts every turn, but refetching it per message would undo
+    # the cache; it refreshes on its TTL (or the Refresh button) instead.
+    return post("/chat", {"user_id": user_id, "message": message})
@@ -1,10 +1,12 @@
 import streamlit as st
-import requests
 import random
 import time
 import pandas as pd
 
-API_URL = "http://localhost:8000"
+import api_client
+
+CHAT_PAGE = 20        # messages rendered per "load older" step
+KB_PAGE_SIZE = 20
 
 
 # --- Session State Initialization ---
@@ -16,6 +18,226 @@ if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "page" not in st.session_state:
     st.session_state.page = "Home"
+if "chat_window" not in st.session_state:
+    st.session_state.chat_window = CHAT_PAGE
+
+
+# --- Dashboard fragments ---
+# Each panel is an st.fragment: its own widgets rerun only that panel, so
+# sending a chat message doesn't rebuild the admin tabs and vice versa.
+def render_feedback(idx, chat):
+    col1, col2 = st.columns([1, 1])
+    feedback_submitted = False
+    question = st.session_state.chat_history[idx-1]["content"] if idx > 0 else ""
+
+    with col1:
+        if st.button("👍", key=f"up_{idx}"):
+            api_client.send_feedback({
+                "user_id": st.session_state.username,
+                "question": question,
+                "answer": chat["content"],
+                "turn_id": chat.get("turn_id"),
+                "rating": 1,
+                "comment": ""
+            })
+            st.success("Thanks for your feedback 👍")
+            feedback_submitted = True
+
+    with col2:
+        if st.button("👎", key=f"down_{idx}"):
+            api_client.send_feedback({
+                "user_id": st.session_state.username,
+                "question": question,
+                "answer": chat["content"],
+                "turn_id": chat.get("turn_id"),
+                "rating": 0,
+                "comment": ""
+            })
+            st.warning("Thanks for your feedback 👎")
+            feedback_submitted = True
+
+    # Optional comment
+    comment_key = f"comment_{idx}"
+    comment = st.text_input("Add a comment (optional)", key=comment_key)
+    if st.button("Submit Comment", key=f"submit_comment_{idx}") and comment.strip():
+        api_client.send_feedback({
+            "user_id": st.session_state.username,
+            "question": question,
+            "answer": chat["content"],
+            "turn_id": chat.get("turn_id"),
+            "rating": None,
+            "comment": comment.strip()
+        })
+        st.info("Comment submitted!")
+        st.session_state[f"{comment_key}_submitted"] = True
+
+    if feedback_submitted or st.session_state.get(f"{comment_key}_submitted", False):
+        col1.empty()
+        col2.empty()
+
+
+def load_older_messages():
+    st.session_state.chat_window += CHAT_PAGE
+
+
+def send_message():
+    # on_submit callback: runs before the fragment reruns, so the new turn is
+    # already in the history when the transcript is drawn.
+    user_input = st.session_state.chat_box
+    if not user_input:
+        return
+    history = st.session_state.chat_history
+    history.append({"role": "user", "content": user_input})
+    turn_id = None
+    try:
+        response = api_client.send_chat(st.session_state.username, user_input)
+        if response.status_code == 200:
+            data = response.json()
+            bot_reply = data.get("bot", "⚠️ No reply from server.")
+            turn_id = data.get("turn_id")
+            predicted_illness = data.get("predicted_illness")
+            if predicted_illness:
+                bot_reply += f"\n\n**Possible illnesses:** {predicted_illness}"
+        else:
+            bot_reply = f"⚠️ Error: {response.status_code} - {response.text}"
+    except Exception as e:
+        bot_reply = f"❌ Could not connect to backend: {e}"
+
+    # Feedback on this message references the stored turn by its id.
+    history.append({"role": "assistant", "content": bot_reply, "turn_id": turn_id})
+
+
+@st.fragment
+def render_chat():
+    st.markdown("### 💬 Chat with WellBot")
+
+    # Only the last chat_window messages get widgets; older ones on demand.
+    history = st.session_state.chat_history
+    start = max(0, len(history) - st.session_state.chat_window)
+    if start > 0:
+        st.button(f"⬆️ Load older messages ({start} hidden)", key="load_older", on_click=load_older_messages)
+
+    for idx in range(start, len(history)):
+        chat = history[idx]
+        if chat["role"] == "user":
+            with st.chat_message("user"):
+                st.write(chat["content"])
+        else:  # assistant
+            with st.container():
+                with st.chat_message("assistant"):
+                    st.write(chat["content"])
+                render_feedback(idx, chat)
+
+    st.chat_input("Type your message...", key="chat_box", on_submit=send_message)
+
+
+@st.fragment
+def render_analytics():
+    st.subheader("📊 Analytics")
+    if st.button("🔄 Refresh", key="refresh_analytics"):
+        api_client.fetch_analytics.clear()
+    try:
+        analytics = api_client.fetch_analytics()
+        if analytics is not None:
+            st.metric("Total Queries", analytics.get("total_queries", 0))
+            st.metric("Failed Queries", analytics.get("failed_queries", 0))
+            st.metric("Feedback % 👍", analytics.get("feedback_percentage", 0))
+
+            # --- Graph 1: Total vs Failed Queries ---
+            df_total_failed = pd.DataFrame({
+                "Queries": ["Total", "Failed"],
+                "Count": [analytics.get("total_queries", 0), analytics.get("failed_queries", 0)]
+            })
+            st.bar_chart(df_total_failed.set_index("Queries"))
+
+            # --- Graph 2: Daily Queries Trend ---
+            daily_queries = analytics.get("daily_queries", {})  
+            if daily_queries:
+                df_daily = pd.DataFrame(list(daily_queries.items()), columns=["Date", "Queries"])
+                df_daily["Date"] = pd.to_datetime(df_daily["Date"])
+                df_daily = df_daily.sort_values("Date")
+                st.line_chart(df_daily.set_index("Date"))
+
+            # --- Graph 3: Feedback Breakdown ---
+            positive = analytics.get("positive_feedback", 0)
+            negative = analytics.get("negative_feedback", 0)
+            if positive + negative > 0:
+                df_feedback = pd.DataFrame({
+                    "Feedback": ["👍 Positive", "👎 Negative"],
+                    "Count": [positive, negative]
+                })
+                st.bar_chart(df_feedback.set_index("Feedback"))
+
+            # --- Graph 3b: Feedback by intent / illness ---
+            for key, label in (("feedback_by_intent", "Intent"), ("feedback_by_illness", "Illness")):
+                breakdown = analytics.get(key, {})
+                if breakdown:
+                    st.markdown(f"**Feedback by {label.lower()}**")
+                    df_breakdown = pd.DataFrame(
+                        [(k, v["positive"], v["negative"]) for k, v in breakdown.items()],
+                        columns=[label, "👍 Positive", "👎 Negative"],
+                    )
+                    st.bar_chart(df_breakdown.set_index(label))
+
+            # --- Graph 4: Common Failed Queries ---
+            clusters = analytics.get("failed_query_clusters", [])
+            if clusters:
+                df_failed = pd.DataFrame(
+                    [(c["representative"], c["size"]) for c in clusters], columns=["Query", "Count"]
+                )
+                st.bar_chart(df_failed.set_index("Query"))
+                for c in clusters:
+                    with st.expander(f"{c['size']} × {c['representative']}"):
+                        for e in c["examples"]:
+                            st.write(f"{e['count']} × {e['text']}")
+
+        else:
+            st.info("No analytics data available.")
+    except Exception as e:
+        st.warning(f"Error fetching analytics: {e}")
+
+
+@st.fragment
+def render_kb_admin():
+    st.subheader("📝 Knowledge Base")
+    kb_entries = api_client.fetch_kb()
+
+    st.markdown("#### Existing Entries")
+    query = st.text_input("🔎 Search questions and answers", key="kb_search").strip().lower()
+    if query:
+        kb_entries = [e for e in kb_entries if query in e["question"].lower() or query in e["answer"].lower()]
+
+    pages = max(1, -(-len(kb_entries) // KB_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="kb_page")
+    page_entries = kb_entries[(page - 1) * KB_PAGE_SIZE: page * KB_PAGE_SIZE]
+    st.caption(f"{len(kb_entries)} matching entries")
+    if page_entries:
+        st.dataframe(pd.DataFrame(page_entries).set_index("id"))
+
+        # One edit form for the selected row instead of buttons on every row.
+        by_id = {e["id"]: e for e in page_entries}
+        selected = st.selectbox(
+            "Entry to edit", list(by_id), key="kb_selected",
+            format_func=lambda i: f"#{i}: {by_id[i]['question'][:60]}",
+        )
+        entry = by_id[selected]
+        new_q = st.text_input("Edit Q", value=entry["question"], key=f"new_q_{selected}")
+        new_a = st.text_input("Edit A", value=entry["answer"], key=f"new_a_{selected}")
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            if st.button("Save", key=f"save_{selected}"):
+                api_client.edit_kb(selected, new_q, new_a)
+                st.success("Updated!")
+        with col2:
+            st.button("Delete", key=f"delete_{selected}", on_click=api_client.delete_kb, args=(selected,))
+
+    st.markdown("#### Add New Entry")
+    new_question = st.text_input("Question")
+    new_answer = st.text_input("Answer")
+    if st.button("Add Entry"):
+        api_client.add_kb(new_question, new_answer)
+        st.success("Entry added!")
+
 
 # --- Sidebar Navigation ---
 params = st.query_params
@@ -39,7 +261,7 @@ elif choice == "Login":
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        response = requests.post(f"{API_URL}/login", json={"username": username, "password": password})
+        response = api_client.post("/login", {"username": username, "password": password})
         if response.status_code == 200:
             st.success("Login successful! Redirecting to Dashboard...")
             st.session_state.logged_in = True
@@ -57,7 +279,7 @@ elif choice == "Register":
     password = st.text_input("New Password", type="password")
     if st.button("Register"):
         try:
-            r = requests.post(f"{API_URL}/register", json={"username": username, "password": password})
+            r = api_client.post("/register", {"username": username, "password": password})
             if r.status_code == 200:
                 st.success("Registered successfully! Please complete your profile.")
                 st.session_state.username = username
@@ -77,7 +299,7 @@ elif choice == "Profile":
         language = st.selectbox("Preferred Language", ["English", "Hindi"])
         if st.button("Save Profile"):
             try:
-                r = requests.post(f"{API_URL}/profile", json={
+                r = api_client.save_profile({
                     "username": st.session_state.username,
                     "name": name,
                     "age_group": age,
@@ -100,10 +322,9 @@ elif choice == "Dashboard":
     if st.session_state.logged_in:
         st.subheader(f"👋 Welcome, {st.session_state.username}!")
 
-        # Fetch profile
-        response = requests.get(f"{API_URL}/profile/{st.session_state.username}")
-        if response.status_code == 200:
-            profile = response.json()
+        # Fetch profile (cached, cleared when the profile is saved)
+        profile = api_client.fetch_profile(st.session_state.username)
+        if profile:
             st.markdown(f"""
             ### Your Profile
             - **Name:** {profile['name']}
@@ -128,176 +349,23 @@ elif choice == "Dashboard":
 
         # --- Chat Tab ---
         with tab_choice[0]:
-            st.markdown("### 💬 Chat with WellBot")
-
-            for idx, chat in enumerate(st.session_state.chat_history):
-                if chat["role"] == "user":
-                    with st.chat_message("user"):
-                        st.write(chat["content"])
-                else:  # assistant
-                    container = st.container()
-                    with container:
-                        with st.chat_message("assistant"):
-                            st.write(chat["content"])
-
-                        # Feedback buttons
-                        col1, col2 = st.columns([1, 1])
-                        feedback_submitted = False
-
-                        with col1:
-                            if st.button("👍", key=f"up_{idx}"):
-                                feedback_data = {
-                                    "user_id": st.session_state.username,
-                                    "question": st.session_state.chat_history[idx-1]["content"] if idx > 0 else "",
-                                    "answer": chat["content"],
-                                    "rating": 1,
-                                    "comment": ""
-                                }
-                                requests.post(f"{API_URL}/feedback", json=feedback_data)
-                                st.success("Thanks for your feedback 👍")
-                                feedback_submitted = True
-
-                        with col2:
-                            if st.button("👎", key=f"down_{idx}"):
-                                feedback_data = {
-                                    "user_id": st.session_state.username,
-                                    "question": st.session_state.chat_history[idx-1]["content"] if idx > 0 else "",
-                                    "answer": chat["content"],
-                                    "rating": 0,
-                                    "comment": ""
-                                }
-                                requests.post(f"{API_URL}/feedback", json=feedback_data)
-                                st.warning("Thanks for your feedback 👎")
-                                feedback_submitted = True
-
-                        # Optional comment
-                        comment_key = f"comment_{idx}"
-                        comment = st.text_input("Add a comment (optional)", key=comment_key)
-                        if st.button("Submit Comment", key=f"submit_comment_{idx}") and comment.strip():
-                            requests.post(f"{API_URL}/feedback", json={
-                                "user_id": st.session_state.username,
-                                "question": st.session_state.chat_history[idx-1]["content"] if idx > 0 else "",
-                                "answer": chat["content"],
-                                "rating": None,
-                                "comment": comment.strip()
-                            })
-                            st.info("Comment submitted!")
-                            st.session_state[f"{comment_key}_submitted"] = True
-
-                        if feedback_submitted or st.session_state.get(f"{comment_key}_submitted", False):
-                            col1.empty()
-                            col2.empty()
-
-            user_input = st.chat_input("Type your message...")
-            if user_input:
-                st.session_state.chat_history.append({"role": "user", "content": user_input})
-                try:
-                    response = requests.post(f"{API_URL}/chat", json={
-                        "user_id": st.session_state.username,
-                        "message": user_input
-                    })
-                    if response.status_code == 200:
-                        data = response.json()
-                        bot_reply = data.get("bot", "⚠️ No reply from server.")
-                        predicted_illness = data.get("predicted_illness")
-                        if predicted_illness:
-                            bot_reply += f"\n\n**Possible illnesses:** {predicted_illness}"
-                    else:
-                        bot_reply = f"⚠️ Error: {response.status_code} - {response.text}"
-                except Exception as e:
-                    bot_reply = f"❌ Could not connect to backend: {e}"
-
-                st.session_state.chat_history.append({"role": "assistant", "content": bot_reply})
-                st.rerun()
+            render_chat()
 
         # --- Admin Dashboard Tab ---
         with tab_choice[1]:
             st.markdown("### 🛠 Admin Dashboard")
             admin_tabs = st.tabs(["📊 Analytics", "📝 Knowledge Base"])
-
-            # --- Analytics ---
             with admin_tabs[0]:
-                st.subheader("📊 Analytics")
-                try:
-                    analytics_resp = requests.get(f"{API_URL}/analytics")
-                    if analytics_resp.status_code == 200:
-                        analytics = analytics_resp.json()
-                        st.metric("Total Queries", analytics.get("total_queries", 0))
-                        st.metric("Failed Queries", analytics.get("failed_queries", 0))
-                        st.metric("Feedback % 👍", analytics.get("feedback_percentage", 0))
-
-                        # --- Graph 1: Total vs Failed Queries ---
-                        df_total_failed = pd.DataFrame({
-                            "Queries": ["Total", "Failed"],
-                            "Count": [analytics.get("total_queries", 0), analytics.get("failed_queries", 0)]
-                        })
-                        st.bar_chart(df_total_failed.set_index("Queries"))
-
-                        # --- Graph 2: Daily Queries Trend ---
-                        daily_queries = analytics.get("daily_queries", {})  
-                        if daily_queries:
-                            df_daily = pd.DataFrame(list(daily_queries.items()), columns=["Date", "Queries"])
-                            df_daily["Date"] = pd.to_datetime(df_daily["Date"])
-                            df_daily = df_daily.sort_values("Date")
-                            st.line_chart(df_daily.set_index("Date"))
-
-                        # --- Graph 3: Feedback Breakdown ---
-                        positive = analytics.get("positive_feedback", 0)
-                        negative = analytics.get("negative_feedback", 0)
-                        if positive + negative > 0:
-                            df_feedback = pd.DataFrame({
-                                "Feedback": ["👍 Positive", "👎 Negative"],
-                                "Count": [positive, negative]
-                            })
-                            st.bar_chart(df_feedback.set_index("Feedback"))
-
-                        # --- Graph 4: Common Failed Queries ---
-                        failed_queries_list = analytics.get("failed_queries_list", [])
-                        if failed_queries_list:
-                            df_failed = pd.DataFrame(failed_queries_list, columns=["Query"])
-                            top_failed = df_failed["Query"].value_counts().head(10)
-                            st.bar_chart(top_failed)
-
-                    else:
-                        st.info("No analytics data available.")
-                except Exception as e:
-                    st.warning(f"Error fetching analytics: {e}")
-
-            # --- Knowledge Base ---
+                render_analytics()
             with admin_tabs[1]:
-                st.subheader("📝 Knowledge Base")
-                kb_resp = requests.get(f"{API_URL}/kb")
-                kb_entries = kb_resp.json() if kb_resp.status_code == 200 else []
-
-                st.markdown("#### Existing Entries")
-                for entry in kb_entries:
-                    st.write(f"**Q:** {entry['question']}")
-                    st.write(f"**A:** {entry['answer']}")
-                    col1, col2 = st.columns([1, 1])
-                    with col1:
-                        if st.button(f"Edit", key=f"edit_{entry['id']}"):
-                            new_q = st.text_input(f"Edit Q {entry['id']}", value=entry['question'], key=f"new_q_{entry['id']}")
-                            new_a = st.text_input(f"Edit A {entry['id']}", value=entry['answer'], key=f"new_a_{entry['id']}")
-                            if st.button(f"Save {entry['id']}", key=f"save_{entry['id']}"):
-                                requests.put(f"{API_URL}/kb/{entry['id']}", json={"question": new_q, "answer": new_a})
-                                st.success("Updated!")
-                    with col2:
-                        if st.button(f"Delete", key=f"delete_{entry['id']}"):
-                            requests.delete(f"{API_URL}/kb/{entry['id']}")
-                            st.warning("Deleted!")
-
-                st.markdown("#### Add New Entry")
-                new_question = st.text_input("Question")
-                new_answer = st.text_input("Answer")
-                if st.button("Add Entry"):
-                    requests.post(f"{API_URL}/kb", json={"question": new_question, "answer": new_answer})
-                    st.success("Entry added!")
+                render_kb_admin()
 
         # --- Logout ---
         if st.button("🚪 Logout"):
             st.session_state.logged_in = False
             st.session_state.username = ""
             st.session_state.chat_history = []
+            st.session_state.chat_window = CHAT_PAGE
             st.query_params = {"choice": "Home"}
             st.rerun()
 
@@ -0,0 +1,356 @@
+"""
+Cold archive for chat_history.
+
+The hot tables only keep the last WELLBOT_HOT_MONTHS calendar months. Older
+months are moved, one (shard, month) partition at a time, into compressed
+archive files under WELLBOT_ARCHIVE_DIR:
+
+    archive/2026-07/part-<shard>-<uuid>.parquet     (zstd, if pyarrow is installed)
+    archive/2026-07/part-<shard>-<uuid>.jsonl.gz    (otherwise)
+
+Rows inside a part are sorted by user_id. The primary users.db keeps a small
+catalogue (which users appear in which part, per-day counts for /analytics),
+so /chat/history only opens the parts that hold the requested user and range.
+
+A partition is moved in four steps: write the part file, record it in the
+catalogue, delete the rows from the shard in batches, mark the part done. A
+crash between steps is picked up on the next run, which finishes pending
+deletes before archiving anything new.
+
+Usage:
+    python archive.py                     # archive everything older than the hot window
+    python archive.py --hot-months 1 --vacuum
+"""
+import argparse
+import fcntl
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import answers
+import feedback
+from sharding import shard_paths
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+HOT_MONTHS = int(os.environ.get("WELLBOT_HOT_MONTHS", 3))
+
+FORMAT = "parquet" if pyarrow is not None else "jsonl.gz"
+COLUMNS = ["id", "user_id", "question", "answer", "timestamp"]
+BATCH = 5000
+
+CATALOGUE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS chat_archive_parts(
+    path TEXT PRIMARY KEY,
+    month TEXT,
+    source TEXT,
+    max_id INTEGER,
+    rows INTEGER,
+    deleted INTEGER DEFAULT 0
+)""",
+    """CREATE TABLE IF NOT EXISTS chat_archive_users(
+    user_id TEXT,
+    month TEXT,
+    path TEXT,
+    PRIMARY KEY(user_id, path)
+)""",
+    """CREATE TABLE IF NOT EXISTS chat_archive_days(
+    day TEXT,
+    path TEXT,
+    queries INTEGER,
+    failed INTEGER,
+    PRIMARY KEY(day, path)
+)""",
+]
+
+
+def default_archive_dir(db_path: str) -> str:
+    return os.environ.get("WELLBOT_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive"))
+
+
+def ensure_catalogue(conn: sqlite3.Connection):
+    for ddl in CATALOGUE_SCHEMA:
+        conn.execute(ddl)
+    conn.commit()
+
+
+# -------------------- Month arithmetic -------------------- #
+def month_bounds(month: str):
+    """'2026-07' -> ('2026-07-01', '2026-08-01')."""
+    year, mon = int(month[:4]), int(month[5:7])
+    year2, mon2 = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01", f"{year2:04d}-{mon2:02d}-01"
+
+
+def hot_cutoff(hot_months: int, now: datetime = None) -> str:
+    """First day of the oldest month that stays hot."""
+    now = now or datetime.utcnow()
+    index = now.year * 12 + (now.month - 1) - (max(hot_months, 1) - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}-01"
+
+
+# -------------------- Part files -------------------- #
+def write_part(path: str, rows) -> int:
+    """Stream (id, user_id, question, answer, timestamp) batches into a part file."""
+    tmp = path + ".tmp"
+    count = 0
+    if FORMAT == "parquet":
+        schema = pyarrow.schema([
+            ("id", pyarrow.int64()), ("user_id", pyarrow.string()), ("question", pyarrow.string()),
+            ("answer", pyarrow.string()), ("timestamp", pyarrow.string()),
+        ])
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for batch in rows:
+                columns = list(zip(*batch))
+                writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(c) for c in columns], schema=schema))
+                count += len(batch)
+    else:
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            for batch in rows:
+                for row in batch:
+                    f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+                count += len(batch)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def read_part(path: str, user_id: str, since: str = None, until: str = None) -> List[dict]:
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise RuntimeError(f"{path} needs pyarrow to read")
+        table = pq.read_table(path, filters=[("user_id", "=", user_id)])
+        records = table.to_pylist()
+    else:
+        records = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["user_id"] == user_id:
+                    records.append(record)
+                elif records:
+                    break  # parts are sorted by user_id
+    return [r for r in records if in_range(r["timestamp"], since, until)]
+
+
+def normalize_bound(value: Optional[str]) -> Optional[str]:
+    """Parse a date/timestamp bound into chat_history's 'YYYY-MM-DD HH:MM:SS' form.
+
+    Bounds must be full timestamps: the column has NUMERIC affinity, so a bare
+    '2026' would be compared as a number and match nothing.
+    """
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def in_range(timestamp: str, since: str = None, until: str = None) -> bool:
+    return (since is None or timestamp >= since) and (until is None or timestamp < until)
+
+
+# -------------------- Moving partitions -------------------- #
+def iter_turns(cursor):
+    """Batches of (id, user_id, question, answer, timestamp) with answers resolved to text."""
+    while True:
+        batch = cursor.fetchmany(BATCH)
+        if not batch:
+            return
+        yield [(i, u, q, answers.resolve(*a), t) for i, u, q, *a, t in batch]
+
+
+def delete_archived(shard: sqlite3.Connection, month: str, max_id: int):
+    start, end = month_bounds(month)
+    while True:
+        ids = [i for (i,) in shard.execute(
+            "SELECT id FROM chat_history WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?",
+            (start, end, max_id, BATCH),
+        )]
+        # Feedback on these turns keeps its text once the turns are gone.
+        feedback.materialize(shard, ids)
+        shard.executemany("DELETE FROM chat_history WHERE id = ?", [(i,) for i in ids])
+        shard.commit()
+        if len(ids) < BATCH:
+            return
+
+
+def finish_pending(primary: sqlite3.Connection, shard: sqlite3.Connection, source: str):
+    pending = primary.execute(
+        "SELECT path, month, max_id FROM chat_archive_parts WHERE source=? AND deleted=0", (source,)
+    ).fetchall()
+    for path, month, max_id in pending:
+        delete_archived(shard, month, max_id)
+        primary.execute("UPDATE chat_archive_parts SET deleted=1 WHERE path=?", (path,))
+        primary.commit()
+
+
+def archive_partition(primary: sqlite3.Connection, shard: sqlite3.Connection, shard_no: int,
+                      source: str, archive_dir: str, month: str) -> int:
+    start, end = month_bounds(month)
+    span = "ch.timestamp >= ? AND ch.timestamp < ? AND ch.id <= ?"
+    max_id = shard.execute(
+        "SELECT MAX(id) FROM chat_history WHERE timestamp >= ? AND timestamp < ?", (start, end)
+    ).fetchone()[0]
+    if max_id is None:
+        return 0
+    args = (start, end, max_id)
+
+    os.makedirs(os.path.join(archive_dir, month), exist_ok=True)
+    rel_path = os.path.join(month, f"part-{shard_no}-{uuid.uuid4().hex[:12]}.{FORMAT}")
+    rows = write_part(
+        os.path.join(archive_dir, rel_path),
+        iter_turns(shard.execute(
+            f"SELECT ch.id, ch.user_id, ch.question, {answers.ANSWER_COLUMNS}, ch.timestamp "
+            f"FROM {answers.TURN_JOIN} WHERE {span} ORDER BY ch.user_id, ch.id",
+            args,
+        )),
+    )
+    users = shard.execute(f"SELECT DISTINCT ch.user_id FROM chat_history ch WHERE {span}", args).fetchall()
+    days = shard.execute(
+        f"SELECT DATE(ch.timestamp), COUNT(*), COALESCE(SUM({answers.FAILED_SQL}), 0) FROM {answers.TURN_JOIN} "
+        f"WHERE {span} GROUP BY DATE(ch.timestamp)",
+        args,
+    ).fetchall()
+
+    with primary:
+        primary.execute(
+            "INSERT INTO chat_archive_parts(path, month, source, max_id, rows) VALUES (?, ?, ?, ?, ?)",
+            (rel_path, month, source, max_id, rows),
+        )
+        primary.executemany(
+            "INSERT OR IGNORE INTO chat_archive_users(user_id, month, path) VALUES (?, ?, ?)",
+            [(u, month, rel_path) for (u,) in users],
+        )
+        primary.executemany(
+            "INSERT OR REPLACE INTO chat_archive_days(day, path, queries, failed) VALUES (?, ?, ?, ?)",
+            [(day, rel_path, n, failed) for day, n, failed in days],
+        )
+
+    delete_archived(shard, month, max_id)
+    primary.execute("UPDATE chat_archive_parts SET deleted=1 WHERE path=?", (rel_path,))
+    primary.commit()
+    return rows
+
+
+def run_once(db_path: str, shard_count: int, archive_dir: str, hot_months: int = HOT_MONTHS,
+             now: datetime = None, vacuum: bool = False) -> dict:
+    """Archive every month older than the hot window on every shard."""
+    cutoff = hot_cutoff(hot_months, now)
+    moved = {}
+    primary = sqlite3.connect(db_path, timeout=30)
+    ensure_catalogue(primary)
+    try:
+        for shard_no, path in enumerate(shard_paths(db_path, shard_count)):
+            source = os.path.basename(path)
+            shard = primary if path == db_path else sqlite3.connect(path, timeout=30)
+            try:
+                feedback.migrate_schema(shard)
+                finish_pending(primary, shard, source)
+                months = [m for (m,) in shard.execute(
+                    "SELECT DISTINCT substr(timestamp, 1, 7) FROM chat_history WHERE timestamp < ?", (cutoff,)
+                )]
+                for month in months:
+                    n = archive_partition(primary, shard, shard_no, source, archive_dir, month)
+                    moved[month] = moved.get(month, 0) + n
+                if vacuum and months:
+                    shard.execute("VACUUM")
+            finally:
+                if shard is not primary:
+                    shard.close()
+    finally:
+        primary.close()
+    return {"cutoff": cutoff, "moved": moved}
+
+
+# -------------------- Reads -------------------- #
+def read_history(primary: sqlite3.Connection, lock, archive_dir: str, user_id: str,
+                 since: str = None, until: str = None) -> List[dict]:
+    """Archived turns of one user in [since, until), oldest first."""
+    with lock:
+        paths = [p for (p,) in primary.execute(
+            "SELECT path FROM chat_archive_users WHERE user_id=? AND month >= ? AND month <= ? ORDER BY month",
+            (user_id, (since or "0000")[:7], (until or "9999")[:7]),
+        )]
+    turns = []
+    for path in paths:
+        turns.extend(read_part(os.path.join(archive_dir, path), user_id, since, until))
+    turns.sort(key=lambda r: (r["timestamp"], r["id"]))
+    return turns
+
+
+def archived_counts(primary: sqlite3.Connection, lock) -> dict:
+    """Per-day query/failure totals of everything already archived."""
+    with lock:
+        rows = primary.execute(
+            "SELECT day, SUM(queries), COALESCE(SUM(failed), 0) FROM chat_archive_days GROUP BY day"
+        ).fetchall()
+    return {day: (queries, failed) for day, queries, failed in rows}
+
+
+# -------------------- Background job -------------------- #
+class ArchiveJob:
+    """Runs run_once every `interval` seconds; a file lock keeps pre-fork workers from running it twice."""
+
+    def __init__(self, db_path: str, shard_count: int, archive_dir: str, hot_months: int, interval: float,
+                 on_moved: Callable[[], None] = None):
+        self.args = (db_path, shard_count, archive_dir, hot_months)
+        self.on_moved = on_moved
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="chat-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        delay = min(self.interval, 60)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(os.path.join(self.archive_dir, ".lock"), "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    result = run_once(*self.args)
+                    if result["moved"] and self.on_moved:
+                        self.on_moved()
+                except Exception as e:
+                    print(f"[archive] run failed: {e}", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move chat_history months older than the hot window to the archive.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    parser.add_argument("--archive-dir", help="default: WELLBOT_ARCHIVE_DIR or archive/ next to the db")
+    parser.add_argument("--hot-months", type=int, default=HOT_MONTHS)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM shards after moving rows out")
+    args = parser.parse_args(argv)
+
+    archive_dir = args.archive_dir or default_archive_dir(args.db)
+    result = run_once(args.db, args.shards, archive_dir, args.hot_months, vacuum=args.vacuum)
+    moved = ", ".join(f"{m}={n}" for m, n in sorted(result["moved"].items())) or "nothing"
+    print(f"archived rows before {result['cutoff']} to {archive_dir} ({FORMAT}): {moved}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
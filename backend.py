@@ -1,13 +1,23 @@
 import os
 import sys
+import asyncio
+import anyio
+import secrets
 import json
 import sqlite3
 import bcrypt
+import threading
 import traceback
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+import time
+from fastapi import FastAPI, HTTPException, Request, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
 
 # --- Path setup ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,9 +27,27 @@ if SRC_PATH not in sys.path:
 
 # --- Import dialogue manager ---
 try:
-    from chatbot.src.dialogue_manager import get_bot_reply
+    from chatbot.src.dialogue_manager import get_bot_reply, iter_bot_reply
 except ImportError:
     raise ImportError("❌ Could not import dialogue_manager.py. Ensure it's in chatbot/src.")
+from chatbot.src import instrumentation
+from chatbot.src.instrumentation import stage
+from chatbot.src import profiling
+from sharding import ShardSet
+import archive
+import answers
+import export
+import kb_bulk
+import http_cache
+import online_intent
+import model_registry
+import dialogue_workers
+import user_context
+import fair_scheduler
+import nlu
+import failed_clusters
+import feedback
+import orjson
 
 # --- FastAPI app ---
 app = FastAPI(title="WellBot Backend")
@@ -29,12 +57,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Export-Watermark", "ETag"],
 )
 
+# --- Instrumentation (WELLBOT_METRICS=0 disables it) ---
+if instrumentation.ENABLED:
+    @app.middleware("http")
+    async def timing_middleware(request: Request, call_next):
+        timings = instrumentation.begin_request()
+        start = time.perf_counter_ns()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        name = f"route:{route.path if route else request.url.path}"
+        total_us = (time.perf_counter_ns() - start) // 1000
+        instrumentation.histogram(name).record(total_us)
+        timings["total"] = total_us
+        response.headers["Server-Timing"] = instrumentation.server_timing_header(timings)
+        return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition (per process: scrape each worker under serve.py)."""
+    return instrumentation.render_prometheus()
+
+# --- Resource versions (ETags) ---
+# Allocated before serve.py forks, so bumps are visible to every worker.
+# Writers bump after committing; readers take the ETag before reading.
+versions = http_cache.Versions()
+KB_CACHE_CONTROL = "no-cache"
+PROFILE_CACHE_CONTROL = "private, no-cache"
+ANALYTICS_CACHE_CONTROL = "no-cache"
+
 # --- Database setup ---
-DB_PATH = os.path.join(BASE_DIR, "users.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
+# Global tables (users, kb) live on the primary users.db behind conn/cursor.
+# Sync routes run in a threadpool but share that connection/cursor, so every
+# execute+fetch/commit sequence holds db_lock. Per-user tables (profiles,
+# chat_history, feedback) live on WELLBOT_SHARDS shard files, see sharding.py.
+db_lock = threading.RLock()
+DB_PATH = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+SHARD_COUNT = int(os.environ.get("WELLBOT_SHARDS", 1))
+# chat_history months older than WELLBOT_HOT_MONTHS move to compressed files
+# under ARCHIVE_DIR (see archive.py); 0 disables the background job.
+ARCHIVE_DIR = archive.default_archive_dir(DB_PATH)
+ARCHIVE_INTERVAL = float(os.environ.get("WELLBOT_ARCHIVE_INTERVAL", 6 * 3600))
+
+def connect_db():
+    """(Re)open the primary connection and shards; pre-fork workers call this after fork."""
+    global conn, cursor, shards
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+    cursor = conn.cursor()
+    shards = ShardSet.open(DB_PATH, SHARD_COUNT, conn, db_lock)
+    with db_lock:
+        archive.ensure_catalogue(conn)
+
+def close_db():
+    shards.close()
+    conn.close()
+
+connect_db()
 
 # --- Tables ---
 cursor.execute("""CREATE TABLE IF NOT EXISTS users(
@@ -42,38 +122,24 @@ cursor.execute("""CREATE TABLE IF NOT EXISTS users(
     password BLOB
 )""")
 
-cursor.execute("""CREATE TABLE IF NOT EXISTS profiles(
-    username TEXT,
-    name TEXT,
-    age_group TEXT,
-    language TEXT
-)""")
-
-cursor.execute("""CREATE TABLE IF NOT EXISTS chat_history(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    question TEXT,
-    answer TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)""")
-
-cursor.execute("""CREATE TABLE IF NOT EXISTS feedback(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    question TEXT,
-    answer TEXT,
-    rating INTEGER,
-    comment TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)""")
-
 cursor.execute("""CREATE TABLE IF NOT EXISTS kb(
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     question TEXT,
     answer TEXT
 )""")
+kb_bulk.ensure_index(conn)
+failed_clusters.ensure_schema(conn)
 conn.commit()
 
+# Runs in every worker after startup; only one of them wins the archive lock.
+@app.on_event("startup")
+def start_archive_job():
+    if ARCHIVE_INTERVAL > 0:
+        archive.ArchiveJob(
+            DB_PATH, SHARD_COUNT, ARCHIVE_DIR, archive.HOT_MONTHS, ARCHIVE_INTERVAL,
+            on_moved=lambda: versions.bump(versions.ANALYTICS),
+        ).start()
+
 # --- Pydantic Models ---
 class User(BaseModel):
     username: str
@@ -89,148 +155,781 @@ class ChatMessage(BaseModel):
     user_id: str
     message: str
 
+class IntentQuery(BaseModel):
+    text: str
+    user_id: Optional[str] = None
+
+class NLUBatch(BaseModel):
+    texts: List[str]
+    user_id: Optional[str] = None
+    top_k: int = nlu.TOP_K
+    stream: bool = False
+
 # --- Auth routes ---
 @app.post("/register")
 def register(user: User):
     try:
         hashed_pw = bcrypt.hashpw(user.password.encode("utf-8"), bcrypt.gensalt())
-        cursor.execute("INSERT INTO users(username, password) VALUES (?, ?)", (user.username, hashed_pw))
-        conn.commit()
+        with db_lock:
+            cursor.execute("INSERT INTO users(username, password) VALUES (?, ?)", (user.username, hashed_pw))
+            conn.commit()
         return {"message": "User registered successfully!"}
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Username already exists")
 
 @app.post("/login")
 def login(user: User):
-    cursor.execute("SELECT password FROM users WHERE username=?", (user.username,))
-    row = cursor.fetchone()
+    with db_lock:
+        cursor.execute("SELECT password FROM users WHERE username=?", (user.username,))
+        row = cursor.fetchone()
     if row and bcrypt.checkpw(user.password.encode("utf-8"), row[0]):
         return {"message": "Login successful!"}
     raise HTTPException(status_code=401, detail="Invalid username or password")
 
 @app.post("/profile")
 def save_profile(profile: Profile):
-    cursor.execute("DELETE FROM profiles WHERE username=?", (profile.username,))
-    cursor.execute(
-        "INSERT INTO profiles(username, name, age_group, language) VALUES (?, ?, ?, ?)",
-        (profile.username, profile.name, profile.age_group, profile.language),
-    )
-    conn.commit()
+    shard = shards.for_user(profile.username)
+    with shard.lock:
+        shard.conn.execute("DELETE FROM profiles WHERE username=?", (profile.username,))
+        shard.conn.execute(
+            "INSERT INTO profiles(username, name, age_group, language) VALUES (?, ?, ?, ?)",
+            (profile.username, profile.name, profile.age_group, profile.language),
+        )
+        shard.conn.commit()
+    versions.bump_profile(profile.username)
+    user_contexts.invalidate(profile.username)
     return {"message": "Profile saved successfully!"}
 
 @app.get("/profile/{username}")
-def get_profile(username: str):
-    cursor.execute("SELECT name, age_group, language FROM profiles WHERE username=?", (username,))
-    row = cursor.fetchone()
+def get_profile(username: str, request: Request):
+    etag = versions.profile_etag(username)
+    cached = http_cache.not_modified(request, etag, PROFILE_CACHE_CONTROL)
+    if cached:
+        return cached
+    shard = shards.for_user(username)
+    with shard.lock:
+        row = shard.conn.execute(
+            "SELECT name, age_group, language FROM profiles WHERE username=?", (username,)
+        ).fetchone()
     if row:
-        return {"name": row[0], "age_group": row[1], "language": row[2]}
+        payload = {"name": row[0], "age_group": row[1], "language": row[2]}
+        return http_cache.json_response(request, payload, etag, PROFILE_CACHE_CONTROL)
     raise HTTPException(status_code=404, detail="Profile not found")
 
+# --- Per-user context (profile, preferred language, recent turns) ---
+def load_user_context(user_id: str, turns: int) -> user_context.UserContext:
+    shard = shards.for_user(user_id)
+    with shard.lock:
+        profile = shard.conn.execute(
+            "SELECT name, age_group, language FROM profiles WHERE username=?", (user_id,)
+        ).fetchone()
+        rows = shard.conn.execute(
+            f"SELECT ch.question, {answers.ANSWER_COLUMNS} FROM {answers.TURN_JOIN} "
+            "WHERE ch.user_id=? ORDER BY ch.id DESC LIMIT ?",
+            (user_id, turns),
+        ).fetchall()
+    recent = deque(((q, answers.resolve(*a)) for q, *a in reversed(rows)), maxlen=turns)
+    profile = dict(zip(("name", "age_group", "language"), profile)) if profile else None
+    return user_context.UserContext(user_id, profile, recent)
+
+user_contexts = user_context.ContextCache(load_user_context, versions.profile_version)
+
+# --- Fair scheduling (WELLBOT_SCHED=0 disables it) ---
+# Chat turns and inference wait for a slot on the event loop, per-user fair;
+# see fair_scheduler.py for the policy and limits.
+scheduler = fair_scheduler.FairScheduler(
+    weight_of=lambda user_id, w=fair_scheduler.parse_weights(os.environ.get("WELLBOT_SCHED_WEIGHTS", "")): w.get(user_id, 1.0)
+) if os.environ.get("WELLBOT_SCHED", "1") != "0" else None
+
+@asynccontextmanager
+async def fair_slot(user_id: str, headers, cost: float = 1.0):
+    """Hold a scheduler slot for user_id; yields the remaining deadline budget in seconds."""
+    deadline = fair_scheduler.deadline_from_headers(headers)
+    if scheduler is None:
+        yield deadline - time.time()
+        return
+    try:
+        async with scheduler.slot(user_id, deadline, cost) as budget:
+            yield budget
+    except fair_scheduler.Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except fair_scheduler.DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
 # --- Chat Route ---
 @app.post("/chat")
-def chat(msg: ChatMessage):
+async def chat(msg: ChatMessage, request: Request):
     user_msg = msg.message.strip()
     if not user_msg:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
-
+    async with fair_slot(msg.user_id, request.headers) as budget:
+        bot_reply, turn_id, _ = await run_in_threadpool(chat_turn, msg.user_id, user_msg, budget)
+    # turn_id identifies this turn in POST /feedback.
+    return {"user": user_msg, "bot": bot_reply, "turn_id": turn_id}
+
+def chat_turn(user_id: str, user_msg: str, timeout: Optional[float] = None):
+    """
+    Reply to one message and store the turn; returns (reply, turn id, failed).
+    failed is True only for ERROR_REPLY and the engine's no-match fallback.
+    """
+    outcome = {}
+    with profiling.chat_profiler.scope():
+        try:
+            with stage("user_context"):
+                context = user_contexts.get(user_id)
+            with stage("get_bot_reply"):
+                bot_reply = compose_reply(user_id, user_msg, context, timeout, outcome)
+        except Exception:
+            traceback.print_exc()
+            bot_reply = ERROR_REPLY
+            outcome["failed"] = True
+
+        failed = outcome.get("failed", False)
+        turn_id = save_chat_turn(user_id, user_msg, bot_reply, failed)
+    return bot_reply, turn_id, failed
+
+ERROR_REPLY = "⚠️ Sorry, there was an error processing your request."
+
+# --- Dialogue workers (WELLBOT_DIALOGUE_WORKERS=N: sessions live in N sticky processes) ---
+DIALOGUE_WORKERS = int(os.environ.get("WELLBOT_DIALOGUE_WORKERS", 0))
+dialogue_pool = None
+
+@app.on_event("startup")
+def start_dialogue_workers():
+    global dialogue_pool
+    if DIALOGUE_WORKERS > 0:
+        dialogue_pool = dialogue_workers.DialoguePool(DIALOGUE_WORKERS)
+
+@app.on_event("shutdown")
+def stop_dialogue_workers():
+    if dialogue_pool is not None:
+        dialogue_pool.close()
+
+# `outcome` gets "failed": True when the engine fell back to asking for more information.
+def compose_reply(user_id: str, user_msg: str, context=None, timeout: Optional[float] = None,
+                  outcome: Optional[dict] = None) -> str:
+    if dialogue_pool is not None:
+        return dialogue_pool.reply(user_id, user_msg, context, timeout, outcome)
+    return get_bot_reply(user_id=user_id, user_message=user_msg, context=context, outcome=outcome)
+
+def compose_reply_chunks(user_id: str, user_msg: str, context=None, timeout: Optional[float] = None,
+                         outcome: Optional[dict] = None):
+    if dialogue_pool is not None:
+        return dialogue_pool.iter_reply(user_id, user_msg, context, timeout, outcome)
+    return iter_bot_reply(user_id=user_id, user_message=user_msg, context=context, outcome=outcome)
+
+def save_chat_turn(user_id: str, question: str, answer: str, failed: bool = False) -> int:
+    shard = shards.for_user(user_id)
+    with shard.lock:
+        with stage("db_insert"):
+            turn_id = answers.insert_turn(shard.conn, user_id, question, answer, shard.answer_ids, failed=failed)
+        with stage("db_commit"):
+            shard.conn.commit()
+    if failed:
+        # Near-duplicate clusters for /analytics; see failed_clusters.py.
+        item = failed_clusters.prepare(question)
+        with db_lock, stage("failed_cluster"):
+            failed_clusters.record(conn, [item])
+    versions.bump(versions.ANALYTICS)
+    user_contexts.record_turn(user_id, question, answer)
+    return turn_id
+
+# --- Streaming Chat (WebSocket / SSE) ---
+MAX_STREAM_CONNECTIONS = int(os.environ.get("WELLBOT_MAX_STREAM_CONNECTIONS", 1000))
+HEARTBEAT_SECONDS = float(os.environ.get("WELLBOT_HEARTBEAT_SECONDS", 20))
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("WELLBOT_IDLE_TIMEOUT_SECONDS", 600))
+SEND_TIMEOUT_SECONDS = float(os.environ.get("WELLBOT_SEND_TIMEOUT_SECONDS", 10))
+MAX_MESSAGE_CHARS = 2000
+active_streams = 0  # only touched from the event loop
+
+def stream_reply(user_id: str, user_msg: str, timeout: Optional[float] = None, saved: Optional[dict] = None):
+    """
+    Yield reply chunks as they are produced, then store the full turn. Its id
+    and failed flag (as returned by chat_turn) go into `saved`.
+    """
+    chunks = []
+    replies = iter(())
+    outcome = {}
     try:
-        bot_reply = get_bot_reply(user_id=msg.user_id, user_message=user_msg)
+        with stage("user_context"):
+            context = user_contexts.get(user_id)
+        replies = iter(compose_reply_chunks(user_id, user_msg, context, timeout, outcome))
+        for chunk in replies:
+            chunks.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        # The client went away mid-reply. The dialogue session has already
+        # moved on (maybe through a diagnosis reset), so finish the reply and
+        # store the turn anyway.
+        try:
+            chunks.extend(replies)
+        except Exception:
+            traceback.print_exc()
+            chunks = [ERROR_REPLY]
+            outcome["failed"] = True
     except Exception:
         traceback.print_exc()
-        bot_reply = "⚠️ Sorry, there was an error processing your request."
-
-    cursor.execute(
-        "INSERT INTO chat_history(user_id, question, answer) VALUES (?, ?, ?)",
-        (msg.user_id, user_msg, bot_reply),
-    )
-    conn.commit()
+        chunks = [ERROR_REPLY]
+        outcome["failed"] = True
+        yield ERROR_REPLY
+    finally:
+        failed = outcome.get("failed", False)
+        turn_id = save_chat_turn(user_id, user_msg, "".join(chunks), failed)
+        if saved is not None:
+            saved.update(turn_id=turn_id, failed=failed)
+
+async def areply_chunks(user_id: str, user_msg: str, timeout: Optional[float] = None, saved: Optional[dict] = None):
+    # Step the generator in the threadpool so the DB write never blocks the loop.
+    gen = stream_reply(user_id, user_msg, timeout, saved)
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, gen, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # On a disconnect this is where stream_reply stores the turn; the
+        # shield lets that finish even though the request is being cancelled.
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(gen.close)
+
+generating = set()  # producer tasks of fair_reply_chunks, referenced until they finish
+
+async def fair_reply_chunks(user_id: str, user_msg: str, headers, saved: dict):
+    """
+    areply_chunks under a fair_slot, held only while the reply is generated.
+    A producer task queues the chunks and releases the slot as soon as the
+    reply is stored, however slowly the client reads them; if the client
+    goes away, the producer still finishes and stores the turn.
+    Scheduler rejections are raised as HTTPException from the first step.
+    """
+    chunks = asyncio.Queue()
+
+    async def produce():
+        try:
+            async with fair_slot(user_id, headers) as budget:
+                async for chunk in areply_chunks(user_id, user_msg, budget, saved):
+                    chunks.put_nowait(chunk)
+        except HTTPException as e:
+            chunks.put_nowait(e)
+        finally:
+            chunks.put_nowait(None)
+
+    task = asyncio.create_task(produce())
+    generating.add(task)
+    task.add_done_callback(generating.discard)
+    while True:
+        item = await chunks.get()
+        if item is None:
+            return
+        if isinstance(item, HTTPException):
+            raise item
+        yield item
+
+@app.websocket("/ws/chat")
+async def ws_chat(websocket: WebSocket, user_id: str):
+    """
+    One session per connection. Client frames: plain text or {"message": "...", "timeout": seconds}.
+    Server frames: {"type": "chunk", "text"}, then {"type": "done", "turn_id"} per reply;
+    {"type": "ping"} every HEARTBEAT_SECONDS while idle.
+    Each message gets its own deadline: its "timeout", else the handshake's
+    X-Request-Timeout. An absolute X-Request-Deadline on the handshake is
+    ignored, since it would expire every later message on the connection.
+    """
+    handshake_timeout = websocket.headers.get("x-request-timeout")
+    global active_streams
+    if active_streams >= MAX_STREAM_CONNECTIONS:
+        await websocket.close(code=1013)  # try again later
+        return
+    active_streams += 1
+    await websocket.accept()
+
+    async def send(payload: dict):
+        # A client that stops reading blocks the write; drop it instead of buffering.
+        await asyncio.wait_for(websocket.send_json(payload), SEND_TIMEOUT_SECONDS)
 
-    return {"user": user_msg, "bot": bot_reply}
+    try:
+        idle = 0.0
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                idle += HEARTBEAT_SECONDS
+                if idle >= IDLE_TIMEOUT_SECONDS:
+                    await websocket.close(code=1000)
+                    return
+                await send({"type": "ping"})
+                continue
+            idle = 0.0
+            user_msg = raw
+            payload = {}
+            if raw.startswith("{"):
+                try:
+                    payload = json.loads(raw)
+                except ValueError:
+                    payload = {}
+                if payload.get("type") == "pong":
+                    continue
+                user_msg = str(payload.get("message", ""))
+            user_msg = user_msg.strip()[:MAX_MESSAGE_CHARS]
+            if not user_msg:
+                await send({"type": "error", "detail": "Message cannot be empty"})
+                continue
+            timeout = payload.get("timeout", handshake_timeout)
+            limits = {"x-request-timeout": str(timeout)} if timeout is not None else {}
+            # One reply at a time per connection: further frames wait in the
+            # socket buffer until this one is written.
+            saved = {}
+            try:
+                async for chunk in fair_reply_chunks(user_id, user_msg, limits, saved):
+                    await send({"type": "chunk", "text": chunk})
+            except HTTPException as e:
+                await send({"type": "error", "status": e.status_code, "detail": e.detail,
+                            "retry_after": int((e.headers or {}).get("Retry-After", 0))})
+                continue
+            await send({"type": "done", "turn_id": saved.get("turn_id")})
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        pass
+    finally:
+        active_streams -= 1
+
+@app.post("/chat/stream")
+async def chat_stream(msg: ChatMessage, request: Request):
+    """Server-Sent Events variant of /chat: `chunk` events, then `done` with the turn_id."""
+    global active_streams
+    user_msg = msg.message.strip()
+    if not user_msg:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    if active_streams >= MAX_STREAM_CONNECTIONS:
+        raise HTTPException(status_code=503, detail="Too many streaming connections", headers={"Retry-After": "5"})
+    if scheduler is not None and scheduler.queued >= scheduler.max_queued:
+        # Shed before the 200 goes out; later rejections arrive as an `error` event.
+        raise HTTPException(status_code=503, detail="server is overloaded",
+                            headers={"Retry-After": str(scheduler.retry_after())})
+
+    def sse(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        global active_streams
+        active_streams += 1
+        try:
+            yield ": connected\n\n"
+            saved = {}
+            try:
+                async for chunk in fair_reply_chunks(msg.user_id, user_msg, request.headers, saved):
+                    yield sse("chunk", {"text": chunk})
+            except HTTPException as e:
+                yield sse("error", {"status": e.status_code, "detail": e.detail,
+                                    "retry_after": int((e.headers or {}).get("Retry-After", 0))})
+                return
+            yield sse("done", {"turn_id": saved.get("turn_id")})
+        finally:
+            active_streams -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/chat/history/{user_id}")
-def get_chat_history(user_id: str):
-    cursor.execute("SELECT question, answer, timestamp FROM chat_history WHERE user_id=?", (user_id,))
-    rows = cursor.fetchall()
-    return [{"question": q, "answer": a, "timestamp": t} for q, a, t in rows]
+def get_chat_history(user_id: str, since: Optional[str] = None, until: Optional[str] = None):
+    """Turns in [since, until) (dates or timestamps); ranges reaching past the hot window read the archive."""
+    try:
+        since, until = archive.normalize_bound(since), archive.normalize_bound(until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO dates or timestamps")
+    shard = shards.for_user(user_id)
+    with shard.lock:
+        rows = shard.conn.execute(
+            f"SELECT ch.id, ch.question, {answers.ANSWER_COLUMNS}, ch.timestamp FROM {answers.TURN_JOIN} "
+            "WHERE ch.user_id=? AND ch.timestamp >= ? AND ch.timestamp < ? ORDER BY ch.id",
+            (user_id, since or "0000-01-01 00:00:00", until or "9999-12-31 23:59:59"),
+        ).fetchall()
+    cold = archive.read_history(conn, db_lock, ARCHIVE_DIR, user_id, since, until)
+    # A partition being archived is already in its part file but not yet deleted
+    # from the shard; those turns are returned once, from the hot rows.
+    hot = {(turn_id, t) for turn_id, *_, t in rows}
+    return [{"question": r["question"], "answer": r["answer"], "timestamp": r["timestamp"]}
+            for r in cold if (r["id"], r["timestamp"]) not in hot] + \
+        [{"question": q, "answer": answers.resolve(*a), "timestamp": t} for _, q, *a, t in rows]
 
 # --- Feedback ---
 @app.post("/feedback")
 def save_feedback(data: dict):
-    cursor.execute(
-        "INSERT INTO feedback(user_id, question, answer, rating, comment) VALUES (?,?,?,?,?)",
-        (data["user_id"], data["question"], data["answer"], data.get("rating", None), data.get("comment", "")),
-    )
-    conn.commit()
-    return {"message": "Feedback saved!"}
+    """
+    Rate a turn by the turn_id /chat returned. Clients that only send the
+    question and answer text are linked to the matching turn (see feedback.py).
+    """
+    user_id = data["user_id"]
+    turn_id = data.get("turn_id")
+    shard = shards.for_user(user_id)
+    with shard.lock:
+        if turn_id is not None and feedback.turn_owner(shard.conn, turn_id) != user_id:
+            raise HTTPException(status_code=404, detail="Unknown turn_id for this user")
+        turn_id = feedback.save(shard.conn, user_id, data.get("rating", None), data.get("comment", ""), turn_id,
+                                data.get("question"), data.get("answer"))
+        shard.conn.commit()
+    versions.bump(versions.ANALYTICS)
+    return {"message": "Feedback saved!", "turn_id": turn_id}
 
 @app.get("/feedback/{user_id}")
 def get_feedback(user_id: str):
-    cursor.execute("SELECT question, answer, rating, comment, timestamp FROM feedback WHERE user_id=?", (user_id,))
-    rows = cursor.fetchall()
-    return [{"question": q, "answer": a, "rating": r, "comment": c, "timestamp": t} for q, a, r, c, t in rows]
+    shard = shards.for_user(user_id)
+    with shard.lock:
+        rows = shard.conn.execute(
+            f"SELECT {feedback.FEEDBACK_COLUMNS}, f.rating, f.comment, f.timestamp, f.turn_id "
+            f"FROM {feedback.FEEDBACK_JOIN} WHERE f.user_id=? ORDER BY f.id",
+            (user_id,),
+        ).fetchall()
+    return [{"question": q, "answer": feedback.answer_text(*a), "rating": r, "comment": c, "timestamp": t,
+             "turn_id": turn_id} for q, *a, r, c, t, turn_id in rows]
 
 # --- Analytics ---
-@app.get("/analytics")
-def get_analytics():
-    # Total queries
-    cursor.execute("SELECT COUNT(*) FROM chat_history")
-    total_queries = cursor.fetchone()[0]
-
-    # Failed queries (bot replies with ⚠️)
-    cursor.execute("SELECT COUNT(*) FROM chat_history WHERE answer LIKE '⚠️%'")
-    failed_queries = cursor.fetchone()[0]
-
-    # Daily queries
-    cursor.execute("SELECT DATE(timestamp), COUNT(*) FROM chat_history GROUP BY DATE(timestamp)")
-    daily_queries = {row[0]: row[1] for row in cursor.fetchall()}
-
-    # Feedback
-    cursor.execute("SELECT COUNT(*) FROM feedback WHERE rating=1")
-    thumbs_up = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM feedback WHERE rating=0")
-    thumbs_down = cursor.fetchone()[0]
-    total_feedback = thumbs_up + thumbs_down
-    feedback_percentage = int((thumbs_up / total_feedback) * 100) if total_feedback > 0 else 0
+def shard_analytics(shard) -> dict:
+    with shard.lock:
+        c = shard.conn
+        # Total queries
+        total_queries = c.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+
+        # Failed queries (bot replies with ⚠️)
+        failed_queries = c.execute(f"SELECT COUNT(*) FROM {answers.TURN_JOIN} WHERE {answers.FAILED_SQL}").fetchone()[0]
 
-    # Top failed queries
-    cursor.execute("SELECT question FROM chat_history WHERE answer LIKE '⚠️%'")
-    failed_list = [row[0] for row in cursor.fetchall()]
+        # Daily queries
+        daily_queries = dict(c.execute("SELECT DATE(timestamp), COUNT(*) FROM chat_history GROUP BY DATE(timestamp)"))
+
+        # Feedback per day / intent / illness, joined to the rated turns by turn_id
+        feedback_stats = feedback.shard_stats(c)
 
     return {
         "total_queries": total_queries,
         "failed_queries": failed_queries,
         "daily_queries": daily_queries,
+        "positive_feedback": sum(up for up, _ in feedback_stats["by_day"].values()),
+        "negative_feedback": sum(down for _, down in feedback_stats["by_day"].values()),
+        "feedback": feedback_stats,
+    }
+
+@app.get("/analytics")
+def get_analytics(request: Request):
+    etag = versions.etag("analytics", versions.ANALYTICS)
+    cached = http_cache.not_modified(request, etag, ANALYTICS_CACHE_CONTROL)
+    if cached:
+        return cached
+    # Each shard is queried in parallel, then the partial results are merged.
+    # Archived months only contribute counts. Failed query clusters are kept
+    # up to date as turns are written (failed_clusters.py); only the top K are read.
+    parts = shards.map(shard_analytics)
+    daily_queries = {}
+    for part in parts:
+        for day, count in part["daily_queries"].items():
+            daily_queries[day] = daily_queries.get(day, 0) + count
+    archived = archive.archived_counts(conn, db_lock)
+    for day, (count, _) in archived.items():
+        daily_queries[day] = daily_queries.get(day, 0) + count
+
+    thumbs_up = sum(p["positive_feedback"] for p in parts)
+    thumbs_down = sum(p["negative_feedback"] for p in parts)
+    total_feedback = thumbs_up + thumbs_down
+    feedback_percentage = int((thumbs_up / total_feedback) * 100) if total_feedback > 0 else 0
+    with db_lock:
+        clusters = failed_clusters.top_clusters(conn)
+    feedback_stats = feedback.merge_stats([p["feedback"] for p in parts])
+
+    payload = {
+        "total_queries": sum(p["total_queries"] for p in parts) + sum(q for q, _ in archived.values()),
+        "failed_queries": sum(p["failed_queries"] for p in parts) + sum(f for _, f in archived.values()),
+        "daily_queries": daily_queries,
         "positive_feedback": thumbs_up,
         "negative_feedback": thumbs_down,
         "feedback_percentage": feedback_percentage,
-        "failed_queries_list": failed_list
+        "failed_query_clusters": clusters,
+        # Kept for older clients; bounded, see failed_clusters.example_list.
+        "failed_queries_list": failed_clusters.example_list(clusters),
+        "feedback_by_day": feedback_stats["by_day"],
+        "feedback_by_intent": feedback_stats["by_intent"],
+        "feedback_by_illness": feedback_stats["by_illness"],
     }
+    return http_cache.json_response(request, payload, etag, ANALYTICS_CACHE_CONTROL)
+
+# --- Intent model ---
+# Served through the model registry (model_registry.py) once a version is registered;
+# until then, the promoted online_intent.py checkpoint (hot-swapped on promotion).
+intent_model = online_intent.ModelHolder()
+registry = model_registry.Registry()
+
+@app.post("/intent")
+async def predict_intent(query: IntentQuery, request: Request):
+    async with fair_slot(query.user_id or (request.client.host if request.client else "anonymous"), request.headers):
+        return await run_in_threadpool(intent_result, query)
+
+def intent_result(query: IntentQuery) -> dict:
+    try:
+        with stage("intent"):
+            registry.refresh()
+            if registry.active:
+                result = registry.predict(query.text, query.user_id)
+            else:
+                [(intent, confidence)] = intent_model.predict([query.text])
+                result = {"intent": intent, "confidence": confidence, "model_version": intent_model.version}
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except model_registry.RegistryError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    result["confidence"] = round(result["confidence"], 4)
+    return result
+
+@app.get("/intent/model")
+def intent_model_info():
+    intent_model.refresh()
+    return {"version": intent_model.version, "current": online_intent.current_version()}
+
+# --- Batch NLU (stateless: no session, no chat_history) ---
+nlu_intents = nlu.model_intents(registry, intent_model)
+
+@app.post("/nlu/batch")
+async def nlu_batch(batch: NLUBatch, request: Request):
+    """
+    Language, intent, symptoms, entities and top illnesses for each text.
+    With "stream": true (or Accept: application/x-ndjson) results are sent
+    as NDJSON, one line per text in input order, a chunk at a time.
+    """
+    if not batch.texts:
+        raise HTTPException(status_code=400, detail="texts cannot be empty")
+    if len(batch.texts) > nlu.MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"at most {nlu.MAX_BATCH} texts per batch")
+    texts = [t.strip()[:MAX_MESSAGE_CHARS] for t in batch.texts]
+    top_k = max(0, min(batch.top_k, 10))
+    user_id = batch.user_id or (request.client.host if request.client else "anonymous")
+    # One scheduler unit per model call, so a big batch waits its fair share.
+    cost = -(-len(texts) // nlu.CHUNK_TEXTS)
+
+    if not (batch.stream or "application/x-ndjson" in request.headers.get("accept", "")):
+        async with fair_slot(user_id, request.headers, cost):
+            with stage("nlu_batch"):
+                results = await run_in_threadpool(nlu.analyze, texts, nlu_intents, top_k, batch.user_id)
+        return Response(content=orjson.dumps({"count": len(results), "results": results}),
+                        media_type="application/json")
+
+    if scheduler is not None and scheduler.queued >= scheduler.max_queued:
+        raise HTTPException(status_code=503, detail="server is overloaded",
+                            headers={"Retry-After": str(scheduler.retry_after())})
+
+    async def lines():
+        try:
+            async with fair_slot(user_id, request.headers, cost):
+                for start in range(0, len(texts), nlu.CHUNK_TEXTS):
+                    chunk = texts[start:start + nlu.CHUNK_TEXTS]
+                    results = await run_in_threadpool(nlu.analyze, chunk, nlu_intents, top_k, batch.user_id)
+                    yield nlu.ndjson(results)
+        except HTTPException as e:
+            yield orjson.dumps({"error": e.detail, "status": e.status_code}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# --- Admin auth (X-Admin-Token header) ---
+ADMIN_TOKEN = os.environ.get("WELLBOT_ADMIN_TOKEN")
+
+def require_admin(token: str):
+    if not ADMIN_TOKEN or not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@app.get("/models")
+def model_status(x_admin_token: str = Header(None)):
+    """Registered intent models, routing, resident set and per-version metrics (this process)."""
+    require_admin(x_admin_token)
+    return registry.status()
+
+@app.get("/dialogue/workers")
+def dialogue_worker_status(x_admin_token: str = Header(None)):
+    """Dialogue worker processes, restarts and the sessions lost in recent crashes."""
+    require_admin(x_admin_token)
+    if dialogue_pool is None:
+        return {"size": 0, "detail": "dialogue runs in the API process (WELLBOT_DIALOGUE_WORKERS=0)"}
+    return dialogue_pool.status()
+
+@app.get("/scheduler")
+def scheduler_status(x_admin_token: str = Header(None)):
+    """Fair scheduler slots, queue depth and shed/expired counters."""
+    require_admin(x_admin_token)
+    if scheduler is None:
+        return {"detail": "fair scheduling is disabled (WELLBOT_SCHED=0)"}
+    return scheduler.status()
 
 # --- Knowledge Base management ---
 @app.get("/kb")
-def get_kb():
-    cursor.execute("SELECT id, question, answer FROM kb")
-    rows = cursor.fetchall()
-    return [{"id": i, "question": q, "answer": a} for i, q, a in rows]
+def get_kb(request: Request):
+    etag = versions.etag("kb", versions.KB)
+    cached = http_cache.not_modified(request, etag, KB_CACHE_CONTROL)
+    if cached:
+        return cached
+    with db_lock:
+        cursor.execute("SELECT id, question, answer FROM kb")
+        rows = cursor.fetchall()
+    payload = [{"id": i, "question": q, "answer": a} for i, q, a in rows]
+    return http_cache.json_response(request, payload, etag, KB_CACHE_CONTROL)
 
 @app.post("/kb")
 def add_kb(entry: dict):
-    cursor.execute("INSERT INTO kb(question, answer) VALUES (?, ?)", (entry["question"], entry["answer"]))
-    conn.commit()
+    with db_lock:
+        cursor.execute("INSERT INTO kb(question, answer) VALUES (?, ?)", (entry["question"], entry["answer"]))
+        conn.commit()
+    versions.bump(versions.KB)
     return {"message": "KB entry added!"}
 
+# Bulk import/export (admin only); see kb_bulk.py for the row format.
+def write_kb_chunk(rows: list):
+    with db_lock:
+        counts = kb_bulk.upsert_chunk(conn, rows)
+    versions.bump(versions.KB)
+    return counts
+
+@app.post("/kb/bulk")
+async def import_kb(request: Request, format: Optional[str] = None, dry_run: bool = False,
+                    x_admin_token: str = Header(None)):
+    """Stream a CSV (question,answer[,id]) or JSONL upload into kb in chunked transactions."""
+    require_admin(x_admin_token)
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    try:
+        parser = kb_bulk.RowParser(fmt)
+    except kb_bulk.BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summary = kb_bulk.Summary()
+    splitter = kb_bulk.LineSplitter()
+    pending = []
+
+    async def flush():
+        # One transaction per CHUNK_ROWS rows, however the upload was chunked.
+        for start in range(0, len(pending) if not dry_run else 0, kb_bulk.CHUNK_ROWS):
+            rows = pending[start:start + kb_bulk.CHUNK_ROWS]
+            inserted, updated = await run_in_threadpool(write_kb_chunk, rows)
+            summary.inserted += inserted
+            summary.updated += updated
+            summary.chunks += 1
+        pending.clear()
+
+    def take(parsed):
+        for line, record in parsed:
+            summary.received += 1
+            row, error = kb_bulk.validate(record) if isinstance(record, dict) else (None, record)
+            if error:
+                summary.error(line, error)
+            else:
+                pending.append(row)
+
+    try:
+        async for chunk in request.stream():
+            take(parser.lines(splitter.feed(chunk)))
+            if len(pending) >= kb_bulk.CHUNK_ROWS:
+                await flush()
+        take(parser.lines(splitter.close()))
+        take(parser.finish())
+        await flush()
+    except kb_bulk.BulkFormatError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), **summary.as_dict()})
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail={"error": "upload must be UTF-8", **summary.as_dict()})
+
+    if summary.chunks:
+        # Refresh planner statistics once for the whole import.
+        with db_lock:
+            conn.execute("PRAGMA optimize")
+    return {"dry_run": dry_run, **summary.as_dict()}
+
+def kb_page(after: int, limit: int):
+    with db_lock:
+        return conn.execute(
+            "SELECT id, question, answer FROM kb WHERE id > ? ORDER BY id LIMIT ?", (after, limit)
+        ).fetchall()
+
+@app.get("/kb/bulk")
+def export_kb(format: str = "csv", x_admin_token: str = Header(None)):
+    require_admin(x_admin_token)
+    if format not in kb_bulk.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(kb_bulk.FORMATS)}")
+    return StreamingResponse(
+        kb_bulk.iter_export(kb_page, format),
+        media_type=kb_bulk.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="kb.{format}"'},
+    )
+
 @app.put("/kb/{entry_id}")
 def edit_kb(entry_id: int, entry: dict):
-    cursor.execute("UPDATE kb SET question=?, answer=? WHERE id=?", (entry["question"], entry["answer"], entry_id))
-    conn.commit()
+    with db_lock:
+        cursor.execute("UPDATE kb SET question=?, answer=? WHERE id=?", (entry["question"], entry["answer"], entry_id))
+        conn.commit()
+    versions.bump(versions.KB)
     return {"message": "KB entry updated!"}
 
 @app.delete("/kb/{entry_id}")
 def delete_kb(entry_id: int):
-    cursor.execute("DELETE FROM kb WHERE id=?", (entry_id,))
-    conn.commit()
+    with db_lock:
+        cursor.execute("DELETE FROM kb WHERE id=?", (entry_id,))
+        conn.commit()
+    versions.bump(versions.KB)
     return {"message": "KB entry deleted!"}
 
+# --- Debug / Profiling (admin only) ---
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(
+    seconds: float = 5,
+    mode: str = "sample",
+    interval_ms: float = profiling.DEFAULT_INTERVAL_MS,
+    include_idle: bool = False,
+    x_admin_token: str = Header(None),
+):
+    """
+    mode=sample: collapsed stacks of all threads (flamegraph.pl / speedscope input).
+    mode=cprofile: cProfile of /chat handlers that ran during the window.
+    """
+    require_admin(x_admin_token)
+    if mode not in ("sample", "cprofile"):
+        raise HTTPException(status_code=400, detail="mode must be 'sample' or 'cprofile'")
+    seconds = profiling.clamp_seconds(seconds)
+    try:
+        with profiling.exclusive_run():
+            if mode == "cprofile":
+                profiling.chat_profiler.arm(seconds)
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    profiling.chat_profiler.disarm()
+                return profiling.chat_profiler.report()
+            return await run_in_threadpool(profiling.sample_stacks, seconds, interval_ms, include_idle)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
+
+# --- Bulk export (admin only) ---
+@app.get("/export/{table}")
+def export_table(
+    table: str,
+    format: str = "parquet",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    x_admin_token: str = Header(None),
+):
+    """
+    Stream chat_history or feedback as Parquet or an Arrow IPC stream.
+    X-Export-Watermark in the response is the `after` value for the next incremental export.
+    """
+    require_admin(x_admin_token)
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    try:
+        job = export.Export(DB_PATH, SHARD_COUNT, table, since, until, user_id, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"{table}.{'parquet' if format == 'parquet' else 'arrows'}"
+    return StreamingResponse(
+        job.stream(format),
+        media_type=export.FORMATS[format],
+        headers={
+            "X-Export-Watermark": job.watermark,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,125 @@
+"""
+Per-message cost of the single-pass MessageAnalyzer vs. the chain it replaced.
+
+The legacy chain below is the code the dialogue engine ran before
+message_analyzer.py: detect_language, detect_rule_based_intent,
+extract_symptoms and extract_entities, each scanning the message on its own.
+Both run over the same messages: dataset/test.csv plus symptom sentences
+generated from the knowledge base (bench_dialogue.symptom_messages). The
+report also counts the messages whose results differ and prints a few
+examples. Most differences are substring false positives that the analyzer
+fixes, such as "hi" inside "this".
+
+Usage:
+    python benchmarks/bench_analyzer.py --messages 2000 --out analyzer.json
+"""
+import argparse
+import json
+import random
+import re
+
+from common import environment, latency_result, time_calls
+
+from bench_dialogue import SEED, load_test_texts, symptom_messages
+from chatbot.src import dialogue_manager as dm
+
+# -------------------- Legacy chain (before message_analyzer.py) -------------------- #
+duration_pattern = re.compile(r"\bfor\s+(\d+)\s+days?\b")
+severity_pattern = re.compile(r"\b(mild|moderate|severe)\b")
+
+
+def legacy_entities(text):
+    entities = {}
+    d = duration_pattern.search(text)
+    s = severity_pattern.search(text)
+    if d:
+        entities["duration"] = f"{d.group(1)} days"
+    if s:
+        entities["severity"] = s.group(1)
+    return entities
+
+
+def legacy_symptoms(text):
+    found = []
+    lower_text = text.lower()
+    for symptom in dm.SYMPTOM_TO_ILLNESSES.keys():
+        if symptom in lower_text and symptom not in found:
+            found.append(symptom)
+    return found
+
+
+def legacy_intent(msg):
+    m = msg.lower()
+    if any(w in m for w in ["hi", "hello", "hey", "namaste", "नमस्ते"]):
+        return "greet"
+    if any(w in m for w in ["bye", "goodbye", "see you", "tata", "फिर मिलेंगे"]):
+        return "goodbye"
+    if any(w in m for w in ["stress", "anxious", "sad", "depressed", "tension", "तनाव", "उदास"]):
+        return "stress"
+    if any(w in m for w in ["sleep", "tired", "insomnia", "नींद", "थकान"]):
+        return "sleep"
+    if any(w in m for w in ["exercise", "workout", "gym", "योग", "फिटनेस"]):
+        return "exercise"
+    if any(p in m for p in ["what do i have", "diagnose", "so what do i have", "कौन सी बीमारी"]):
+        return "diagnosis_query"
+    return None
+
+
+def legacy_language(msg):
+    if re.search(r"[ऀ-ॿ]", msg):
+        return "hi"
+    return "en"
+
+
+def legacy_chain(msg):
+    return legacy_language(msg), legacy_intent(msg), legacy_symptoms(msg), legacy_entities(msg)
+
+
+def analyzer_chain(msg):
+    a = dm.analyze_message(msg)
+    return a.language, a.intent, a.symptoms, a.entities
+
+
+# -------------------- Benchmark -------------------- #
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(SEED)
+    messages = symptom_messages(rng, load_test_texts(), args.messages)
+    calls = [(m,) for m in messages]
+
+    results = []
+    for mode, fn in (("legacy-chain", legacy_chain), ("analyzer", analyzer_chain)):
+        r = latency_result(time_calls(fn, calls, args.repeat))
+        r["mode"] = mode
+        results.append(r)
+        print(f"{mode:12s} median={r['value']:7.2f}us  p90={r['p90_us']:7.2f}us  p99={r['p99_us']:7.2f}us", flush=True)
+    results[1]["speedup"] = round(results[0]["value"] / results[1]["value"], 2)
+    print(f"speedup: {results[1]['speedup']}x")
+
+    fields = ("language", "intent", "symptoms", "entities")
+    diffs = {f: 0 for f in fields}
+    examples = []
+    for m in messages:
+        old, new = legacy_chain(m), analyzer_chain(m)
+        for f, a, b in zip(fields, old, new):
+            if (sorted(a) if f == "symptoms" else a) != (sorted(b) if f == "symptoms" else b):
+                diffs[f] += 1
+                if len(examples) < 8:
+                    examples.append({"message": m, "field": f, "legacy": a, "analyzer": b})
+    print(f"messages with different results: {diffs} of {len(messages)}")
+    for e in examples:
+        print(f"  {e['field']:9s} {e['message']!r}: {e['legacy']} -> {e['analyzer']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "message_analyzer", "environment": environment(), "results": results,
+                       "differences": diffs, "examples": examples}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
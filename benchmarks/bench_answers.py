@@ -0,0 +1,121 @@
+"""
+chat_history size and insert throughput with and without answer deduplication.
+
+Builds a synthetic workload of N turns whose answers come from the real reply
+templates (greetings, follow-ups, goodbyes and rendered English/Hindi
+diagnoses for random symptom sets), then inserts it into a fresh database
+three ways:
+
+    legacy   full answer text in every chat_history row (the old schema)
+    plain    answers table, deduplicated, uncompressed
+    zlib     answers table, deduplicated, zlib with the shared dictionary
+
+and reports rows/s and the database file size.
+
+Usage:
+    python benchmarks/bench_answers.py --turns 1000000
+    python benchmarks/bench_answers.py --turns 100000 --out answers.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from common import throughput_result
+
+import answers
+import chatbot.src.dialogue_manager as dm
+from sharding import USER_SCHEMA
+
+SEED = 1234
+
+
+def answer_pool(rng: random.Random, diagnoses: int) -> dict:
+    all_syms = sorted(dm.SYMPTOM_TO_ILLNESSES)
+    pool = {
+        "greet": dm.GREETINGS,
+        "more": dm.MORE_SYMPTOMS,
+        "bye": dm.GOODBYES,
+        "diagnosis": [],
+    }
+    for i in range(diagnoses):
+        matches = dm.detect_possible_illnesses(rng.sample(all_syms, rng.randint(2, 5)))
+        if matches:
+            lang = "hi" if i % 4 == 0 else "en"
+            pool["diagnosis"].append(dm.build_diagnosis_and_reset("bench", matches, lang))
+    return pool
+
+
+def workload(rng: random.Random, pool: dict, turns: int):
+    kinds = ["greet", "more", "more", "more", "diagnosis", "bye"]
+    for i in range(turns):
+        kind = rng.choice(kinds)
+        yield f"user-{i % 5000}", f"message {i}", rng.choice(pool[kind])
+
+
+def measure(mode: str, rows: list, commit_every: int) -> dict:
+    answers.COMPRESS = mode == "zlib"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        conn = sqlite3.connect(path)
+        for ddl in USER_SCHEMA:
+            conn.execute(ddl)
+        if mode != "legacy":
+            answers.migrate_schema(conn)
+        conn.commit()
+
+        cache = {}
+        start = time.perf_counter()
+        for i, (user_id, question, answer) in enumerate(rows, 1):
+            if mode == "legacy":
+                conn.execute(
+                    "INSERT INTO chat_history(user_id, question, answer) VALUES (?, ?, ?)",
+                    (user_id, question, answer),
+                )
+            else:
+                answers.insert_turn(conn, user_id, question, answer, cache)
+            if i % commit_every == 0:
+                conn.commit()
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        distinct = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] if mode != "legacy" else None
+        conn.close()
+        size = os.path.getsize(path)
+
+    result = throughput_result(len(rows), elapsed)
+    result.update({"mode": mode, "db_bytes": size, "distinct_answers": distinct})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="chat_history size/throughput with deduplicated answers.")
+    parser.add_argument("--turns", type=int, default=1_000_000)
+    parser.add_argument("--diagnoses", type=int, default=400, help="distinct diagnosis replies in the pool")
+    parser.add_argument("--commit-every", type=int, default=1000)
+    parser.add_argument("--modes", default="legacy,plain,zlib")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    random.seed(SEED)
+    rng = random.Random(SEED)
+    rows = list(workload(rng, answer_pool(rng, args.diagnoses), args.turns))
+    avg = sum(len(a.encode("utf-8")) for _, _, a in rows) / len(rows)
+    print(f"{len(rows)} turns, mean answer {avg:.0f} bytes", flush=True)
+
+    results = []
+    for mode in args.modes.split(","):
+        r = measure(mode, rows, args.commit_every)
+        results.append(r)
+        print(f"{mode:7s} rows/s={r['value']:10.1f}  db={r['db_bytes'] / 2**20:8.1f} MiB  "
+              f"distinct answers={r['distinct_answers']}", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "answer_dedup", "turns": args.turns, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
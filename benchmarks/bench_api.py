@@ -0,0 +1,120 @@
+"""
+HTTP-level benchmark of backend:app, driven in-process over ASGI (no sockets,
+no network) against a temporary users.db.
+
+Virtual clients run concurrently on one event loop; each sends a short
+conversation to /chat and then reads /chat/history, /profile and /kb, so the
+DB paths are exercised alongside the dialogue engine.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from common import latency_result, throughput_result
+
+CONVERSATION = ["hello", "I have fever", "and a cough with headache", "so what do i have", "bye"]
+
+
+async def asgi_request(app, method: str, path: str, payload=None, headers=None, response_headers=None) -> int:
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    request_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if response_headers is not None:
+                response_headers.update((k.decode(), v.decode()) for k, v in message.get("headers", []))
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def client(app, client_id: int, conversations: int, latencies, errors):
+    user_id = f"bench-{client_id}"
+    for _ in range(conversations):
+        calls = [("POST", "/chat", {"user_id": user_id, "message": m}) for m in CONVERSATION]
+        calls += [("GET", f"/chat/history/{user_id}", None), ("GET", f"/profile/{user_id}", None), ("GET", "/kb", None)]
+        for method, path, payload in calls:
+            t0 = time.perf_counter_ns()
+            status = await asgi_request(app, method, path, payload)
+            latencies.append(time.perf_counter_ns() - t0)
+            if status >= 500:
+                errors.append((path, status))
+
+
+async def load(app, clients: int, conversations: int):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(app, c, conversations, latencies, errors) for c in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(quick: bool = False) -> dict:
+    if "WELLBOT_DB" not in os.environ:
+        raise RuntimeError("set WELLBOT_DB to a temporary path before importing backend")
+    import backend
+
+    clients = 4 if quick else 16
+    conversations = 2 if quick else 10
+    latencies, errors, elapsed = asyncio.run(load(backend.app, clients, conversations))
+    if errors:
+        raise RuntimeError(f"{len(errors)} requests failed, first: {errors[0]}")
+    results = {"api.requests": throughput_result(len(latencies), elapsed, latencies)}
+    results.update(asyncio.run(poll(backend.app, 50 if quick else 500)))
+    return results
+
+
+async def poll(app, n: int) -> dict:
+    """An idle dashboard polling /analytics: full responses vs If-None-Match revalidation."""
+    probe = {}
+    await asgi_request(app, "GET", "/analytics", response_headers=probe)
+    etag = probe["etag"]
+    results = {}
+    for name, headers in (("api.analytics_poll_full", {}), ("api.analytics_poll_304", {"If-None-Match": etag})):
+        samples = []
+        for _ in range(n):
+            t0 = time.perf_counter_ns()
+            await asgi_request(app, "GET", "/analytics", headers=headers)
+            samples.append(time.perf_counter_ns() - t0)
+        results[name] = latency_result(samples)
+    return results
+
+
+def temp_db_env() -> tempfile.TemporaryDirectory:
+    """Point WELLBOT_DB at a throwaway directory; keep the handle alive while benchmarking."""
+    tmp = tempfile.TemporaryDirectory(prefix="wellbot-bench-")
+    os.environ["WELLBOT_DB"] = os.path.join(tmp.name, "users.db")
+    return tmp
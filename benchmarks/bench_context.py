@@ -0,0 +1,97 @@
+"""
+SQL statements per /chat turn, with and without the per-user context cache.
+
+Every statement on the primary and shard connections is counted through
+sqlite3's trace callback while --users users each hold a --turns-turn
+conversation. Three modes are compared:
+
+    no-context   context=None, as /chat was before profiles reached the dialogue engine
+    uncached     context loaded on every turn (WELLBOT_CONTEXT_TTL=0)
+    cached       ContextCache with its defaults
+
+Usage:
+    python benchmarks/bench_context.py --users 200 --turns 10
+"""
+import argparse
+import json
+import os
+import tempfile
+from collections import Counter
+
+from common import environment
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["WELLBOT_DB"] = os.path.join(_tmp.name, "users.db")  # before backend is imported
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import backend  # noqa: E402
+import user_context  # noqa: E402
+
+MESSAGES = ["hello", "I have fever", "and cough", "also headache", "I feel tired", "bye"]
+
+
+def count_statements(run) -> Counter:
+    counts = Counter()
+
+    def trace(sql: str):
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        counts[verb] += 1
+
+    conns = [backend.conn] + [s.conn for s in backend.shards.shards]
+    for c in conns:
+        c.set_trace_callback(trace)
+    try:
+        run()
+    finally:
+        for c in conns:
+            c.set_trace_callback(None)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    client = TestClient(backend.app)
+    for u in range(args.users):
+        client.post("/profile", json={"username": f"ctx-{u}", "name": "x", "age_group": "18-25",
+                                      "language": "Hindi" if u % 2 else "English"})
+
+    def conversation():
+        for t in range(args.turns):
+            for u in range(args.users):
+                client.post("/chat", json={"user_id": f"ctx-{u}", "message": MESSAGES[t % len(MESSAGES)]})
+
+    original_get = backend.user_contexts.get
+    modes = {}
+    backend.user_contexts.get = lambda user_id: None
+    modes["no-context"] = count_statements(conversation)
+    backend.user_contexts.get = original_get
+
+    cached = backend.user_contexts
+    backend.user_contexts = user_context.ContextCache(backend.load_user_context, backend.versions.profile_version, ttl=0)
+    modes["uncached"] = count_statements(conversation)
+    backend.user_contexts = cached
+    modes["cached"] = count_statements(conversation)
+
+    turns = args.users * args.turns
+    results = []
+    for mode, counts in modes.items():
+        r = {"mode": mode, "turns": turns, "statements_per_turn": round(sum(counts.values()) / turns, 2),
+             "selects_per_turn": round(counts["SELECT"] / turns, 2), "by_verb": dict(counts)}
+        results.append(r)
+        print(f"{mode:11s} statements/turn={r['statements_per_turn']:5.2f}  selects/turn={r['selects_per_turn']:5.2f}",
+              flush=True)
+    print(f"cache: {cached.stats()}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "context_queries", "environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Dialogue-engine benchmarks: micro-benchmarks of the matcher/formatter and a
+multi-turn conversation simulator driving get_bot_reply.
+
+Conversation scripts are generated from the knowledge base (greet, two or
+three symptoms, diagnosis request, goodbye) and from dataset/test.csv
+(utterances replayed in groups of five per user).
+"""
+import csv
+import os
+import random
+import time
+
+from common import BASE_DIR, latency_result, throughput_result, time_calls
+
+from chatbot.src import dialogue_manager as dm
+from chatbot.src.knowledge_base import format_health_info
+
+TEST_CSV = os.path.join(BASE_DIR, "dataset", "test.csv")
+SEED = 1234
+
+
+def load_test_texts():
+    with open(TEST_CSV, newline="", encoding="utf-8") as f:
+        return [row["text"] for row in csv.DictReader(f)]
+
+
+def english_symptoms(illness: str):
+    return [s for s in dm.KB[illness].get("symptoms", []) if s.isascii()]
+
+
+# -------------------- Inputs -------------------- #
+def symptom_messages(rng: random.Random, texts, n: int):
+    templates = [
+        "I have {a} and {b}",
+        "feeling {a} since yesterday, also some {b}",
+        "severe {a} for 3 days",
+        "{a}, {b} and a bit of {c}",
+    ]
+    all_syms = sorted(s for s in dm.SYMPTOM_TO_ILLNESSES if s.isascii())
+    out = []
+    for i in range(n):
+        if i % 3 == 0:
+            out.append(rng.choice(texts))
+        else:
+            a, b, c = rng.sample(all_syms, 3)
+            out.append(rng.choice(templates).format(a=a, b=b, c=c))
+    return out
+
+
+def symptom_sets(rng: random.Random, n: int):
+    all_syms = sorted(dm.SYMPTOM_TO_ILLNESSES)
+    return [rng.sample(all_syms, rng.randint(2, 6)) for _ in range(n)]
+
+
+def conversation_scripts(rng: random.Random, texts):
+    scripts = []
+    for illness in sorted(dm.KB):
+        syms = english_symptoms(illness)
+        if len(syms) < 2:
+            continue
+        picked = rng.sample(syms, min(3, len(syms)))
+        turns = ["hello"] + [f"I have {s}" for s in picked] + ["so what do i have", "bye"]
+        scripts.append(turns)
+    for i in range(0, len(texts), 5):
+        scripts.append(texts[i:i + 5])
+    return scripts
+
+
+# -------------------- Benchmarks -------------------- #
+def bench_micro(rng: random.Random, texts, repeat: int):
+    messages = symptom_messages(rng, texts, 200)
+    sets = symptom_sets(rng, 200)
+    illnesses = sorted(dm.KB)
+    fmt_args = [(dm.KB[ill], ill, None, lang) for ill in illnesses for lang in ("en", "hi")]
+    return {
+        "micro.extract_symptoms": latency_result(time_calls(dm.extract_symptoms, [(m,) for m in messages], repeat)),
+        "micro.detect_possible_illnesses": latency_result(
+            time_calls(dm.detect_possible_illnesses, [(s,) for s in sets], repeat)
+        ),
+        "micro.format_health_info": latency_result(time_calls(format_health_info, fmt_args, repeat)),
+    }
+
+
+def simulate(scripts, rounds: int):
+    latencies = []
+    turns = 0
+    start = time.perf_counter()
+    for r in range(rounds):
+        for i, script in enumerate(scripts):
+            user_id = f"sim-{r}-{i}"
+            for msg in script:
+                t0 = time.perf_counter_ns()
+                dm.get_bot_reply(user_id, msg)
+                latencies.append(time.perf_counter_ns() - t0)
+                turns += 1
+            dm.user_sessions.pop(user_id, None)
+    elapsed = time.perf_counter() - start
+    return {"conversation.turns": throughput_result(turns, elapsed, latencies)}
+
+
+def run(quick: bool = False) -> dict:
+    random.seed(SEED)  # get_bot_reply picks phrases with the global RNG
+    rng = random.Random(SEED)
+    texts = load_test_texts()
+    results = bench_micro(rng, texts, repeat=2 if quick else 10)
+    results.update(simulate(conversation_scripts(rng, texts), rounds=1 if quick else 5))
+    return results
@@ -0,0 +1,94 @@
+"""
+Throughput of the dialogue engine in-process vs. DialoguePool with 1..N workers.
+
+The in-process baseline calls get_bot_reply from --clients threads, which
+is what the FastAPI threadpool does today; the GIL lets only one of them run
+at a time. The pool runs are driven the same way: each client thread is a
+set of users whose turns go through DialoguePool.reply. Each client cycles
+through a full conversation (greeting, symptoms, diagnosis, goodbye), so
+sessions are created and reset in the workers.
+
+Usage:
+    python benchmarks/bench_dialogue_workers.py --max-workers 4 --seconds 5 --out dialogue_workers.json
+
+Scaling needs free cores: on an N-core machine expect gains up to about N-1
+workers, because the API process's reader threads and the clients use a core.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from common import environment, throughput_result
+
+import dialogue_workers
+from chatbot.src.dialogue_manager import get_bot_reply
+
+CONVERSATION = [
+    "hello",
+    "I have fever and cough",
+    "also headache and body pain",
+    "I feel tired and have nausea",
+    "I have had a sore throat for 3 days, it is severe",
+    "bye",
+]
+
+
+def drive(reply, clients: int, seconds: float, users_per_client: int = 8) -> dict:
+    counts = [0] * clients
+    latencies = [[] for _ in range(clients)]
+    stop = time.monotonic() + seconds
+
+    def client(c: int):
+        i = 0
+        while time.monotonic() < stop:
+            user = f"bench-{c}-{i // len(CONVERSATION) % users_per_client}"
+            start = time.perf_counter_ns()
+            reply(user, CONVERSATION[i % len(CONVERSATION)])
+            latencies[c].append(time.perf_counter_ns() - start)
+            counts[c] += 1
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return throughput_result(sum(counts), elapsed, [ns for per in latencies for ns in per])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    base = drive(lambda u, m: get_bot_reply(user_id=u, user_message=m), args.clients, args.seconds)
+    base.update({"mode": "in-process", "workers": 0})
+    results.append(base)
+    print(f"in-process   turns/s={base['value']:9.1f}  p50={base['p50_us']}us  p99={base['p99_us']}us", flush=True)
+
+    for n in range(1, args.max_workers + 1):
+        pool = dialogue_workers.DialoguePool(n)
+        try:
+            r = drive(pool.reply, args.clients, args.seconds)
+        finally:
+            pool.close()
+        r.update({"mode": "pool", "workers": n, "speedup": round(r["value"] / base["value"], 2)})
+        results.append(r)
+        print(f"workers={n:2d}   turns/s={r['value']:9.1f}  p50={r['p50_us']}us  p99={r['p99_us']}us  "
+              f"speedup={r['speedup']:.2f}x", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "dialogue_workers", "environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
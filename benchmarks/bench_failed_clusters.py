@@ -0,0 +1,158 @@
+"""
+Failed-query clustering: assignment cost, top-K read time and cluster quality as the table grows.
+
+Synthetic failed queries are paraphrases of --groups base questions. A
+paraphrase may change case and punctuation, drop or add filler words, swap
+adjacent letters, or reorder a clause. They are assigned in order:
+
+    online   one failed_clusters.record() transaction per query, as save_chat_turn does
+    batch    --batch queries per transaction, as `failed_clusters.py rebuild` does
+
+At each checkpoint the report records:
+- assignment throughput
+- top_clusters() latency
+- the number of clusters against the number of groups seen so far
+- purity: the share of queries whose cluster's majority group is their own
+
+It also compares the size of the old failed_queries_list payload (every
+text) with the top-K clusters payload.
+
+Usage:
+    python benchmarks/bench_failed_clusters.py --queries 200000 --groups 2000 --out clusters.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from common import BASE_DIR, environment, latency_result, throughput_result
+
+import failed_clusters
+
+FILLERS = ["please", "really", "actually", "so", "hey", "um", "quickly", "again"]
+
+
+def vocabulary():
+    """Words of dataset/train.csv, so base questions share the real vocabulary."""
+    texts = pd.read_csv(os.path.join(BASE_DIR, "dataset", "train.csv"))["text"].astype(str)
+    return sorted({w for t in texts for w in re.findall(r"[a-z']+", t.lower())})
+
+
+def base_questions(rng: random.Random, words, n: int):
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(5, 10))) for _ in range(n)]
+
+
+def paraphrase(rng: random.Random, text: str) -> str:
+    words = text.split()
+    if rng.random() < 0.3 and len(words) > 4:
+        words.pop(rng.randrange(len(words)))
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FILLERS))
+    if rng.random() < 0.3:
+        w = rng.randrange(len(words))
+        word = words[w]
+        if len(word) > 3:
+            i = rng.randrange(len(word) - 1)
+            words[w] = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if rng.random() < 0.2 and len(words) > 6:
+        cut = rng.randrange(2, len(words) - 2)
+        words = words[cut:] + words[:cut]
+    out = " ".join(words)
+    if rng.random() < 0.3:
+        out = out.capitalize() + rng.choice(["?", "??", "!", "."])
+    return out
+
+
+def purity(assignments):
+    by_cluster = defaultdict(Counter)
+    for group, cluster in assignments:
+        by_cluster[cluster][group] += 1
+    return sum(c.most_common(1)[0][1] for c in by_cluster.values()) / len(assignments)
+
+
+def run(mode: str, queries, batch: int, checkpoints) -> list:
+    tmp = tempfile.TemporaryDirectory()
+    conn = sqlite3.connect(os.path.join(tmp.name, "users.db"))
+    failed_clusters.ensure_schema(conn)
+    assignments = []
+    results = []
+    done, elapsed = 0, 0.0
+    for target in checkpoints:
+        chunk = queries[done:target]
+        start = time.perf_counter()
+        if mode == "online":
+            for group, text in chunk:
+                assignments.append((group, failed_clusters.record(conn, [failed_clusters.prepare(text)])[0]))
+        else:
+            for i in range(0, len(chunk), batch):
+                part = chunk[i:i + batch]
+                ids = failed_clusters.record(conn, [failed_clusters.prepare(text) for _, text in part])
+                assignments.extend((group, cid) for (group, _), cid in zip(part, ids))
+        elapsed += time.perf_counter() - start
+        done = target
+
+        read = latency_result([_timed(lambda: failed_clusters.top_clusters(conn)) for _ in range(50)])
+        r = throughput_result(done, elapsed)
+        seen = len({group for group, _ in queries[:done]})
+        r.update({
+            "mode": mode, "queries": done, "unit": "queries/s", "groups_seen": seen,
+            "clusters": failed_clusters.cluster_count(conn), "purity": round(purity(assignments), 4),
+            "top_k_read_us": read["value"],
+        })
+        results.append(r)
+        print(f"{mode:6s} n={done:8d}  assign={r['value']:8.1f}/s  clusters={r['clusters']:6d} (groups {seen})  "
+              f"purity={r['purity']:.3f}  top-k read={r['top_k_read_us']:.0f}us", flush=True)
+
+    top = failed_clusters.top_clusters(conn)
+    conn.close()
+    tmp.cleanup()
+    return results, top
+
+
+def _timed(fn) -> int:
+    start = time.perf_counter_ns()
+    fn()
+    return time.perf_counter_ns() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--online", type=int, default=20000, help="queries to run through the online path")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    bases = base_questions(rng, vocabulary(), args.groups)
+    # Zipf-like popularity: a few questions fail far more often than the rest.
+    weights = [1 / (i + 1) for i in range(args.groups)]
+    groups = rng.choices(range(args.groups), weights, k=args.queries)
+    queries = [(g, paraphrase(rng, bases[g])) for g in groups]
+
+    online, _ = run("online", queries[:args.online], args.batch,
+                    [n for n in (args.online // 4, args.online) if n])
+    checkpoints = sorted({min(args.queries, n) for n in (10000, 100000, 1000000, args.queries)})
+    batch, top = run("batch", queries, args.batch, checkpoints)
+
+    raw_list = len(json.dumps([text for _, text in queries], ensure_ascii=False).encode("utf-8"))
+    clusters_payload = len(json.dumps(top, ensure_ascii=False).encode("utf-8"))
+    print(f"payload: failed_queries_list {raw_list / 1024:.0f} KiB -> top-{len(top)} clusters "
+          f"{clusters_payload / 1024:.1f} KiB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "failed_clusters", "environment": environment(), "results": online + batch,
+                       "payload_bytes": {"failed_queries_list": raw_list, "top_clusters": clusters_payload}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Latency of well-behaved users next to one abusive client, FIFO vs. FairScheduler.
+
+A pure asyncio simulation: the work is an asyncio.sleep of --service ms
+while holding a slot, so the result measures the admission policy and not
+the dialogue engine. --users well-behaved users each send one request,
+wait for it, then think for 50-300 ms. One abusive user runs --abusive
+concurrent loops with no think time and retries at once after a rejection.
+
+    fifo   asyncio.Semaphore(slots): what the shared threadpool does
+    fair   FairScheduler(slots) with its default per-user limits
+
+Usage:
+    python benchmarks/bench_fairness.py --seconds 10 --out fairness.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+
+from common import environment, throughput_result
+
+import fair_scheduler
+
+
+class FifoSlots:
+    def __init__(self, slots: int):
+        self._sem = asyncio.Semaphore(slots)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, deadline=None):
+        async with self._sem:
+            yield None
+
+
+async def simulate(scheduler, users: int, abusive: int, service: float, seconds: float) -> dict:
+    stop = time.monotonic() + seconds
+    good_ns, bad_ns = [], []
+    rejected = {"abusive": 0, "good": 0}
+    rng = random.Random(7)
+
+    async def request(user_id: str, samples: list, kind: str):
+        start = time.perf_counter_ns()
+        try:
+            async with scheduler.slot(user_id):
+                await asyncio.sleep(service)
+        except fair_scheduler.Overloaded:
+            rejected[kind] += 1
+            await asyncio.sleep(0.005)
+            return
+        samples.append(time.perf_counter_ns() - start)
+
+    async def good(u: int):
+        while time.monotonic() < stop:
+            await request(f"user-{u}", good_ns, "good")
+            await asyncio.sleep(rng.uniform(0.05, 0.3))
+
+    async def bad():
+        while time.monotonic() < stop:
+            await request("abuser", bad_ns, "abusive")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[good(u) for u in range(users)], *[bad() for _ in range(abusive)])
+    elapsed = time.perf_counter() - start
+    return {
+        "good": throughput_result(len(good_ns), elapsed, good_ns),
+        "abusive": throughput_result(len(bad_ns), elapsed, bad_ns),
+        "rejected": rejected,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--users", type=int, default=20, help="well-behaved users")
+    parser.add_argument("--abusive", type=int, default=64, help="concurrent loops of the abusive user")
+    parser.add_argument("--service", type=float, default=20.0, help="service time per request, ms")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for mode in ("fifo", "fair"):
+        async def run():
+            scheduler = FifoSlots(args.slots) if mode == "fifo" else fair_scheduler.FairScheduler(slots=args.slots)
+            return await simulate(scheduler, args.users, args.abusive, args.service / 1000, args.seconds)
+
+        r = asyncio.run(run())
+        r["mode"] = mode
+        results.append(r)
+        g, b = r["good"], r["abusive"]
+        print(f"{mode:5s} good: {g['value']:6.1f} req/s p50={g['p50_us'] / 1000:7.1f}ms p99={g['p99_us'] / 1000:7.1f}ms"
+              f" | abusive: {b['value']:6.1f} req/s rejected={r['rejected']['abusive']}", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "fairness", "environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Feedback analytics from text copies vs. turn_id joins, and the cost of the backfill.
+
+Builds a shard with --turns chat turns whose answers come from the real reply
+templates (bench_answers.answer_pool). A --rated share of the turns gets
+feedback the old way: the question and answer text is copied into the
+feedback row, with no turn_id. Then it measures:
+
+    text-scan     rating per day, intent and illness by reading every
+                  feedback row and re-analyzing its text, the only way
+                  before turn ids
+    backfill      feedback.migrate_rows(): link each row to its turn by
+                  (user_id, question, answer) and drop the copies
+    indexed-join  feedback.shard_stats() over the linked rows
+
+The report also gives the database size before and after the backfill
+(both VACUUMed) and checks that both ways compute the same breakdowns.
+
+Usage:
+    python benchmarks/bench_feedback.py --turns 200000 --rated 0.1 --out feedback.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import environment, latency_result, throughput_result
+
+import answers
+import feedback
+from bench_answers import SEED, answer_pool
+from sharding import USER_SCHEMA
+
+QUESTIONS = {
+    "greet": ["hello", "hi there", "namaste"],
+    "more": ["I have a fever", "my head hurts and I feel tired", "cough and cold since morning"],
+    "diagnosis": ["what do i have", "so what do i have?", "please diagnose me"],
+    "bye": ["bye", "thanks, goodbye", "see you"],
+}
+
+
+def build(conn: sqlite3.Connection, rng: random.Random, pool: dict, turns: int, rated: float) -> int:
+    for ddl in USER_SCHEMA:
+        conn.execute(ddl)
+    answers.migrate_schema(conn)
+    feedback.migrate_schema(conn)
+    start = datetime(2024, 1, 1)
+    kinds = ["greet", "more", "more", "more", "diagnosis", "bye"]
+    cache = {}
+    rows = []
+    for i in range(turns):
+        kind = rng.choice(kinds)
+        user_id, question, answer = f"user-{i % 5000}", rng.choice(QUESTIONS[kind]), rng.choice(pool[kind])
+        when = (start + timedelta(seconds=i * 30 * 86400 // turns)).strftime("%Y-%m-%d %H:%M:%S")
+        answers.insert_turn(conn, user_id, question, answer, cache, when)
+        if rng.random() < rated:
+            rows.append((user_id, question, answer, rng.choice([0, 1]), "", when))
+    conn.executemany(
+        "INSERT INTO feedback(user_id, question, answer, rating, comment, timestamp) VALUES (?, ?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    return len(rows)
+
+
+def text_scan_stats(conn: sqlite3.Connection) -> dict:
+    """What the breakdowns cost without turn ids: every feedback row's text, analyzed again."""
+    totals = {"by_day": {}, "by_intent": {}, "by_illness": {}}
+    for day, question, answer, rating in conn.execute(
+        "SELECT DATE(timestamp), question, answer, rating FROM feedback WHERE rating IS NOT NULL"
+    ):
+        keys = (("by_day", day), ("by_intent", feedback.turn_intent(question)),
+                ("by_illness", answers.top_illness(answer)))
+        for name, key in keys:
+            if key is None:
+                continue
+            up, down = totals[name].get(key, (0, 0))
+            totals[name][key] = (up + (rating == 1), down + (rating == 0))
+    return totals
+
+
+def file_size(conn: sqlite3.Connection, path: str) -> int:
+    conn.execute("VACUUM")
+    return os.path.getsize(path)
+
+
+def timed(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        result = fn()
+        samples.append(time.perf_counter_ns() - start)
+    return latency_result(samples), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200000)
+    parser.add_argument("--rated", type=float, default=0.1, help="share of turns with feedback")
+    parser.add_argument("--diagnoses", type=int, default=300, help="distinct diagnosis replies")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(SEED)
+    pool = answer_pool(rng, args.diagnoses)
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, "users.db")
+    conn = sqlite3.connect(path)
+    rated = build(conn, rng, pool, args.turns, args.rated)
+    size_before = file_size(conn, path)
+    print(f"{args.turns} turns, {rated} feedback rows, {size_before / 2**20:.1f} MiB", flush=True)
+
+    results = []
+    scan, scan_stats = timed(lambda: text_scan_stats(conn), args.repeat)
+    scan["mode"] = "text-scan"
+    results.append(scan)
+
+    start = time.perf_counter()
+    linked, unmatched = feedback.migrate_rows(conn)
+    backfill = throughput_result(linked + unmatched, time.perf_counter() - start)
+    backfill.update({"mode": "backfill", "unit": "rows/s", "linked": linked, "unmatched": unmatched})
+    results.append(backfill)
+    size_after = file_size(conn, path)
+
+    join, join_stats = timed(lambda: feedback.shard_stats(conn), args.repeat)
+    join["mode"] = "indexed-join"
+    join["speedup"] = round(scan["value"] / join["value"], 1)
+    results.append(join)
+
+    for r in (scan, join):
+        print(f"{r['mode']:12s} median={r['value'] / 1000:9.1f}ms  p90={r['p90_us'] / 1000:9.1f}ms", flush=True)
+    print(f"speedup: {join['speedup']}x")
+    print(f"backfill: {linked} linked, {unmatched} unmatched, {backfill['value']:.0f} rows/s")
+    print(f"database: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+    same = all(scan_stats[name] == join_stats[name] for name in scan_stats)
+    print(f"same breakdowns: {same}")
+    conn.close()
+    tmp.cleanup()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "feedback", "environment": environment(), "results": results,
+                       "db_bytes": {"before": size_before, "after": size_after}, "same_breakdowns": same},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
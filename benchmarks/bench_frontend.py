@@ -0,0 +1,92 @@
+"""
+Streamlit rerun timing for the dashboard at different chat history sizes.
+
+Starts the backend (uvicorn, temporary users.db) on a free port, then uses
+streamlit.testing.AppTest to render app.py logged in on the Dashboard with a
+pre-filled chat_history of N messages and times full-script reruns.
+
+Usage:
+    python benchmarks/bench_frontend.py                      # 10, 500, 5000 messages
+    python benchmarks/bench_frontend.py --app old_app.py     # compare another version
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BASE_DIR, free_port, wait_ready
+
+
+def fake_history(n: int) -> list:
+    history = []
+    for i in range(n // 2):
+        history.append({"role": "user", "content": f"I have fever and cough ({i})"})
+        history.append({"role": "assistant", "content": f"Can you tell me more symptoms? ({i})"})
+    return history
+
+
+def time_reruns(app_path: str, messages: int, reruns: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app_path, default_timeout=600)
+    at.query_params["choice"] = "Dashboard"
+    at.session_state["logged_in"] = True
+    at.session_state["username"] = "bench"
+    at.session_state["chat_history"] = fake_history(messages)
+    at.run()  # first run fills the API caches
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    samples = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "messages": messages,
+        "rerun_ms_median": round(statistics.median(samples), 1),
+        "rerun_ms_max": round(max(samples), 1),
+        "buttons": len(at.button),
+        "text_inputs": len(at.text_input),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time Streamlit dashboard reruns vs chat history size.")
+    parser.add_argument("--app", default=os.path.join(BASE_DIR, "app.py"))
+    parser.add_argument("--sizes", default="10,500,5000")
+    parser.add_argument("--reruns", type=int, default=3)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(os.environ, WELLBOT_DB=os.path.join(tmp, "users.db"))
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BASE_DIR, env=env,
+        )
+        os.environ["WELLBOT_API_URL"] = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(port)
+            results = []
+            for n in (int(s) for s in args.sizes.split(",")):
+                r = time_reruns(os.path.abspath(args.app), n, args.reruns)
+                results.append(r)
+                print(f"messages={n:5d}  rerun median={r['rerun_ms_median']:8.1f} ms  "
+                      f"buttons={r['buttons']}  text_inputs={r['text_inputs']}", flush=True)
+        finally:
+            backend.terminate()
+            backend.wait(timeout=30)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "frontend_rerun", "app": args.app, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
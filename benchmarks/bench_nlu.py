@@ -0,0 +1,104 @@
+"""
+Texts analyzed per second: looping over /chat vs. POST /nlu/batch.
+
+The texts are dataset/test.csv plus symptom sentences. Three ways of
+getting an analysis for each of them, all through the ASGI app in-process:
+
+    chat-loop    one POST /chat per text (what integrations had to do)
+    nlu-batch    POST /nlu/batch with --batch texts per request
+    nlu-stream   the same with "stream": true (NDJSON)
+
+Intent predictions come from the promoted online_intent checkpoint when
+there is one; train it first with `python online_intent.py train`.
+
+Usage:
+    python benchmarks/bench_nlu.py --texts 5000 --batch 1000 --out nlu.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from common import BASE_DIR, environment, throughput_result
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["WELLBOT_DB"] = os.path.join(_tmp.name, "users.db")  # before backend is imported
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import backend  # noqa: E402
+
+SYMPTOM_TEXTS = [
+    "I have fever and cough for 3 days",
+    "severe headache and body pain",
+    "मुझे बुखार और खांसी है",
+    "runny nose, sneezing and itchy eyes",
+    "mild nausea since yesterday",
+]
+
+
+def load_texts(n: int):
+    texts = pd.read_csv(os.path.join(BASE_DIR, "dataset", "test.csv"))["text"].astype(str).tolist() + SYMPTOM_TEXTS
+    return [texts[i % len(texts)] for i in range(n)]
+
+
+def timed(fn, count: int, per_request: int) -> dict:
+    start = time.perf_counter()
+    requests = fn()
+    elapsed = time.perf_counter() - start
+    r = throughput_result(count, elapsed)
+    r.update({"unit": "texts/s", "requests": requests, "texts_per_request": per_request})
+    return r
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--chat-texts", type=int, default=1000, help="texts sent through the /chat loop")
+    parser.add_argument("--batch", type=int, default=1000, help="texts per /nlu/batch request")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    texts = load_texts(args.texts)
+    results = []
+    with TestClient(backend.app) as client:
+        client.post("/nlu/batch", json={"texts": texts[:10]})  # load the model
+
+        def chat_loop():
+            for i, text in enumerate(texts[:args.chat_texts]):
+                client.post("/chat", json={"user_id": f"nlu-{i % 50}", "message": text})
+            return args.chat_texts
+
+        def batches(stream: bool):
+            def run():
+                n = 0
+                for start in range(0, len(texts), args.batch):
+                    r = client.post("/nlu/batch", json={"texts": texts[start:start + args.batch], "stream": stream})
+                    assert r.status_code == 200, r.text
+                    n += 1
+                return n
+            return run
+
+        for mode, fn, count, per in (("chat-loop", chat_loop, args.chat_texts, 1),
+                                     ("nlu-batch", batches(False), len(texts), args.batch),
+                                     ("nlu-stream", batches(True), len(texts), args.batch)):
+            r = timed(fn, count, per)
+            r["mode"] = mode
+            results.append(r)
+            print(f"{mode:10s} texts/s={r['value']:9.1f}  ({r['ops']} texts, {r['requests']} requests)", flush=True)
+
+    base = results[0]["value"]
+    for r in results[1:]:
+        r["speedup"] = round(r["value"] / base, 1)
+        print(f"{r['mode']} speedup over chat-loop: {r['speedup']}x")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "nlu_batch", "environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
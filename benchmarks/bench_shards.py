@@ -0,0 +1,101 @@
+"""
+Write throughput of the sharded user tables from 1 to N shards.
+
+Each run opens a ShardSet on a throwaway users.db, then writer threads insert
+chat_history rows for random users and commit every row (what /chat does),
+going through the same per-shard locks as the backend. With one shard every
+writer queues on a single SQLite write lock; with N shards writers for
+different users commit to different files.
+
+Usage:
+    python benchmarks/bench_shards.py --max-shards 8 --writers 8 --seconds 5
+    python benchmarks/bench_shards.py --shards 1,4 --journal wal --out shards.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from common import throughput_result
+
+from sharding import ShardSet
+
+
+def writer(shards: ShardSet, users: list, deadline: float, seed: int, latencies: list):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        user = rng.choice(users)
+        shard = shards.for_user(user)
+        start = time.perf_counter_ns()
+        with shard.lock:
+            shard.conn.execute(
+                "INSERT INTO chat_history(user_id, question, answer) VALUES (?, ?, ?)",
+                (user, "I have fever and cough", "Can you tell me more symptoms?"),
+            )
+            shard.conn.commit()
+        latencies.append(time.perf_counter_ns() - start)
+
+
+def measure(count: int, writers: int, seconds: float, users: int, journal: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        primary = sqlite3.connect(path, check_same_thread=False)
+        shards = ShardSet.open(path, count, primary, threading.RLock())
+        if journal == "wal":
+            shards.execute_all("PRAGMA journal_mode=WAL")
+        user_ids = [f"user-{i}" for i in range(users)]
+
+        latencies = []
+        deadline = time.monotonic() + seconds
+        threads = [
+            threading.Thread(target=writer, args=(shards, user_ids, deadline, i, latencies))
+            for i in range(writers)
+        ]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        rows = sum(s.conn.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0] for s in shards.shards)
+        shards.close()
+        primary.close()
+
+    result = throughput_result(rows, elapsed, latencies)
+    result["shards"] = count
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat-history insert throughput vs shard count.")
+    parser.add_argument("--max-shards", type=int, default=8)
+    parser.add_argument("--shards", help="comma-separated shard counts (overrides --max-shards)")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--journal", choices=["wal", "delete"], default="wal",
+                        help="serve.py workers run in WAL mode")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    counts = [int(s) for s in args.shards.split(",")] if args.shards else range(1, args.max_shards + 1)
+    results = []
+    for n in counts:
+        r = measure(n, args.writers, args.seconds, args.users, args.journal)
+        results.append(r)
+        print(f"shards={n:2d}  rows/s={r['value']:9.1f}  p50={r['p50_us']:8.1f} us  p99={r['p99_us']:9.1f} us",
+              flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "shard_writes", "writers": args.writers, "journal": args.journal,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
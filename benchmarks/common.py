@@ -0,0 +1,85 @@
+"""Shared helpers for the benchmark scripts: paths, timing and result records."""
+import http.client
+import os
+import platform
+import socket
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def percentile(sorted_values, q: float):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+def latency_result(samples_ns, better: str = "lower") -> dict:
+    """Summarise per-call latencies (ns); `value` (median us) is what compare checks."""
+    s = sorted(samples_ns)
+    median_us = statistics.median(s) / 1000
+    return {
+        "value": round(median_us, 3),
+        "unit": "us",
+        "better": better,
+        "p90_us": round(percentile(s, 0.90) / 1000, 3),
+        "p99_us": round(percentile(s, 0.99) / 1000, 3),
+        "min_us": round(s[0] / 1000, 3),
+        "samples": len(s),
+    }
+
+
+def throughput_result(ops: int, seconds: float, latencies_ns=None) -> dict:
+    out = {"value": round(ops / seconds, 1), "unit": "ops/s", "better": "higher", "ops": ops}
+    if latencies_ns:
+        s = sorted(latencies_ns)
+        out["p50_us"] = round(percentile(s, 0.50) / 1000, 1)
+        out["p99_us"] = round(percentile(s, 0.99) / 1000, 1)
+    return out
+
+
+def time_calls(fn, args_list, repeat: int = 5):
+    """Call fn(*args) for every args tuple, `repeat` times; return per-call ns samples."""
+    samples = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter_ns()
+            fn(*args)
+            samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+# --- Local servers ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/kb")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not come up")
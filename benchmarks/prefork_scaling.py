@@ -0,0 +1,157 @@
+"""
+Measure the pre-fork server (serve.py) from 1 to N workers.
+
+For each worker count this starts serve.py against a throwaway users.db,
+records per-worker memory from /proc/<pid>/smaps_rollup (RSS, PSS and the
+private "incremental" pages a worker owns on top of the shared master image)
+and drives /chat with keep-alive client processes for a fixed window to get
+aggregate requests/second. Workers run with --stateless: only throughput is
+measured, so it doesn't matter that a client's turns land in different workers.
+
+Usage:
+    python benchmarks/prefork_scaling.py --max-workers 4 --seconds 10 --out prefork.json
+
+Linux only (needs /proc). Client processes run on the same host, so leave
+some cores free for them when reading the scaling numbers.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BASE_DIR, free_port, wait_ready
+
+MESSAGES = [
+    "hello",
+    "I have fever and cough",
+    "also headache and body pain",
+    "I feel tired and have nausea",
+    "bye",
+]
+
+
+# --- Memory ---
+def smaps_rollup(pid: int) -> dict:
+    """Return the kB counters from /proc/<pid>/smaps_rollup."""
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1])
+    return out
+
+
+def child_pids(pid: int) -> list:
+    pids = []
+    task_dir = f"/proc/{pid}/task"
+    for tid in os.listdir(task_dir):
+        try:
+            with open(f"{task_dir}/{tid}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            continue
+    return pids
+
+
+def memory_report(master_pid: int) -> dict:
+    master = smaps_rollup(master_pid)
+    workers = []
+    for pid in child_pids(master_pid):
+        m = smaps_rollup(pid)
+        workers.append({
+            "pid": pid,
+            "rss_kb": m.get("Rss", 0),
+            "pss_kb": m.get("Pss", 0),
+            "private_kb": m.get("Private_Clean", 0) + m.get("Private_Dirty", 0),
+            "shared_kb": m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0),
+        })
+    return {"master_rss_kb": master.get("Rss", 0), "workers": workers}
+
+
+# --- Load generation ---
+def client_loop(port: int, seconds: float, client_id: int) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    done = 0
+    i = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        body = json.dumps({"user_id": f"bench-{client_id}", "message": MESSAGES[i % len(MESSAGES)]})
+        conn.request("POST", "/chat", body=body, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status == 200:
+            done += 1
+        i += 1
+    conn.close()
+    return done
+
+
+def drive(port: int, clients: int, seconds: float) -> float:
+    with multiprocessing.Pool(clients) as pool:
+        counts = pool.starmap(client_loop, [(port, seconds, c) for c in range(clients)])
+    return sum(counts) / seconds
+
+
+def measure(workers: int, seconds: float, clients_per_worker: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(os.environ, WELLBOT_DB=os.path.join(tmp, "users.db"))
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, "serve.py"), "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers), "--max-requests", "0", "--stateless"],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(port)
+            idle = memory_report(proc.pid)
+            rps = drive(port, workers * clients_per_worker, seconds)
+            loaded = memory_report(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    private = [w["private_kb"] for w in loaded["workers"]]
+    return {
+        "workers": workers,
+        "requests_per_sec": round(rps, 1),
+        "master_rss_kb": idle["master_rss_kb"],
+        "worker_private_kb_idle": [w["private_kb"] for w in idle["workers"]],
+        "worker_private_kb_loaded": private,
+        "worker_rss_kb_loaded": [w["rss_kb"] for w in loaded["workers"]],
+        "mean_incremental_kb": round(sum(private) / len(private)) if private else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients-per-worker", type=int, default=2)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    base_rps = None
+    for n in range(1, args.max_workers + 1):
+        r = measure(n, args.seconds, args.clients_per_worker)
+        base_rps = base_rps or r["requests_per_sec"] or 1.0
+        r["speedup"] = round(r["requests_per_sec"] / base_rps, 2)
+        results.append(r)
+        print(f"workers={n:2d}  req/s={r['requests_per_sec']:8.1f}  speedup={r['speedup']:5.2f}x  "
+              f"incremental/worker={r['mean_incremental_kb']} kB  master RSS={r['master_rss_kb']} kB",
+              flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "prefork_scaling", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Run the WellBot benchmark suite or compare two result files.
+
+    python benchmarks/run.py run --out results.json
+    python benchmarks/run.py run --update-baseline
+    python benchmarks/run.py compare benchmarks/baseline.json results.json --threshold 10
+
+Everything runs offline: the API benchmark drives backend:app in-process over
+ASGI against a temporary users.db. `compare` exits with status 1 when any
+benchmark regressed by more than the threshold (percent).
+"""
+import argparse
+import json
+import sys
+import time
+
+from common import BASELINE_PATH, environment
+
+SUITES = ("dialogue", "api")
+
+
+def run_suites(names, quick: bool) -> dict:
+    results = {}
+    tmp = None
+    if "api" in names:
+        import bench_api
+        tmp = bench_api.temp_db_env()  # must happen before backend is imported
+    try:
+        if "dialogue" in names:
+            import bench_dialogue
+            results.update(bench_dialogue.run(quick))
+        if "api" in names:
+            results.update(bench_api.run(quick))
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+    return results
+
+
+def compare(base: dict, new: dict, threshold: float) -> int:
+    regressions = 0
+    print(f"{'benchmark':40s} {'base':>12s} {'new':>12s} {'change':>9s}")
+    for name, b in sorted(base["results"].items()):
+        n = new["results"].get(name)
+        if n is None:
+            print(f"{name:40s} {b['value']:12.3f} {'missing':>12s}")
+            continue
+        change = (n["value"] - b["value"]) / b["value"] * 100 if b["value"] else 0.0
+        worse = change if b.get("better", "lower") == "lower" else -change
+        flag = "  REGRESSION" if worse > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:40s} {b['value']:12.3f} {n['value']:12.3f} {change:+8.1f}%{flag}  ({b['unit']})")
+    for name in sorted(set(new["results"]) - set(base["results"])):
+        # Not checked until the baseline is regenerated with --update-baseline.
+        print(f"{name:40s} {'no baseline':>12s} {new['results'][name]['value']:12.3f}")
+    print(f"\n{regressions} regression(s) above {threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WellBot benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="run benchmarks and write JSON results")
+    p_run.add_argument("--only", default=",".join(SUITES), help="comma-separated suites: " + ", ".join(SUITES))
+    p_run.add_argument("--quick", action="store_true", help="fewer iterations (smoke test)")
+    p_run.add_argument("--out", help="results file (default: stdout)")
+    p_run.add_argument("--update-baseline", action="store_true", help=f"also write {BASELINE_PATH}")
+
+    p_cmp = sub.add_parser("compare", help="compare two result files")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        sys.exit(compare(base, new, args.threshold))
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = set(names) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "results": run_suites(names, args.quick),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,42 @@
 import random
-import re
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator, Optional, Union
 from .knowledge_base import load_kb, format_health_info
+from .instrumentation import stage
+from .message_analyzer import MessageAnalysis, MessageAnalyzer
 
 # -------------------- Load Knowledge Base -------------------- #
 KB = load_kb()
 
 # -------------------- Symptom to Illness Mapping -------------------- #
-SYMPTOM_TO_ILLNESSES = {}
-for illness, info in KB.items():
-    for sym in info.get("symptoms", []):
-        SYMPTOM_TO_ILLNESSES.setdefault(sym.lower(), set()).add(illness)
+def build_symptom_index(kb: Dict) -> Dict[str, set]:
+    index = {}
+    for illness, info in kb.items():
+        for sym in info.get("symptoms", []):
+            index.setdefault(sym.lower(), set()).add(illness)
+    return index
+
+SYMPTOM_TO_ILLNESSES = build_symptom_index(KB)
+
+# -------------------- Message Analyzer -------------------- #
+# Compiled once per symptom index; replay.py switches between KB versions per conversation.
+_analyzers: Dict[int, Tuple[Dict[str, set], MessageAnalyzer]] = {}
+
+def analyzer_for(index: Dict[str, set]) -> MessageAnalyzer:
+    cached = _analyzers.get(id(index))
+    if cached is None or cached[0] is not index:
+        if len(_analyzers) >= 8:
+            _analyzers.clear()
+        cached = _analyzers[id(index)] = (index, MessageAnalyzer(index.keys()))
+    return cached[1]
+
+ANALYZER = analyzer_for(SYMPTOM_TO_ILLNESSES)
+
+def use_kb(kb: Dict, index: Dict[str, set] = None):
+    """Swap the active knowledge base (and its symptom index) for this process."""
+    global KB, SYMPTOM_TO_ILLNESSES, ANALYZER
+    KB = kb
+    SYMPTOM_TO_ILLNESSES = index if index is not None else build_symptom_index(kb)
+    ANALYZER = analyzer_for(SYMPTOM_TO_ILLNESSES)
 
 # -------------------- Session Data -------------------- #
 user_sessions: Dict[str, Dict] = {}
@@ -40,28 +66,16 @@ DISCLAIMER = (
     "but please consult a healthcare provider for accurate diagnosis."
 )
 
-# -------------------- Regex for Entity Extraction -------------------- #
-duration_pattern = re.compile(r"\bfor\s+(\d+)\s+days?\b")
-severity_pattern = re.compile(r"\b(mild|moderate|severe)\b")
-
 # -------------------- Helper Functions -------------------- #
+def analyze_message(text: str) -> MessageAnalysis:
+    """Language, keyword intent, symptoms and entities from one pass over the message."""
+    return ANALYZER.analyze(text)
+
 def extract_entities(text: str) -> Dict[str, str]:
-    entities = {}
-    d = duration_pattern.search(text)
-    s = severity_pattern.search(text)
-    if d:
-        entities["duration"] = f"{d.group(1)} days"
-    if s:
-        entities["severity"] = s.group(1)
-    return entities
+    return ANALYZER.analyze(text).entities
 
 def extract_symptoms(text: str) -> List[str]:
-    found = []
-    lower_text = text.lower()
-    for symptom in SYMPTOM_TO_ILLNESSES.keys():
-        if symptom in lower_text and symptom not in found:
-            found.append(symptom)
-    return found
+    return ANALYZER.analyze(text).symptoms
 
 def add_symptoms(user_id: str, symptoms: List[str], entities: Dict[str, str]):
     session = user_sessions.setdefault(user_id, {"symptoms": set(), "entities": {}})
@@ -90,55 +104,83 @@ def suggest_more_symptoms(current: List[str]) -> List[str]:
 
 # -------------------- Intent Detection -------------------- #
 def detect_rule_based_intent(msg: str) -> str:
-    m = msg.lower()
-    if any(w in m for w in ["hi", "hello", "hey", "namaste", "नमस्ते"]):
-        return "greet"
-    if any(w in m for w in ["bye", "goodbye", "see you", "tata", "फिर मिलेंगे"]):
-        return "goodbye"
-    if any(w in m for w in ["stress", "anxious", "sad", "depressed", "tension", "तनाव", "उदास"]):
-        return "stress"
-    if any(w in m for w in ["sleep", "tired", "insomnia", "नींद", "थकान"]):
-        return "sleep"
-    if any(w in m for w in ["exercise", "workout", "gym", "योग", "फिटनेस"]):
-        return "exercise"
-    if any(p in m for p in ["what do i have", "diagnose", "so what do i have", "कौन सी बीमारी"]):
-        return "diagnosis_query"
-    return None
+    return ANALYZER.analyze(msg).intent
 
 # -------------------- Language Detection -------------------- #
 def detect_language(msg: str) -> str:
-    if re.search(r"[ऀ-ॿ]", msg):
-        return "hi"
-    return "en"
+    return ANALYZER.analyze(msg).language
 
 # -------------------- Diagnosis Response -------------------- #
-def build_diagnosis_and_reset(user_id: str, matches: List[Tuple[str, int]], language: str) -> str:
+def iter_diagnosis_and_reset(user_id: str, matches: List[Tuple[str, int]], language: str) -> Iterator[str]:
+    """
+    Reset the session now and return the diagnosis as lazily formatted chunks:
+    the disclaimer first, then one block per illness. "".join() of the chunks
+    is the full reply.
+    """
     top_matches = [m[0] for m in matches[:3]]
     user_sessions.pop(user_id, None)
 
-    if language == "hi":
+    def format_block(ill: str, lang: str) -> str:
+        with stage("format_health_info"):
+            return format_health_info(KB.get(ill, {}), illness=ill, language=lang)
+
+    def hindi_chunks():
         illnesses = ", ".join(top_matches)
-        response = f"⚠️ कृपया डॉक्टर से परामर्श लें। संभावित बीमारियां: {illnesses}\n\n"
+        yield f"⚠️ कृपया डॉक्टर से परामर्श लें। संभावित बीमारियां: {illnesses}\n\n"
         for ill in top_matches:
-            info = KB.get(ill, {})
-            response += format_health_info(info, illness=ill, language="hi") + "\n\n"
-        return response.strip()
-
-    response_parts = [DISCLAIMER, ""]
-    for ill in top_matches:
-        info = KB.get(ill, {})
-        response_parts.append(format_health_info(info, illness=ill, language="en"))
-        response_parts.append("")
-    response_parts.append(f"**Possible conditions:** {', '.join(top_matches)}")
-    return "\n".join(response_parts)
+            yield format_block(ill, "hi") + "\n\n"
+
+    def without_trailing_space(chunks):
+        # Same result as .strip() on the joined reply, without buffering it.
+        pending = ""
+        for chunk in chunks:
+            body = chunk.rstrip()
+            if body:
+                yield pending + body
+                pending = chunk[len(body):]
+            else:
+                pending += chunk
+
+    def english_chunks():
+        yield DISCLAIMER + "\n\n"
+        for ill in top_matches:
+            yield format_block(ill, "en") + "\n\n"
+        yield f"**Possible conditions:** {', '.join(top_matches)}"
+
+    return without_trailing_space(hindi_chunks()) if language == "hi" else english_chunks()
+
+def build_diagnosis_and_reset(user_id: str, matches: List[Tuple[str, int]], language: str) -> str:
+    return "".join(iter_diagnosis_and_reset(user_id, matches, language))
 
 # -------------------- Core Chatbot Logic -------------------- #
-def get_bot_reply(user_id: str, user_message: str) -> str:
+def get_bot_reply(user_id: str, user_message: str, context=None, outcome: Optional[dict] = None) -> str:
+    return "".join(iter_bot_reply(user_id, user_message, context, outcome))
+
+def iter_bot_reply(user_id: str, user_message: str, context=None, outcome: Optional[dict] = None) -> Iterator[str]:
+    """
+    Yield the reply in chunks; only diagnoses have more than one chunk.
+    `context` (user_context.UserContext) supplies the profile's preferred language.
+    `outcome`, if given, gets "failed": True when nothing in the message matched
+    and the reply is the ask-for-more-information fallback.
+    """
+    reply = _compose_reply(user_id, user_message, context, outcome)
+    if isinstance(reply, str):
+        yield reply
+    else:
+        yield from reply
+
+def _compose_reply(user_id: str, user_message: str, context=None,
+                   outcome: Optional[dict] = None) -> Union[str, Iterator[str]]:
     msg = user_message.strip()
-    language = detect_language(msg)
+    with stage("analyze_message"):
+        analysis = ANALYZER.analyze(msg)
+    language = analysis.language
+    # Devanagari is always answered in Hindi; anything else follows the profile language.
+    if language == "en" and context is not None and context.language:
+        language = context.language
 
     # Greeting / Goodbye always handled first
-    intent = detect_rule_based_intent(msg)
+    intent = analysis.intent
     if intent == "greet":
         if user_id not in user_sessions:
             user_sessions[user_id] = {"symptoms": set(), "entities": {}}
@@ -148,8 +190,8 @@ def get_bot_reply(user_id: str, user_message: str) -> str:
         return random.choice(GOODBYES) if language == "en" else "अलविदा! स्वस्थ रहें!"
 
     # -------------------- Symptom Handling -------------------- #
-    new_syms = extract_symptoms(msg)
-    ents = extract_entities(msg)
+    new_syms = analysis.symptoms
+    ents = analysis.entities
     if new_syms or ents:
         add_symptoms(user_id, new_syms, ents)
 
@@ -158,9 +200,10 @@ def get_bot_reply(user_id: str, user_message: str) -> str:
 
     # If enough symptoms, give diagnosis
     if len(all_syms) >= 2:
-        matches = detect_possible_illnesses(all_syms)
+        with stage("detect_possible_illnesses"):
+            matches = detect_possible_illnesses(all_syms)
         if matches and matches[0][1] >= 2:
-            return build_diagnosis_and_reset(user_id, matches, language)
+            return iter_diagnosis_and_reset(user_id, matches, language)
 
     # If only 1 symptom, ask for more
     if len(all_syms) < 2:
@@ -184,16 +227,19 @@ def get_bot_reply(user_id: str, user_message: str) -> str:
                 if language == "en"
                 else "मुझे अभी आपके लक्षणों की पूरी जानकारी नहीं है। कृपया अपने लक्षण बताएं।"
             )
-        matches = detect_possible_illnesses(all_syms)
+        with stage("detect_possible_illnesses"):
+            matches = detect_possible_illnesses(all_syms)
         if not matches:
             return (
                 "I need a few more symptoms to make a suggestion."
                 if language == "en"
                 else "मुझे सुझाव देने के लिए कुछ और लक्षणों की आवश्यकता है।"
             )
-        return build_diagnosis_and_reset(user_id, matches, language)
+        return iter_diagnosis_and_reset(user_id, matches, language)
 
     # Default fallback
+    if outcome is not None:
+        outcome["failed"] = True
     return (
         "I need a bit more information. " + random.choice(MORE_SYMPTOMS)
         if language == "en"
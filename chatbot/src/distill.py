@@ -0,0 +1,325 @@
+"""
+Distill the DistilBERT intent classifier (intent_train.py) into StudentModel.
+
+1. --holdout of the distinct sentences of each intent in dataset/train.csv
+   are set aside, with every copy of them (compared case- and
+   whitespace-insensitively). dataset/test.csv is not used: each of its
+   rows is also in train.csv.
+   Every remaining sentence gets --augment rule-based paraphrases:
+   word dropout, neighbour swaps, typos, fillers and a small synonym table.
+   Paraphrases that equal a held-out sentence are dropped.
+2. The teacher labels originals and paraphrases with temperature-softened
+   probabilities.
+3. The student is trained with minibatch SGD in numpy on
+       alpha * T^2 * KL(teacher_T || student_T) + (1 - alpha) * CE(hard label)
+   where the hard label is the dataset label for originals and the teacher's
+   argmax for paraphrases.
+4. Teacher and student are compared on the held-out sentences and on
+   paraphrases of them: accuracy, agreement, the parity gap (teacher minus
+   student accuracy), single-message latency on one thread, and parameter
+   memory. The numbers go to stdout and to report.json next to the student.
+   The teacher was fine-tuned on all of train.csv, so the held-out
+   sentences are unseen by the student only; the gap is an upper bound.
+
+--no-teacher trains the student on hard labels only (no torch needed).
+
+Usage:
+    python chatbot/src/distill.py
+    python chatbot/src/distill.py --augment 8 --epochs 30 --dim 48
+    python chatbot/src/distill.py --no-teacher
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from student_model import StudentModel, feature_ids, softmax  # noqa: E402
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TRAIN_PATH = os.path.join(BASE_DIR, "dataset", "train.csv")
+TEACHER_DIR = os.path.join(BASE_DIR, "chatbot", "models", "intent_model")
+STUDENT_DIR = os.path.join(BASE_DIR, "chatbot", "models", "intent_student")
+
+SEED = 42
+
+
+# -------------------- Augmentation -------------------- #
+SYNONYMS = {
+    "can't": "cannot", "cannot": "can't", "i'm": "i am", "im": "i am", "don't": "do not",
+    "hello": "hey", "hi": "hello", "hey": "hi", "bye": "goodbye", "goodbye": "see you",
+    "thanks": "thank you", "thank": "thanks",
+    "sad": "down", "unhappy": "sad", "down": "low", "tired": "exhausted", "exhausted": "worn out",
+    "stressed": "anxious", "anxious": "stressed", "worried": "anxious", "stress": "pressure",
+    "sleep": "rest", "insomnia": "sleeplessness", "night": "nighttime",
+    "exercise": "workout", "workout": "exercise", "walk": "stroll",
+    "tip": "advice", "advice": "tips", "suggest": "recommend",
+    "pain": "ache", "headache": "head pain", "fever": "temperature",
+    "good": "fine", "great": "good", "okay": "ok", "very": "really", "really": "so",
+}
+FILLERS_BEFORE = ["hey", "um", "so", "well", "honestly", "please"]
+FILLERS_AFTER = ["please", "today", "lately", "right now", "?", "!"]
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    if rng.random() < 0.5:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + word[i + 1:]
+
+
+def paraphrase(text: str, rng: random.Random) -> str:
+    words = text.split()
+    for _ in range(rng.randint(1, 2)):
+        op = rng.random()
+        if op < 0.3:
+            words = [SYNONYMS.get(w.lower(), w) if rng.random() < 0.5 else w for w in words]
+        elif op < 0.45 and len(words) > 2:
+            del words[rng.randrange(len(words))]
+        elif op < 0.6 and len(words) > 2:
+            i = rng.randrange(len(words) - 1)
+            words[i], words[i + 1] = words[i + 1], words[i]
+        elif op < 0.75 and words:
+            i = rng.randrange(len(words))
+            words[i] = _typo(words[i], rng)
+        elif op < 0.9:
+            words.insert(0, rng.choice(FILLERS_BEFORE))
+        else:
+            words.append(rng.choice(FILLERS_AFTER))
+    out = " ".join(words)
+    return out.lower() if rng.random() < 0.3 else out
+
+
+def normalize(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def heldout_split(df: pd.DataFrame, fraction: float, rng: random.Random):
+    """(train, heldout) rows; heldout has one row per held-out sentence and shares none with train."""
+    df = df.assign(key=df["text"].map(normalize))
+    held = set()
+    for _, group in df.groupby("intent"):
+        keys = sorted(group["key"].unique())
+        rng.shuffle(keys)
+        n = int(round(len(keys) * fraction))
+        held.update(keys[:max(1, n) if fraction > 0 and len(keys) > 1 else n])
+    mask = df["key"].isin(held)
+    return df[~mask].drop(columns="key"), df[mask].drop_duplicates("key").drop(columns="key")
+
+
+# -------------------- Teacher -------------------- #
+class Teacher:
+    def __init__(self, path: str, threads: int = 1):
+        import torch
+        from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+        self.torch = torch
+        torch.set_num_threads(threads)
+        self.tokenizer = DistilBertTokenizerFast.from_pretrained(path)
+        self.model = DistilBertForSequenceClassification.from_pretrained(path)
+        self.model.eval()
+        with open(os.path.join(path, "label_map.json")) as f:
+            self.label2id = {k: int(v) for k, v in json.load(f).items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.numel() * p.element_size() for p in self.model.parameters())
+
+    def logits(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        out = []
+        with self.torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                inputs = self.tokenizer(texts[start:start + batch_size], return_tensors="pt",
+                                        truncation=True, padding=True, max_length=64)
+                out.append(self.model(**inputs).logits.numpy())
+        return np.concatenate(out).astype(np.float32)
+
+    def predict(self, text: str) -> int:
+        return int(self.logits([text])[0].argmax())
+
+
+# -------------------- Student training -------------------- #
+def train_student(texts: List[str], hard: np.ndarray, soft: Optional[np.ndarray], label2id: dict,
+                  buckets: int, dim: int, epochs: int, lr: float, batch_size: int,
+                  temperature: float, alpha: float, rng: np.random.Generator) -> StudentModel:
+    n_labels = len(label2id)
+    embeddings = rng.uniform(-1.0 / dim, 1.0 / dim, size=(buckets, dim)).astype(np.float32)
+    weights = np.zeros((dim, n_labels), dtype=np.float32)
+    bias = np.zeros(n_labels, dtype=np.float32)
+    features = [feature_ids(t, buckets) for t in texts]
+    onehot = np.eye(n_labels, dtype=np.float32)[hard]
+    if soft is None:
+        alpha = 0.0
+
+    steps = epochs * ((len(texts) + batch_size - 1) // batch_size)
+    step = 0
+    for _ in range(epochs):
+        order = rng.permutation(len(texts))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            rate = lr * (1.0 - step / steps)  # linear decay, as in fastText
+            step += 1
+
+            lens = np.array([len(features[i]) for i in batch])
+            flat = np.concatenate([features[i] for i in batch])
+            offsets = np.concatenate(([0], np.cumsum(lens)[:-1]))
+            hidden = np.add.reduceat(embeddings[flat], offsets, axis=0) / lens[:, None]
+            z = hidden @ weights + bias
+
+            grad = (1.0 - alpha) * (softmax(z) - onehot[batch])
+            if alpha:
+                grad += alpha * temperature * (softmax(z / temperature) - soft[batch])
+            grad /= len(batch)
+
+            # Embedding rows are sparse and each is touched by few examples, so they take the
+            # per-example step (undo the batch mean) like fastText's per-example SGD.
+            d_hidden = grad @ weights.T
+            weights -= rate * hidden.T @ grad
+            bias -= rate * grad.sum(axis=0)
+            np.add.at(embeddings, flat, np.repeat(-rate * len(batch) * d_hidden / lens[:, None], lens, axis=0))
+
+    return StudentModel(embeddings, weights, bias, label2id)
+
+
+# -------------------- Evaluation -------------------- #
+def latency_us(predict, texts: List[str], calls: int = 2000) -> dict:
+    for t in texts[:50]:
+        predict(t)  # warm-up
+    samples = []
+    for i in range(calls):
+        text = texts[i % len(texts)]
+        start = time.perf_counter_ns()
+        predict(text)
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    samples.sort()
+    return {
+        "p50": round(samples[len(samples) // 2], 1),
+        "p99": round(samples[int(len(samples) * 0.99)], 1),
+        "mean": round(sum(samples) / len(samples), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distill the DistilBERT intent model into a tiny student.")
+    parser.add_argument("--teacher", default=TEACHER_DIR)
+    parser.add_argument("--no-teacher", action="store_true", help="train on hard labels only")
+    parser.add_argument("--out", default=STUDENT_DIR)
+    parser.add_argument("--augment", type=int, default=4, help="paraphrases per training sentence")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of distinct sentences per intent to evaluate on")
+    parser.add_argument("--buckets", type=int, default=2 ** 16)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="weight of the distillation loss")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads for the teacher")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    random.seed(SEED)
+    rng = random.Random(SEED)
+    train_df, heldout_df = heldout_split(pd.read_csv(TRAIN_PATH).dropna(), args.holdout, rng)
+
+    teacher = None if args.no_teacher else Teacher(args.teacher, args.threads)
+    if teacher:
+        label2id = teacher.label2id
+    else:
+        label2id = {label: i for i, label in enumerate(sorted(train_df["intent"].unique()))}
+
+    held_keys = set(heldout_df["text"].map(normalize))
+    texts = train_df["text"].astype(str).tolist()
+    hard = [label2id[label] for label in train_df["intent"]]
+    originals = len(texts)
+    for text, label in zip(texts[:originals], hard[:originals]):
+        for _ in range(args.augment):
+            variant = paraphrase(text, rng)
+            if normalize(variant) not in held_keys:
+                texts.append(variant)
+                hard.append(label)
+    hard = np.array(hard)
+    print(f"{originals} sentences + {len(texts) - originals} paraphrases, "
+          f"{len(heldout_df)} distinct sentences held out", flush=True)
+
+    soft = None
+    if teacher:
+        logits = teacher.logits(texts)
+        soft = softmax(logits / args.temperature)
+        hard[originals:] = logits[originals:].argmax(axis=1)
+        print(f"teacher labelled {len(texts)} examples", flush=True)
+
+    student = train_student(texts, hard, soft, label2id, args.buckets, args.dim, args.epochs, args.lr,
+                            args.batch_size, args.temperature, args.alpha, np.random.default_rng(SEED))
+    student.save(args.out)
+
+    # Held-out sentences, and paraphrases of them; neither was trained on.
+    eval_sets = {"heldout": (heldout_df["text"].astype(str).tolist(), heldout_df["intent"].tolist())}
+    variants = [(paraphrase(t, rng), y) for t, y in zip(*eval_sets["heldout"]) for _ in range(args.augment)]
+    train_keys = set(map(normalize, texts))
+    variants = [(t, y) for t, y in variants if normalize(t) not in train_keys]
+    eval_sets["heldout_paraphrases"] = ([t for t, _ in variants], [y for _, y in variants])
+
+    disk = sum(os.path.getsize(os.path.join(args.out, f)) for f in os.listdir(args.out))
+    latency_texts = eval_sets["heldout"][0] + eval_sets["heldout_paraphrases"][0]
+    report = {
+        "train_sentences": originals,
+        "paraphrases": len(texts) - originals,
+        "heldout_sentences": len(heldout_df),
+        "heldout_paraphrases": len(variants),
+        "epochs": args.epochs,
+        "temperature": args.temperature,
+        "alpha": args.alpha if teacher else 0.0,
+        "train_seconds": round(time.perf_counter() - started, 1),
+        "student": {
+            "latency_us": latency_us(student.predict, latency_texts),
+            "param_bytes": student.nbytes,
+            "disk_bytes": disk,
+        },
+        "teacher": None,
+        "parity_gap": None,
+    }
+    if teacher:
+        report["teacher"] = {
+            "latency_us": latency_us(teacher.predict, latency_texts, calls=300),
+            "param_bytes": teacher.nbytes,
+        }
+        report["parity_gap"] = {}
+    for name, (eval_texts, eval_labels) in eval_sets.items():
+        if not eval_texts:
+            continue
+        ids = np.array([label2id[label] for label in eval_labels])
+        student_pred = np.array([label2id[student.predict(t)] for t in eval_texts])
+        report["student"][f"{name}_accuracy"] = round(float((student_pred == ids).mean()), 4)
+        if teacher:
+            teacher_pred = teacher.logits(eval_texts).argmax(axis=1)
+            report["teacher"][f"{name}_accuracy"] = round(float((teacher_pred == ids).mean()), 4)
+            report["student"][f"{name}_agreement_with_teacher"] = round(float((student_pred == teacher_pred).mean()), 4)
+            report["parity_gap"][name] = round(report["teacher"][f"{name}_accuracy"]
+                                               - report["student"][f"{name}_accuracy"], 4)
+
+    with open(os.path.join(args.out, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name in ("teacher", "student"):
+        r = report[name]
+        if r:
+            scores = "  ".join(f"{k}={v:.4f}" for k, v in r.items() if k.startswith("heldout"))
+            print(f"{name:8s} {scores}  p50={r['latency_us']['p50']}us "
+                  f"p99={r['latency_us']['p99']}us  params={r['param_bytes'] / 2**20:.1f} MiB")
+    if report["parity_gap"] is not None:
+        print("parity gap (teacher - student accuracy): "
+              + ", ".join(f"{k}={v:+.4f}" for k, v in report["parity_gap"].items()))
+    print(f"student saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
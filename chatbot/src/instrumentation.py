@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# -------------------- Switch -------------------- #
+# WELLBOT_METRICS=0 turns every timer into a shared no-op context manager.
+ENABLED = os.environ.get("WELLBOT_METRICS", "1") != "0"
+
+# -------------------- HDR-style Histogram -------------------- #
+SUB_BUCKET_BITS = 5                      # 32 linear sub-buckets per power of two (~3% error)
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_EXPONENT = 40                        # up to ~2^45 us, far beyond any request
+
+PROM_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+
+def _bucket_index(us: int) -> int:
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+
+
+def _bucket_upper(idx: int) -> int:
+    if idx < SUB_BUCKETS:
+        return idx
+    shift = idx // SUB_BUCKETS - 1
+    return ((idx % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    """Log-linear latency histogram in microseconds with bounded relative error."""
+
+    def __init__(self):
+        self.counts = [0] * ((MAX_EXPONENT + 1) * SUB_BUCKETS)
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self._lock = threading.Lock()
+
+    def record(self, us: int):
+        idx = min(_bucket_index(us), len(self.counts) - 1)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total_us += us
+            if us > self.max_us:
+                self.max_us = us
+
+    def percentile(self, q: float) -> int:
+        """Upper bound (us) of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(_bucket_upper(idx), self.max_us)
+        return self.max_us
+
+    def cumulative(self, bounds_s: List[float]) -> List[int]:
+        """Cumulative counts at each Prometheus `le` bound (bucket resolution)."""
+        out = []
+        seen = 0
+        idx = 0
+        for bound in bounds_s:
+            limit = bound * 1_000_000
+            while idx < len(self.counts) and _bucket_upper(idx) <= limit:
+                seen += self.counts[idx]
+                idx += 1
+            out.append(seen)
+        return out
+
+
+# -------------------- Registry -------------------- #
+_histograms: Dict[str, Histogram] = {}
+_registry_lock = threading.Lock()
+
+# Per-request stage durations (us), set by the HTTP middleware; the dict is
+# shared with the threadpool thread that runs the route.
+_request_timings: ContextVar[Optional[Dict[str, int]]] = ContextVar("wellbot_timings", default=None)
+
+
+def histogram(name: str) -> Histogram:
+    h = _histograms.get(name)
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault(name, Histogram())
+    return h
+
+
+def observe(name: str, us: int):
+    histogram(name).record(us)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + us
+
+
+@contextmanager
+def _timed(name: str):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter_ns() - start) // 1000)
+
+
+_NOOP = nullcontext()
+
+
+def stage(name: str):
+    """Time a block as stage `name`: `with stage("extract_symptoms"): ...`."""
+    if not ENABLED:
+        return _NOOP
+    return _timed(name)
+
+
+def begin_request() -> Dict[str, int]:
+    timings: Dict[str, int] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, int]) -> str:
+    return ", ".join(f"{name};dur={us / 1000:.3f}" for name, us in timings.items())
+
+
+# -------------------- Prometheus Export -------------------- #
+def render_prometheus() -> str:
+    lines = [
+        "# HELP wellbot_stage_seconds Latency of dialogue stages, DB calls and routes.",
+        "# TYPE wellbot_stage_seconds histogram",
+    ]
+    for name, h in sorted(_histograms.items()):
+        for bound, c in zip(PROM_BOUNDS, h.cumulative(PROM_BOUNDS)):
+            lines.append(f'wellbot_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {c}')
+        lines.append(f'wellbot_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+        lines.append(f'wellbot_stage_seconds_sum{{stage="{name}"}} {h.total_us / 1_000_000:.6f}')
+        lines.append(f'wellbot_stage_seconds_count{{stage="{name}"}} {h.count}')
+    lines.append("# HELP wellbot_stage_quantile_seconds HDR-histogram quantiles per stage.")
+    lines.append("# TYPE wellbot_stage_quantile_seconds gauge")
+    for name, h in sorted(_histograms.items()):
+        for q in QUANTILES:
+            lines.append(
+                f'wellbot_stage_quantile_seconds{{stage="{name}",quantile="{q}"}} {h.percentile(q) / 1_000_000:.6f}'
+            )
+    return "\n".join(lines) + "\n"
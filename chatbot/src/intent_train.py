@@ -1,8 +1,16 @@
 import os
+import time
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 import torch
-from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer, TrainingArguments
+from transformers import (
+    DistilBertTokenizerFast,
+    DistilBertForSequenceClassification,
+    Trainer,
+    TrainingArguments,
+    DataCollatorWithPadding,
+    TrainerCallback,
+)
 from datasets import Dataset
 from sklearn.metrics import accuracy_score
 import json
@@ -15,71 +23,70 @@ MODEL_DIR = os.path.join(BASE_DIR, "chatbot", "models", "intent_model")
 TRAIN_PATH = os.path.join(DATA_DIR, "train.csv")
 TEST_PATH = os.path.join(DATA_DIR, "test.csv")
 
-os.makedirs(MODEL_DIR, exist_ok=True)
+MAX_LENGTH = 64
+# Pad every example to MAX_LENGTH like before (WELLBOT_PAD_TO_MAX=1), to compare epoch times.
+# The dynamic-padding speedup is unmeasured so far (no torch on the machine it was written on):
+# run this script with and without WELLBOT_PAD_TO_MAX=1 and compare the mean epoch lines.
+PAD_TO_MAX = os.environ.get("WELLBOT_PAD_TO_MAX") == "1"
 
-# --- Load datasets ---
-train_df = pd.read_csv(TRAIN_PATH)
-test_df = pd.read_csv(TEST_PATH)
 
-# Encode labels
-label_encoder = LabelEncoder()
-train_df["label"] = label_encoder.fit_transform(train_df["intent"])
-test_df["label"] = label_encoder.transform(test_df["intent"])
+# --- CPU threads (WELLBOT_TORCH_THREADS / WELLBOT_TORCH_INTEROP_THREADS, 0 = torch default) ---
+def configure_threads(intra: int = None, inter: int = None):
+    intra = intra or int(os.environ.get("WELLBOT_TORCH_THREADS", 0))
+    inter = inter or int(os.environ.get("WELLBOT_TORCH_INTEROP_THREADS", 0))
+    if intra:
+        torch.set_num_threads(intra)
+    if inter:
+        # Only allowed before torch runs any parallel work, so call this first.
+        torch.set_num_interop_threads(inter)
 
-# Save label map
-label2id = {label: idx for idx, label in enumerate(label_encoder.classes_)}
-id2label = {idx: label for label, idx in label2id.items()}
 
-with open(os.path.join(MODEL_DIR, "label_map.json"), "w") as f:
-    json.dump(label2id, f)
+# --- Data ---
+def load_data():
+    train_df = pd.read_csv(TRAIN_PATH)
+    test_df = pd.read_csv(TEST_PATH)
 
-# --- Tokenizer ---
-tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
+    # Encode labels
+    label_encoder = LabelEncoder()
+    train_df["label"] = label_encoder.fit_transform(train_df["intent"])
+    test_df["label"] = label_encoder.transform(test_df["intent"])
+    label2id = {label: idx for idx, label in enumerate(label_encoder.classes_)}
+    return train_df, test_df, label2id
 
-def tokenize_data(example):
-    return tokenizer(example["text"], truncation=True, padding="max_length", max_length=64)
 
-# Convert pandas → HuggingFace dataset
-train_ds = Dataset.from_pandas(train_df)
-test_ds = Dataset.from_pandas(test_df)
+def tokenize_datasets(tokenizer, train_df, test_df, pad_to_max: bool = PAD_TO_MAX):
+    """Tokenize without padding; the collator pads each batch to its longest example."""
 
-train_ds = train_ds.map(tokenize_data, batched=True)
-test_ds = test_ds.map(tokenize_data, batched=True)
+    def tokenize_data(example):
+        encoded = tokenizer(
+            example["text"],
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding="max_length" if pad_to_max else False,
+        )
+        # Used by group_by_length to batch utterances of similar length together.
+        encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+        return encoded
 
-train_ds.set_format(type="torch", columns=["input_ids", "attention_mask", "label"])
-test_ds.set_format(type="torch", columns=["input_ids", "attention_mask", "label"])
+    columns = ["text", "intent"]
+    train_ds = Dataset.from_pandas(train_df, preserve_index=False).map(tokenize_data, batched=True, remove_columns=columns)
+    test_ds = Dataset.from_pandas(test_df, preserve_index=False).map(tokenize_data, batched=True, remove_columns=columns)
+    return train_ds, test_ds
 
-# --- Model ---
-model = DistilBertForSequenceClassification.from_pretrained(
-    "distilbert-base-uncased",
-    num_labels=len(label2id),
-    id2label=id2label,
-    label2id=label2id
-)
 
-# --- Training args (safe for old versions) ---
-args_kwargs = {
-    "output_dir": os.path.join(BASE_DIR, "results"),
-    "learning_rate": 2e-5,
-    "per_device_train_batch_size": 8,
-    "per_device_eval_batch_size": 8,
-    "num_train_epochs": 3,
-    "weight_decay": 0.01,
-    "logging_dir": os.path.join(BASE_DIR, "logs"),
-    "logging_steps": 10
-}
-
-# Try to add new args if available
-try:
-    training_args = TrainingArguments(
-        **args_kwargs,
-        evaluation_strategy="epoch",
-        save_strategy="epoch",
-        save_total_limit=1
-    )
-except TypeError:
-    print("Old Transformers version detected → skipping evaluation_strategy & save_strategy")
-    training_args = TrainingArguments(**args_kwargs)
+# --- Epoch timing ---
+class EpochTimer(TrainerCallback):
+    def __init__(self):
+        self.seconds = []
+        self._start = None
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self.seconds.append(time.perf_counter() - self._start)
+        print(f"epoch {len(self.seconds)}: {self.seconds[-1]:.1f}s")
+
 
 # --- Metrics ---
 def compute_metrics(pred):
@@ -87,17 +94,83 @@ def compute_metrics(pred):
     preds = pred.predictions.argmax(-1)
     return {"accuracy": accuracy_score(labels, preds)}
 
+
 # --- Trainer ---
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_ds,
-    eval_dataset=test_ds,
-    compute_metrics=compute_metrics
-)
+def build_trainer(label2id, train_ds, test_ds, tokenizer, output_dir, learning_rate=2e-5, batch_size=8,
+                  epochs=3, weight_decay=0.01, save_checkpoints=True, callbacks=None):
+    id2label = {idx: label for label, idx in label2id.items()}
+    model = DistilBertForSequenceClassification.from_pretrained(
+        "distilbert-base-uncased",
+        num_labels=len(label2id),
+        id2label=id2label,
+        label2id=label2id
+    )
+
+    # --- Training args (safe for old versions) ---
+    args_kwargs = {
+        "output_dir": output_dir,
+        "learning_rate": learning_rate,
+        "per_device_train_batch_size": batch_size,
+        "per_device_eval_batch_size": batch_size,
+        "num_train_epochs": epochs,
+        "weight_decay": weight_decay,
+        "logging_dir": os.path.join(BASE_DIR, "logs"),
+        "logging_steps": 10,
+        "group_by_length": True,
+        "length_column_name": "length",
+    }
+
+    # Try to add new args if available
+    try:
+        training_args = TrainingArguments(
+            **args_kwargs,
+            evaluation_strategy="epoch",
+            save_strategy="epoch" if save_checkpoints else "no",
+            save_total_limit=1
+        )
+    except TypeError:
+        print("Old Transformers version detected → skipping evaluation_strategy & save_strategy")
+        training_args = TrainingArguments(**args_kwargs)
+
+    return Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_ds,
+        eval_dataset=test_ds,
+        data_collator=DataCollatorWithPadding(tokenizer, pad_to_multiple_of=8),
+        compute_metrics=compute_metrics,
+        callbacks=callbacks,
+    )
+
+
+def main():
+    configure_threads()
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    # --- Load datasets ---
+    train_df, test_df, label2id = load_data()
+
+    # Save label map
+    with open(os.path.join(MODEL_DIR, "label_map.json"), "w") as f:
+        json.dump(label2id, f)
+
+    # --- Tokenizer ---
+    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
+    train_ds, test_ds = tokenize_datasets(tokenizer, train_df, test_df)
+
+    # --- Train & Save ---
+    timer = EpochTimer()
+    trainer = build_trainer(label2id, train_ds, test_ds, tokenizer, os.path.join(BASE_DIR, "results"),
+                            callbacks=[timer])
+    trainer.train()
+    accuracy = trainer.evaluate()["eval_accuracy"]
+    trainer.model.save_pretrained(MODEL_DIR)
+    tokenizer.save_pretrained(MODEL_DIR)
+    padding = "max_length" if PAD_TO_MAX else "dynamic"
+    print(f"padding={padding} threads={torch.get_num_threads()} "
+          f"mean epoch {sum(timer.seconds) / len(timer.seconds):.1f}s accuracy {accuracy:.4f}")
+    print(f"Model trained and saved at {MODEL_DIR}")
+
 
-# --- Train & Save ---
-trainer.train()
-model.save_pretrained(MODEL_DIR)
-tokenizer.save_pretrained(MODEL_DIR)
-print(f"Model trained and saved at {MODEL_DIR}")
+if __name__ == "__main__":
+    main()
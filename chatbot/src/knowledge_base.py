@@ -5,12 +5,13 @@ from typing import Dict, Any
 # -------------------- Load Knowledge Base -------------------- #
 KB_FILE = os.path.join(os.path.dirname(__file__), "knowledge_base.json")
 
-def load_kb() -> Dict[str, Any]:
-    """Load the knowledge base from JSON file."""
-    if not os.path.exists(KB_FILE):
-        raise FileNotFoundError(f"Knowledge base file not found: {KB_FILE}")
+def load_kb(path: str = None) -> Dict[str, Any]:
+    """Load the knowledge base from JSON file (KB_FILE unless a path is given)."""
+    path = path or KB_FILE
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Knowledge base file not found: {path}")
 
-    with open(KB_FILE, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8") as f:
         kb = json.load(f)
 
     # Normalize all keys to lowercase for easier matching
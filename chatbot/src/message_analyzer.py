@@ -0,0 +1,167 @@
+"""
+Single-pass analysis of a user message for the dialogue engine.
+
+Before this module, each stage scanned the message separately: a Devanagari
+regex for the language, dozens of `w in m` substring checks for intents
+(so "hi" matched "this" and "chills"), a substring pass over every known
+symptom, and two more regexes for entities. MessageAnalyzer lowercases and
+tokenizes the message once. Each token carries its offsets into the
+normalized text and its script. One compiled lookup then walks the token
+stream and finds everything:
+
+- keyword intents
+- symptoms
+- durations ("for <number> day(s)")
+- severity
+
+The lookup is a token trie. Every keyword, symptom and entity pattern is a
+path of whole tokens, so a phrase matches only on word boundaries.
+Multi-word phrases ("body pain", "see you", "फिर मिलेंगे") need consecutive
+tokens. Plural, verb and -ish/-ness forms of English keywords of four or
+more letters ("headaches", "stressed", "feverish", "tiredness") are
+compiled into the trie as well; substring matching used to catch these.
+
+Intent priority is the same as before: the earliest group in
+INTENT_KEYWORDS wins wherever it appears in the message.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[\w\u0900-\u0963\u0966-\u097F]+")  # Devanagari incl. vowel signs, minus the dandas
+DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+
+# Highest priority first; mirrors the original detect_rule_based_intent chain.
+INTENT_KEYWORDS: List[Tuple[str, List[str]]] = [
+    ("greet", ["hi", "hello", "hey", "namaste", "नमस्ते"]),
+    ("goodbye", ["bye", "goodbye", "see you", "tata", "फिर मिलेंगे"]),
+    ("stress", ["stress", "anxious", "sad", "sadness", "depressed", "tension", "तनाव", "उदास"]),
+    ("sleep", ["sleep", "tired", "insomnia", "नींद", "थकान"]),
+    ("exercise", ["exercise", "workout", "gym", "योग", "फिटनेस"]),
+    ("diagnosis_query", ["what do i have", "diagnose", "so what do i have", "कौन सी बीमारी"]),
+]
+SEVERITIES = ["mild", "moderate", "severe"]
+DURATION_UNITS = ["day", "days"]
+
+_NUM = "\0num"  # trie edge matching any digit token
+_END = "\0end"  # trie key holding the matches that end at this node
+
+Token = Tuple[str, int, int, str]  # (text, start, end, script) with offsets into MessageAnalysis.normalized
+
+
+class MessageAnalysis:
+    __slots__ = ("text", "normalized", "tokens", "language", "intent", "symptoms", "entities")
+
+    def __init__(self, text: str, normalized: str, tokens: List[Token], language: str, intent: Optional[str],
+                 symptoms: List[str], entities: Dict[str, str]):
+        self.text = text
+        self.normalized = normalized
+        self.tokens = tokens
+        self.language = language
+        self.intent = intent
+        self.symptoms = symptoms
+        self.entities = entities
+
+    def as_dict(self) -> dict:
+        return {"language": self.language, "intent": self.intent, "symptoms": self.symptoms,
+                "entities": self.entities}
+
+
+# -------------------- Tokenizing -------------------- #
+def tokenize(normalized: str) -> List[Token]:
+    tokens = []
+    for m in TOKEN_RE.finditer(normalized):
+        word = m.group()
+        if word.isascii():
+            script = "latin"
+        elif DEVANAGARI_RE.search(word):
+            script = "devanagari"
+        else:
+            script = "other"
+        tokens.append((word, m.start(), m.end(), script))
+    return tokens
+
+
+def inflections(word: str) -> List[str]:
+    """The word plus its regular English plural, verb and -ish/-ness forms; other words as is."""
+    if len(word) < 4 or not word.isascii() or not word.isalpha():
+        return [word]
+    forms = {word, word + "s", word + "es", word + "ed", word + "ing", word + "ish", word + "ness"}
+    if word.endswith("e"):
+        forms.update((word + "d", word[:-1] + "ing"))
+    if word.endswith("y"):
+        forms.add(word[:-1] + "ies")
+    return sorted(forms)
+
+
+# -------------------- Compiled lookup -------------------- #
+class MessageAnalyzer:
+    def __init__(self, symptoms: Iterable[str], intent_keywords: List[Tuple[str, List[str]]] = INTENT_KEYWORDS):
+        self._root: dict = {}
+        for priority, (intent, words) in enumerate(intent_keywords):
+            for phrase in words:
+                self._add_phrase(phrase, ("intent", priority, intent))
+        for symptom in symptoms:
+            self._add_phrase(symptom, ("symptom", 0, symptom))
+        for severity in SEVERITIES:
+            self._add([severity], ("severity", 0, severity))
+        for unit in DURATION_UNITS:
+            self._add(["for", _NUM, unit], ("duration", 0, "{} days"))
+        self._intents = [intent for intent, _ in intent_keywords]
+
+    def _add_phrase(self, phrase: str, match: tuple):
+        words = [t[0] for t in tokenize(phrase.lower())]
+        if not words:
+            return
+        for last in inflections(words[-1]):
+            self._add(words[:-1] + [last], match)
+
+    def _add(self, words: List[str], match: tuple):
+        node = self._root
+        for word in words:
+            node = node.setdefault(word, {})
+        hits = node.setdefault(_END, [])
+        if match not in hits:
+            hits.append(match)
+
+    def analyze(self, text: str) -> MessageAnalysis:
+        normalized = text.lower()
+        tokens = tokenize(normalized)
+        words = [t[0] for t in tokens]
+        language = "hi" if any(t[3] == "devanagari" for t in tokens) else "en"
+
+        intent_rank = None
+        symptoms: List[str] = []
+        entities: Dict[str, str] = {}
+        root = self._root
+        n = len(words)
+        for i in range(n):
+            node = root.get(words[i])
+            if node is None:
+                continue
+            numbers = []
+            j = i
+            while True:
+                for kind, rank, value in node.get(_END, ()):
+                    if kind == "symptom":
+                        if value not in symptoms:
+                            symptoms.append(value)
+                    elif kind == "intent":
+                        if intent_rank is None or rank < intent_rank:
+                            intent_rank = rank
+                    elif kind == "severity":
+                        entities.setdefault("severity", value)
+                    elif kind == "duration":
+                        entities.setdefault("duration", value.format(numbers[0]))
+                j += 1
+                if j == n:
+                    break
+                nxt = node.get(words[j])
+                if nxt is None and _NUM in node and words[j].isdigit():
+                    nxt = node[_NUM]
+                    numbers.append(words[j])
+                if nxt is None:
+                    break
+                node = nxt
+
+        intent = self._intents[intent_rank] if intent_rank is not None else None
+        return MessageAnalysis(text, normalized, tokens, language, intent, symptoms, entities)
@@ -1,28 +1,48 @@
 import json
-import torch
-from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+import os
 
 # --- Model Path ---
 MODEL_PATH = "C:/Users/lenov/OneDrive/Desktop/Wellbot/chatbot/models/intent_model"
+STUDENT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "intent_student")
 
-# --- Load Model & Tokenizer ---
-print("Loading model...")
-tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_PATH)
-model = DistilBertForSequenceClassification.from_pretrained(MODEL_PATH)
-model.eval()  # set to evaluation mode
-
-# --- Load Label Map ---
-with open(f"{MODEL_PATH}/label_map.json") as f:
-    label2id = json.load(f)
-id2label = {int(v): k for k, v in label2id.items()}  # ensure keys are int
-
-# --- Prediction Function ---
-def predict_intent(text: str):
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=64)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    predicted_class_id = outputs.logits.argmax(dim=-1).item()
-    return id2label[predicted_class_id]
+# --- Backend: "distilbert" (default) or "student" (tiny model from distill.py, no torch needed) ---
+BACKEND = os.environ.get("WELLBOT_INTENT_BACKEND", "distilbert")
+
+if BACKEND == "student":
+    try:
+        from .student_model import StudentModel
+    except ImportError:
+        from student_model import StudentModel
+
+    print("Loading student model...")
+    student = StudentModel.load(os.environ.get("WELLBOT_STUDENT_PATH", STUDENT_PATH))
+
+    # --- Prediction Function ---
+    def predict_intent(text: str):
+        return student.predict(text)
+
+else:
+    import torch
+    from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+    # --- Load Model & Tokenizer ---
+    print("Loading model...")
+    tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_PATH)
+    model = DistilBertForSequenceClassification.from_pretrained(MODEL_PATH)
+    model.eval()  # set to evaluation mode
+
+    # --- Load Label Map ---
+    with open(f"{MODEL_PATH}/label_map.json") as f:
+        label2id = json.load(f)
+    id2label = {int(v): k for k, v in label2id.items()}  # ensure keys are int
+
+    # --- Prediction Function ---
+    def predict_intent(text: str):
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=64)
+        with torch.no_grad():
+            outputs = model(**inputs)
+        predicted_class_id = outputs.logits.argmax(dim=-1).item()
+        return id2label[predicted_class_id]
 
 # --- Interactive Test Loop ---
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+# -------------------- Limits -------------------- #
+MAX_SECONDS = float(os.environ.get("WELLBOT_PROFILE_MAX_SECONDS", 30))
+COOLDOWN_SECONDS = float(os.environ.get("WELLBOT_PROFILE_COOLDOWN", 60))
+DEFAULT_INTERVAL_MS = 5.0
+
+# Leaf frames that mean "this thread is parked", dropped unless include_idle.
+IDLE_FUNCTIONS = {"wait", "select", "poll", "epoll", "_wait_for_tstate_lock", "sleep", "accept", "get"}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already running or the cooldown has not elapsed."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"profiler busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# -------------------- Rate Limiting -------------------- #
+_run_lock = threading.Lock()
+_last_finished = 0.0
+
+
+@contextmanager
+def exclusive_run():
+    """Allow one profiling window at a time, separated by COOLDOWN_SECONDS."""
+    global _last_finished
+    wait = _last_finished + COOLDOWN_SECONDS - time.monotonic()
+    if wait > 0:
+        raise ProfilerBusy(wait)
+    if not _run_lock.acquire(blocking=False):
+        raise ProfilerBusy(COOLDOWN_SECONDS)
+    try:
+        yield
+    finally:
+        _last_finished = time.monotonic()
+        _run_lock.release()
+
+
+def clamp_seconds(seconds: float) -> float:
+    return max(0.1, min(float(seconds), MAX_SECONDS))
+
+
+# -------------------- Stack Sampler -------------------- #
+def _frame_label(frame) -> str:
+    co = frame.f_code
+    return f"{os.path.basename(co.co_filename)}:{co.co_name}"
+
+
+def sample_stacks(seconds: float, interval_ms: float = DEFAULT_INTERVAL_MS, include_idle: bool = False) -> str:
+    """
+    Sample every thread's stack via sys._current_frames() for `seconds` and
+    return collapsed stacks ("root;...;leaf count" per line) for flamegraph.pl
+    or speedscope.
+    """
+    me = threading.get_ident()
+    interval = max(interval_ms, 1.0) / 1000
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# -------------------- Scoped cProfile -------------------- #
+class ScopedProfiler:
+    """cProfile that only runs inside `scope()` blocks (e.g. the /chat handler) while armed."""
+
+    def __init__(self):
+        self._armed_until = 0.0
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def arm(self, seconds: float):
+        with self._lock:
+            self._stats = None
+            self._armed_until = time.monotonic() + seconds
+
+    def disarm(self):
+        self._armed_until = 0.0
+
+    def scope(self):
+        if time.monotonic() >= self._armed_until:
+            return nullcontext()
+        return self._profiled()
+
+    @contextmanager
+    def _profiled(self):
+        # cProfile only sees the thread that enabled it, so each request gets
+        # its own profiler and the results are merged afterwards.
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(prof)
+                else:
+                    self._stats.add(prof)
+
+    def report(self, sort: str = "cumulative", limit: int = 50) -> str:
+        with self._lock:
+            if self._stats is None:
+                return "No requests were handled in the profiling window.\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+
+chat_profiler = ScopedProfiler()
@@ -0,0 +1,105 @@
+"""
+fastText-style intent classifier, trained by distill.py from the DistilBERT model.
+
+A message is lowercased and split into words. Each word unigram, word bigram
+and character n-gram of "<word>" is hashed into one of `buckets` rows of an
+embedding table; the sentence vector is the mean of those rows and a single
+linear layer gives the logits. Inference is one gather, one mean and a
+(dim x labels) matmul in numpy - no torch needed.
+
+Files in the model directory:
+    student.npz       embeddings (float16), weights, bias
+    config.json       buckets, dim, char n-gram range
+    label_map.json    label -> id, same format as the teacher's
+"""
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+(?:'\w+)?", re.UNICODE)
+
+
+# -------------------- Features -------------------- #
+def ngrams(text: str, char_min: int = 3, char_max: int = 5) -> List[str]:
+    words = WORD_RE.findall(text.lower())
+    grams = ["w:" + w for w in words]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        w = f"<{w}>"
+        for n in range(char_min, min(char_max, len(w)) + 1):
+            grams += ["c:" + w[i:i + n] for i in range(len(w) - n + 1)]
+    return grams
+
+
+def feature_ids(text: str, buckets: int, char_min: int = 3, char_max: int = 5) -> np.ndarray:
+    grams = ngrams(text, char_min, char_max) or ["<empty>"]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) % buckets for g in grams), dtype=np.int64, count=len(grams))
+
+
+def softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+# -------------------- Model -------------------- #
+class StudentModel:
+    def __init__(self, embeddings: np.ndarray, weights: np.ndarray, bias: np.ndarray,
+                 label2id: Dict[str, int], char_min: int = 3, char_max: int = 5):
+        self.embeddings = embeddings
+        self.weights = weights
+        self.bias = bias
+        self.label2id = label2id
+        self.id2label = {i: label for label, i in label2id.items()}
+        self.char_min = char_min
+        self.char_max = char_max
+
+    @property
+    def buckets(self) -> int:
+        return self.embeddings.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.embeddings.nbytes + self.weights.nbytes + self.bias.nbytes
+
+    def ids(self, text: str) -> np.ndarray:
+        return feature_ids(text, self.buckets, self.char_min, self.char_max)
+
+    def logits(self, text: str) -> np.ndarray:
+        hidden = self.embeddings[self.ids(text)].astype(np.float32).mean(axis=0)
+        return hidden @ self.weights + self.bias
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        return softmax(self.logits(text))
+
+    def predict(self, text: str) -> str:
+        return self.id2label[int(self.logits(text).argmax())]
+
+    def predict_with_score(self, text: str) -> Tuple[str, float]:
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.id2label[best], float(proba[best])
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "student.npz"), embeddings=self.embeddings.astype(np.float16),
+                 weights=self.weights.astype(np.float32), bias=self.bias.astype(np.float32))
+        with open(os.path.join(path, "config.json"), "w") as f:
+            json.dump({"buckets": self.buckets, "dim": int(self.embeddings.shape[1]),
+                       "char_min": self.char_min, "char_max": self.char_max}, f, indent=2)
+        with open(os.path.join(path, "label_map.json"), "w") as f:
+            json.dump(self.label2id, f)
+
+    @classmethod
+    def load(cls, path: str) -> "StudentModel":
+        with open(os.path.join(path, "config.json")) as f:
+            config = json.load(f)
+        with open(os.path.join(path, "label_map.json")) as f:
+            label2id = {k: int(v) for k, v in json.load(f).items()}
+        arrays = np.load(os.path.join(path, "student.npz"))
+        return cls(arrays["embeddings"], arrays["weights"], arrays["bias"], label2id,
+                   config["char_min"], config["char_max"])
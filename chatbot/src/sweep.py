@@ -0,0 +1,121 @@
+"""
+Parallel CPU hyperparameter sweep for the DistilBERT intent model (intent_train.py).
+
+dataset/train.csv and test.csv are tokenized once, unpadded, and saved with
+Dataset.save_to_disk. Every trial process memory-maps the same Arrow files
+instead of re-tokenizing. --parallel trials run at a time in spawned
+processes. Each trial gets cores // parallel intra-op threads and one
+inter-op thread, so concurrent trials don't oversubscribe the CPU. Small
+models on a few cores each usually get more trials done per hour than one
+trial at a time on all cores.
+
+Results (accuracy, mean epoch time and wall time per trial) are printed and
+written to --out, best first. Trial checkpoints are not kept; retrain the
+winner with intent_train.py.
+
+Usage:
+    python chatbot/src/sweep.py --lr 2e-5,3e-5,5e-5 --batch-size 8,16 --epochs 3 --parallel 3
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import intent_train  # noqa: E402
+
+
+def prepare(data_dir: str) -> dict:
+    from transformers import DistilBertTokenizerFast
+
+    train_df, test_df, label2id = intent_train.load_data()
+    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
+    train_ds, test_ds = intent_train.tokenize_datasets(tokenizer, train_df, test_df)
+    train_ds.save_to_disk(os.path.join(data_dir, "train"))
+    test_ds.save_to_disk(os.path.join(data_dir, "test"))
+    return label2id
+
+
+def run_trial(params: dict, data_dir: str, label2id: dict, threads: int) -> dict:
+    intent_train.configure_threads(threads, 1)
+    from datasets import load_from_disk
+    from transformers import DistilBertTokenizerFast
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
+    train_ds = load_from_disk(os.path.join(data_dir, "train"))
+    test_ds = load_from_disk(os.path.join(data_dir, "test"))
+    timer = intent_train.EpochTimer()
+    output_dir = tempfile.mkdtemp(prefix="trial-", dir=data_dir)
+    start = time.perf_counter()
+    trainer = intent_train.build_trainer(
+        label2id, train_ds, test_ds, tokenizer, output_dir,
+        learning_rate=params["lr"], batch_size=params["batch_size"], epochs=params["epochs"],
+        weight_decay=params["weight_decay"], save_checkpoints=False, callbacks=[timer],
+    )
+    trainer.train()
+    accuracy = trainer.evaluate()["eval_accuracy"]
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return dict(
+        params,
+        accuracy=round(accuracy, 4),
+        epoch_seconds=round(sum(timer.seconds) / max(len(timer.seconds), 1), 1),
+        wall_seconds=round(time.perf_counter() - start, 1),
+        threads=threads,
+    )
+
+
+def floats(value: str):
+    return [float(v) for v in value.split(",")]
+
+
+def ints(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run intent model training trials in parallel on CPU.")
+    parser.add_argument("--lr", type=floats, default=[2e-5, 3e-5, 5e-5])
+    parser.add_argument("--batch-size", type=ints, default=[8, 16])
+    parser.add_argument("--epochs", type=ints, default=[3])
+    parser.add_argument("--weight-decay", type=floats, default=[0.01])
+    parser.add_argument("--parallel", type=int, default=2, help="trials running at once")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default=os.path.join(intent_train.BASE_DIR, "results", "sweep.json"))
+    args = parser.parse_args(argv)
+
+    grid = [
+        {"lr": lr, "batch_size": bs, "epochs": ep, "weight_decay": wd}
+        for lr, bs, ep, wd in itertools.product(args.lr, args.batch_size, args.epochs, args.weight_decay)
+    ]
+    threads = max(1, args.cores // args.parallel)
+    data_dir = tempfile.mkdtemp(prefix="wellbot-sweep-")
+    results = []
+    try:
+        label2id = prepare(data_dir)
+        print(f"{len(grid)} trials, {args.parallel} at a time, {threads} thread(s) each", flush=True)
+        # spawn: forked children would inherit torch's thread pools from the tokenizing parent.
+        with ProcessPoolExecutor(max_workers=args.parallel, mp_context=get_context("spawn")) as pool:
+            futures = [pool.submit(run_trial, params, data_dir, label2id, threads) for params in grid]
+            for future in as_completed(futures):
+                r = future.result()
+                results.append(r)
+                print(f"lr={r['lr']:g} bs={r['batch_size']} epochs={r['epochs']} wd={r['weight_decay']:g}  "
+                      f"acc={r['accuracy']:.4f}  epoch={r['epoch_seconds']}s  wall={r['wall_seconds']}s", flush=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results.sort(key=lambda r: (-r["accuracy"], r["wall_seconds"]))
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"best: {results[0]}")
+
+
+if __name__ == "__main__":
+    main()
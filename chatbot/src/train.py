@@ -1,7 +1,11 @@
 import pandas as pd
 from datasets import Dataset
 from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer, TrainingArguments
+from transformers import DataCollatorWithPadding
 import torch
+from intent_train import configure_threads, EpochTimer, MAX_LENGTH, PAD_TO_MAX
+
+configure_threads()
 
 full_df = pd.read_csv("data/intent_dataset.csv")
 labels_list = full_df["intent"].unique().tolist()  
@@ -21,7 +25,10 @@ val_ds = Dataset.from_pandas(val_df[["sentence", "label"]])
 tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
 
 def tokenize(batch):
-    return tokenizer(batch["sentence"], padding="max_length", truncation=True, max_length=64)
+    # No padding here: DataCollatorWithPadding pads each batch to its longest sentence.
+    encoded = tokenizer(batch["sentence"], padding="max_length" if PAD_TO_MAX else False, truncation=True, max_length=MAX_LENGTH)
+    encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+    return encoded
 
 train_ds = train_ds.map(tokenize, batched=True)
 val_ds = val_ds.map(tokenize, batched=True)
@@ -45,6 +52,8 @@ training_args = TrainingArguments(
     logging_dir="models/logs",
     load_best_model_at_end=True,
     metric_for_best_model="accuracy",
+    group_by_length=True,
+    length_column_name="length",
 )
 
 #Metrics
@@ -64,7 +73,9 @@ trainer = Trainer(
     train_dataset=train_ds,
     eval_dataset=val_ds,
     tokenizer=tokenizer,
+    data_collator=DataCollatorWithPadding(tokenizer, pad_to_multiple_of=8),
     compute_metrics=compute_metrics,
+    callbacks=[EpochTimer()],
 )
 
 #Train
@@ -0,0 +1,273 @@
+"""
+Actor-style execution of the dialogue engine across processes.
+
+get_bot_reply is pure Python, so threads in one process share a single GIL,
+and user_sessions is a plain dict that other processes cannot see.
+DialoguePool forks N worker processes instead. Each one owns the sessions
+of the users with shard_index(user_id, N) == i, the same crc32 partitioning
+the database shards use. A user's turns therefore always reach the same
+worker, and the worker touches its sessions from a single thread, without
+locks. Workers started with the pool inherit the knowledge base and
+symptom index from the parent at fork time.
+
+Each worker talks to the API process over one duplex Pipe:
+    request   (req_id, op, user_id, message, context)     op: "reply" | "stream"
+    response  (req_id, kind, payload, session_open)
+              kind: "chunk" | "done" | "error"
+The "done" payload carries the engine's failed flag: (reply, failed) for
+"reply", failed alone for "stream".
+A reader thread per worker resolves the caller's Future, or feeds its queue
+for streams. After every turn the worker says whether the user still has
+an open session, so the parent always knows which sessions live where.
+
+Crash recovery: when a worker dies, its pipe reaches EOF. The reader thread
+then:
+- fails the worker's in-flight requests with WorkerCrashed
+- logs and records the users whose sessions were lost (GET
+  /dialogue/workers)
+- starts a replacement at the same index
+Those users start a fresh session on their next message. By then the API
+process runs threads, and a plain fork could copy a lock one of them
+holds, deadlocking the child. Replacements therefore come from a
+forkserver: a clean single-threaded process, started with the pool, that
+has the dialogue engine preloaded and forks each replacement itself.
+
+Instrumentation stages inside the workers stay in the worker processes; the
+API process's /metrics shows the get_bot_reply stage as a whole.
+
+Usage (single API process; serve.py's pre-forked workers each keep their own sessions):
+    WELLBOT_DIALOGUE_WORKERS=4 uvicorn backend:app
+"""
+import concurrent.futures
+import itertools
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from typing import Iterator, List, Optional
+
+from sharding import shard_index
+
+REQUEST_TIMEOUT = float(os.environ.get("WELLBOT_DIALOGUE_TIMEOUT", 30))
+MAX_REPORTED_SESSIONS = 100
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+# -------------------- Worker process -------------------- #
+def worker_main(conn, index: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the API process decides when workers stop
+    from chatbot.src import dialogue_manager as dm
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        req_id, op, user_id, message, context = request
+        outcome = {}
+        try:
+            if op == "stream":
+                for chunk in dm.iter_bot_reply(user_id, message, context, outcome):
+                    conn.send((req_id, "chunk", chunk, None))
+                conn.send((req_id, "done", outcome.get("failed", False), user_id in dm.user_sessions))
+            else:
+                reply = dm.get_bot_reply(user_id, message, context, outcome)
+                conn.send((req_id, "done", (reply, outcome.get("failed", False)), user_id in dm.user_sessions))
+        except Exception:
+            conn.send((req_id, "error", traceback.format_exc(limit=5), user_id in dm.user_sessions))
+
+
+# -------------------- API side -------------------- #
+class _Worker:
+    def __init__(self, ctx, index: int):
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child, index), name=f"dialogue-{index}", daemon=True)
+        self.process.start()
+        child.close()
+        self.started = time.time()
+        self.handled = 0
+        self.sessions = set()  # users with an open session in this worker
+        self.pending = {}      # req_id -> (user_id, Future | Queue)
+        # Separate locks: a sender blocked on a full pipe must never stop the reader draining replies.
+        self.pending_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+
+class DialoguePool:
+    def __init__(self, size: int, timeout: float = REQUEST_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        # fork: workers inherit the loaded KB and never touch the parent's SQLite handles.
+        self._ctx = multiprocessing.get_context("fork")
+        # Restarts happen after threads exist, so they fork from the forkserver instead (see module docstring).
+        self._restart_ctx = multiprocessing.get_context("forkserver")
+        self._restart_ctx.set_forkserver_preload(["chatbot.src.dialogue_manager"])
+        self._ids = itertools.count(1)
+        self._closing = False
+        self.restarts = 0
+        self.crashes = deque(maxlen=50)
+        self.workers: List[_Worker] = [self._start(i) for i in range(size)]
+        multiprocessing.forkserver.ensure_running()
+
+    def _start(self, index: int, ctx=None) -> _Worker:
+        worker = _Worker(ctx or self._ctx, index)
+        threading.Thread(target=self._read, args=(worker,), name=f"dialogue-reader-{index}", daemon=True).start()
+        return worker
+
+    # -------------------- Replies from a worker -------------------- #
+    def _read(self, worker: _Worker):
+        while True:
+            try:
+                req_id, kind, payload, session_open = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            with worker.pending_lock:
+                entry = worker.pending.get(req_id) if kind == "chunk" else worker.pending.pop(req_id, None)
+            if session_open is not None:
+                if entry is not None:
+                    user_id = entry[0]
+                    (worker.sessions.add if session_open else worker.sessions.discard)(user_id)
+                worker.handled += 1
+            if entry is None:
+                continue  # the caller timed out and went away
+            sink = entry[1]
+            if isinstance(sink, Future):
+                if kind == "error":
+                    sink.set_exception(RuntimeError(payload))
+                else:
+                    sink.set_result(payload)
+            else:
+                sink.put((kind, payload))
+        self._on_exit(worker)
+
+    def _on_exit(self, worker: _Worker):
+        worker.process.join(timeout=5)
+        with worker.pending_lock:
+            pending, worker.pending = worker.pending, {}
+        error = WorkerCrashed(f"dialogue worker {worker.index} exited")
+        for _, sink in pending.values():
+            if isinstance(sink, Future):
+                sink.set_exception(error)
+            else:
+                sink.put(("error", str(error)))
+        if self._closing:
+            return
+
+        lost = sorted(worker.sessions)
+        self.crashes.append({
+            "worker": worker.index,
+            "pid": worker.process.pid,
+            "exit_code": worker.process.exitcode,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "failed_requests": len(pending),
+            "lost_session_count": len(lost),
+            "lost_sessions": lost[:MAX_REPORTED_SESSIONS],
+        })
+        print(f"[dialogue] worker {worker.index} (pid {worker.process.pid}) exited with "
+              f"{worker.process.exitcode}; {len(pending)} request(s) failed, {len(lost)} session(s) lost: "
+              f"{', '.join(lost[:10])}{' ...' if len(lost) > 10 else ''}", flush=True)
+        self.restarts += 1
+        self.workers[worker.index] = self._start(worker.index, self._restart_ctx)
+
+    # -------------------- Requests -------------------- #
+    def worker_for(self, user_id: str) -> _Worker:
+        return self.workers[shard_index(user_id, self.size)]
+
+    def _submit(self, user_id: str, op: str, message: str, context, sink):
+        worker = self.worker_for(user_id)
+        req_id = next(self._ids)
+        with worker.pending_lock:
+            worker.pending[req_id] = (user_id, sink)
+        try:
+            with worker.send_lock:
+                worker.conn.send((req_id, op, user_id, message, context))
+        except (OSError, ValueError):
+            with worker.pending_lock:
+                worker.pending.pop(req_id, None)
+            raise WorkerCrashed(f"dialogue worker {worker.index} is restarting")
+        return worker, req_id
+
+    def reply(self, user_id: str, message: str, context=None, timeout: Optional[float] = None,
+              outcome: Optional[dict] = None) -> str:
+        """Blocking get_bot_reply on the user's worker (call from a threadpool thread)."""
+        future = Future()
+        worker, req_id = self._submit(user_id, "reply", message, context, future)
+        try:
+            reply, failed = future.result(timeout or self.timeout)
+        except concurrent.futures.TimeoutError:
+            # Not the builtin TimeoutError before Python 3.11 (the Dockerfile runs 3.10).
+            with worker.pending_lock:
+                worker.pending.pop(req_id, None)
+            raise
+        if failed and outcome is not None:
+            outcome["failed"] = True
+        return reply
+
+    def iter_reply(self, user_id: str, message: str, context=None, timeout: Optional[float] = None,
+                   outcome: Optional[dict] = None) -> Iterator[str]:
+        """Blocking iter_bot_reply on the user's worker; yields chunks as the worker sends them."""
+        timeout = timeout or self.timeout
+        chunks = queue.Queue()
+        worker, req_id = self._submit(user_id, "stream", message, context, chunks)
+        try:
+            while True:
+                try:
+                    kind, payload = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"dialogue worker {worker.index} did not answer in {timeout:.1f}s")
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    if payload and outcome is not None:
+                        outcome["failed"] = True
+                    return
+                else:
+                    raise RuntimeError(payload)
+        finally:
+            with worker.pending_lock:
+                worker.pending.pop(req_id, None)
+
+    # -------------------- Admin -------------------- #
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "restarts": self.restarts,
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.process.pid,
+                    "alive": w.process.is_alive(),
+                    "handled": w.handled,
+                    "in_flight": len(w.pending),
+                    "open_sessions": len(w.sessions),
+                    "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(w.started)),
+                }
+                for w in self.workers
+            ],
+            "crashes": list(self.crashes),
+        }
+
+    def close(self, timeout: float = 5.0):
+        self._closing = True
+        for worker in self.workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
@@ -0,0 +1,265 @@
+"""
+Columnar bulk export of chat_history and feedback.
+
+Rows are read from every shard through their own read-only connections with
+a server-side cursor (fetchmany), converted to Arrow record batches of
+`batch_rows` rows and written as Parquet row groups or an Arrow IPC stream,
+so memory stays bounded by one batch. Readers never take the backend's shard
+locks; under WAL (serve.py) they don't block chat writes either.
+
+Incremental exports use a watermark: the highest id exported from each shard,
+comma-separated in shard order ("1520" with one shard, "803,911,760,802" with
+four). An export covers ids in (watermark, max id at start] and reports the
+new watermark, so rows written while it runs are picked up next time.
+Archived months (archive.py) are already Parquet and are not re-exported.
+
+Usage:
+    python export.py chat_history --out chats.parquet --since 2026-10-01
+    python export.py feedback --format arrow --out feedback.arrows --user alice
+    python export.py chat_history --out new.parquet --state export_state.json   # incremental
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import Iterator, List, Optional
+
+import answers
+import feedback
+from archive import normalize_bound
+from sharding import shard_index, shard_paths
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+BATCH_ROWS = 20_000
+FORMATS = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+# -------------------- Tables -------------------- #
+# name -> (SELECT over alias t, output columns after shard and id)
+TABLES = {
+    "chat_history": (
+        "SELECT t.id, t.user_id, t.question, t.answer, a.body, a.codec, t.timestamp "
+        "FROM chat_history t LEFT JOIN answers a ON a.id = t.answer_id",
+        ["user_id", "question", "answer", "timestamp"],
+    ),
+    "feedback": (
+        "SELECT t.id, t.user_id, COALESCE(t.question, ch.question), t.answer, ch.answer, a.body, a.codec, "
+        "t.rating, t.comment, t.timestamp, t.turn_id FROM feedback t "
+        "LEFT JOIN chat_history ch ON ch.id = t.turn_id LEFT JOIN answers a ON a.id = ch.answer_id",
+        ["user_id", "question", "answer", "rating", "comment", "timestamp", "turn_id"],
+    ),
+}
+
+
+def schema(table: str):
+    types = {"rating": pyarrow.int64(), "turn_id": pyarrow.int64()}
+    fields = [("shard", pyarrow.int32()), ("id", pyarrow.int64())]
+    fields += [(c, types.get(c, pyarrow.string())) for c in TABLES[table][1]]
+    return pyarrow.schema(fields)
+
+
+def to_row(table: str, row: tuple) -> tuple:
+    if table == "chat_history":
+        i, user_id, question, legacy, body, codec, timestamp = row
+        return i, user_id, question, answers.resolve(legacy, body, codec), timestamp
+    if table == "feedback":
+        i, user_id, question, copied, legacy, body, codec, rating, comment, timestamp, turn_id = row
+        return i, user_id, question, feedback.answer_text(copied, legacy, body, codec), rating, comment, timestamp, turn_id
+    return row
+
+
+# -------------------- Watermarks -------------------- #
+def parse_watermark(value: Optional[str], count: int) -> List[int]:
+    if not value:
+        return [0] * count
+    try:
+        marks = [int(v) for v in value.split(",")]
+    except ValueError:
+        raise ExportError("watermark must be comma-separated shard ids")
+    if len(marks) != count:
+        raise ExportError(f"watermark has {len(marks)} entries but there are {count} shard(s)")
+    return marks
+
+
+def format_watermark(marks: List[int]) -> str:
+    return ",".join(str(m) for m in marks)
+
+
+# -------------------- Export -------------------- #
+class Export:
+    """One export run: fixes the id range per shard up front, then streams record batches."""
+
+    def __init__(self, db_path: str, shard_count: int, table: str, since: str = None, until: str = None,
+                 user_id: str = None, after: str = None, batch_rows: int = BATCH_ROWS):
+        if pyarrow is None:
+            raise ExportError("pyarrow is required for exports")
+        if table not in TABLES:
+            raise ExportError(f"unknown table {table!r}; choose from {', '.join(TABLES)}")
+        self.table = table
+        self.schema = schema(table)
+        self.batch_rows = batch_rows
+        self.since, self.until = normalize_bound(since), normalize_bound(until)
+        self.user_id = user_id
+        self.low = parse_watermark(after, shard_count)
+
+        self.paths = shard_paths(db_path, shard_count)
+        self.high = []
+        for path, low in zip(self.paths, self.low):
+            top = None
+            if os.path.exists(path):
+                conn = self._connect(path)
+                top = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+                conn.close()
+            self.high.append(max(top or 0, low))
+        self.rows = 0
+
+    @property
+    def watermark(self) -> str:
+        return format_watermark(self.high)
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        # check_same_thread=False: StreamingResponse steps the generator from threadpool workers.
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+
+    def _query(self, low: int, high: int):
+        select, _ = TABLES[self.table]
+        where, args = ["t.id > ?", "t.id <= ?"], [low, high]
+        if self.since:
+            where.append("t.timestamp >= ?")
+            args.append(self.since)
+        if self.until:
+            where.append("t.timestamp < ?")
+            args.append(self.until)
+        if self.user_id is not None:
+            where.append("t.user_id = ?")
+            args.append(self.user_id)
+        return f"{select} WHERE {' AND '.join(where)} ORDER BY t.id", args
+
+    def batches(self) -> Iterator["pyarrow.RecordBatch"]:
+        for shard_no, (path, low, high) in enumerate(zip(self.paths, self.low, self.high)):
+            if high <= low or not os.path.exists(path):
+                continue
+            if self.user_id is not None and shard_index(self.user_id, len(self.paths)) != shard_no:
+                continue
+            conn = self._connect(path)
+            try:
+                cursor = conn.execute(*self._query(low, high))
+                while True:
+                    rows = cursor.fetchmany(self.batch_rows)
+                    if not rows:
+                        break
+                    columns = list(zip(*(to_row(self.table, r) for r in rows)))
+                    arrays = [pyarrow.array([shard_no] * len(rows), pyarrow.int32())]
+                    arrays += [pyarrow.array(col, type=f.type) for col, f in zip(columns, list(self.schema)[1:])]
+                    self.rows += len(rows)
+                    yield pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+            finally:
+                conn.close()
+
+    def write(self, sink, fmt: str):
+        if fmt == "parquet":
+            with pq.ParquetWriter(sink, self.schema, compression="zstd") as writer:
+                for batch in self.batches():
+                    writer.write_batch(batch)
+                    yield
+        elif fmt == "arrow":
+            with pyarrow.ipc.new_stream(sink, self.schema) as writer:
+                for batch in self.batches():
+                    writer.write_batch(batch)
+                    yield
+        else:
+            raise ExportError(f"unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+
+    def stream(self, fmt: str) -> Iterator[bytes]:
+        """Encoded output in chunks, one per record batch (plus the footer)."""
+        sink = _ChunkSink()
+        for _ in self.write(sink, fmt):
+            yield sink.drain()
+        tail = sink.drain()
+        if tail:
+            yield tail
+
+    def to_file(self, path: str, fmt: str):
+        for _ in self.write(path, fmt):
+            pass
+
+
+class _ChunkSink:
+    """Minimal writable file object that hands written bytes back to the caller."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export chat_history or feedback to Parquet / Arrow IPC.")
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    parser.add_argument("--since", help="inclusive ISO date/timestamp")
+    parser.add_argument("--until", help="exclusive ISO date/timestamp")
+    parser.add_argument("--user", help="only this user_id")
+    parser.add_argument("--after", help="watermark from a previous export")
+    parser.add_argument("--state", help="JSON file holding the watermark per table; read and updated")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    state = {}
+    if args.state and os.path.exists(args.state):
+        with open(args.state) as f:
+            state = json.load(f)
+    after = args.after or state.get(args.table)
+
+    try:
+        export = Export(args.db, args.shards, args.table, args.since, args.until, args.user, after, args.batch_rows)
+        export.to_file(args.out, args.format)
+    except ExportError as e:
+        parser.error(str(e))
+
+    if args.state:
+        state[args.table] = export.watermark
+        with open(args.state, "w") as f:
+            json.dump(state, f, indent=2)
+    print(f"exported {export.rows} {args.table} rows to {args.out}; watermark {export.watermark}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
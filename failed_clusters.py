@@ -0,0 +1,296 @@
+"""
+Near-duplicate clustering of failed queries (MinHash + LSH), kept up to date online.
+
+/analytics used to return every failed question as raw text, and the admin
+page counted exact strings. Paraphrases of one unanswered question landed
+in separate rows, and the payload grew with every failure. Now each
+failed turn is assigned to a cluster when it is written:
+
+- The question is normalized (lowercase, punctuation dropped, whitespace
+  collapsed) and cut into character shingles.
+- A MinHash signature of NUM_PERM 32-bit minimums estimates Jaccard
+  similarity between shingle sets.
+- The signature is split into BANDS bands of ROWS values. Each band (with
+  its band number) hashes to a 64-bit bucket key in failed_lsh. The key
+  is the table's rowid, and it points at the cluster whose representative
+  owns that bucket. Only representatives are indexed, so
+  the index grows with the number of clusters, not with the number of
+  queries.
+- Candidate clusters from the buckets are checked against the
+  representative's stored signature. The best one at or above THRESHOLD
+  gets the query; otherwise the query starts a new cluster.
+
+Each cluster keeps a running size, last_seen and up to EXAMPLES distinct
+example texts with counts. /analytics reads the top K clusters through
+the size index, which costs the same at a thousand failures as at
+millions. For older clients it still sends failed_queries_list, now
+rebuilt from those examples (each text repeated by its count, at most
+FAILED_LIST_LIMIT entries) instead of every failed question.
+
+A turn is failed when backend.chat_turn flags it (ERROR_REPLY or the
+dialogue engine's no-match fallback); the reply text is never inspected.
+Timestamps are UTC, like chat_history's CURRENT_TIMESTAMP.
+
+All tables live on the primary database, so clusters span every shard.
+Each assignment is one BEGIN IMMEDIATE transaction, which keeps serve.py
+workers from creating the same cluster twice.
+
+Usage:
+    python failed_clusters.py rebuild      # recluster the failed turns still in chat_history
+    python failed_clusters.py top [-k 20]
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import answers
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+
+SHINGLE = 3
+NUM_PERM = 64
+# 32 bands of 2 rows find a representative at similarity 0.4 with
+# probability 1 - (1 - 0.4^2)^32 = 0.996. Accidental candidates are
+# filtered by THRESHOLD. The settings were tuned with
+# benchmarks/bench_failed_clusters.py.
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+THRESHOLD = float(os.environ.get("WELLBOT_CLUSTER_THRESHOLD", 0.4))
+EXAMPLES = 3
+TOP_K = int(os.environ.get("WELLBOT_FAILED_CLUSTERS_TOP", 10))
+FAILED_LIST_LIMIT = int(os.environ.get("WELLBOT_FAILED_LIST_LIMIT", 200))
+MAX_TEXT_CHARS = 500
+
+# Multiply-shift hashing, (a*x + b mod 2^64) >> 32, one (a, b) per permutation.
+# uint64 arithmetic wraps in numpy, and nothing divides, so it vectorizes.
+# The seed is fixed so signatures stay comparable across processes and restarts.
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 1 << 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+
+_PUNCT_RE = re.compile(r"[^\w\u0900-\u097F]+")
+
+Prepared = Tuple[str, np.ndarray, str]  # (text, signature, timestamp)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS failed_clusters(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    representative TEXT,
+    signature BLOB,
+    size INTEGER,
+    first_seen TEXT,
+    last_seen TEXT
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_failed_clusters_size ON failed_clusters(size DESC, id)",
+    """CREATE TABLE IF NOT EXISTS failed_lsh(
+    bucket INTEGER PRIMARY KEY,
+    cluster_id INTEGER
+)""",
+    """CREATE TABLE IF NOT EXISTS failed_cluster_examples(
+    cluster_id INTEGER,
+    text TEXT,
+    count INTEGER,
+    PRIMARY KEY (cluster_id, text)
+) WITHOUT ROWID""",
+]
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    conn.commit()
+
+
+# -------------------- Signatures -------------------- #
+def normalize(text: str) -> str:
+    return " ".join(_PUNCT_RE.sub(" ", text.lower()).split())[:MAX_TEXT_CHARS]
+
+
+def shingle_hashes(normalized: str) -> np.ndarray:
+    """32-bit hashes of the SHINGLE-character shingles, computed in numpy (repeats don't change a minimum)."""
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE:
+        codes = np.pad(codes, (0, SHINGLE - len(codes)))
+    # Code points fit in 21 bits, so three of them pack into one uint64 without collisions.
+    packed = np.zeros(len(codes) - SHINGLE + 1, dtype=np.uint64)
+    for i in range(SHINGLE):
+        packed = (packed << np.uint64(21)) | codes[i:len(codes) - SHINGLE + 1 + i]
+    return (packed * _MIX) >> _SHIFT
+
+
+def signature(text: str) -> np.ndarray:
+    """NUM_PERM-value MinHash (uint32) of the text's character shingles."""
+    hashes = shingle_hashes(normalize(text))
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) >> _SHIFT
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def band_buckets(sig: np.ndarray) -> List[int]:
+    raw = sig.tobytes()
+    width = ROWS * 4
+    return [
+        int.from_bytes(hashlib.blake2b(raw[band * width:(band + 1) * width], digest_size=8,
+                                       person=band.to_bytes(4, "little")).digest(), "little", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+# -------------------- Online assignment -------------------- #
+def _assign(conn: sqlite3.Connection, text: str, sig: np.ndarray, now: str) -> int:
+    buckets = band_buckets(sig)
+    candidates = conn.execute(
+        "SELECT c.id, c.signature FROM failed_clusters c WHERE c.id IN "
+        f"(SELECT cluster_id FROM failed_lsh WHERE bucket IN ({','.join('?' * len(buckets))}))",
+        buckets,
+    ).fetchall()
+    best_id, best_sim = None, THRESHOLD
+    for cluster_id, blob in candidates:
+        sim = similarity(sig, np.frombuffer(blob, dtype=np.uint32))
+        if sim >= best_sim:
+            best_id, best_sim = cluster_id, sim
+
+    if best_id is None:
+        best_id = conn.execute(
+            "INSERT INTO failed_clusters(representative, signature, size, first_seen, last_seen) VALUES (?, ?, 1, ?, ?)",
+            (text, sig.tobytes(), now, now),
+        ).lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO failed_lsh(bucket, cluster_id) VALUES (?, ?)",
+            [(bucket, best_id) for bucket in buckets],
+        )
+        conn.execute("INSERT INTO failed_cluster_examples(cluster_id, text, count) VALUES (?, ?, 1)", (best_id, text))
+        return best_id
+
+    conn.execute("UPDATE failed_clusters SET size = size + 1, last_seen = ? WHERE id = ?", (now, best_id))
+    updated = conn.execute(
+        "UPDATE failed_cluster_examples SET count = count + 1 WHERE cluster_id = ? AND text = ?", (best_id, text)
+    ).rowcount
+    if not updated:
+        conn.execute(
+            "INSERT INTO failed_cluster_examples(cluster_id, text, count) "
+            "SELECT ?, ?, 1 WHERE (SELECT COUNT(*) FROM failed_cluster_examples WHERE cluster_id = ?) < ?",
+            (best_id, text, best_id, EXAMPLES),
+        )
+    return best_id
+
+
+def prepare(text: str, when: Optional[str] = None) -> Optional[Prepared]:
+    """Text, signature and timestamp of a failed question; the CPU part, done before taking any lock."""
+    text = text.strip()[:MAX_TEXT_CHARS]
+    if not text:
+        return None
+    return text, signature(text), when or datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def record(conn: sqlite3.Connection, items: Iterable[Optional[Prepared]]) -> List[int]:
+    """Assign prepared questions to clusters in one transaction; returns their cluster ids (caller holds the lock)."""
+    items = [item for item in items if item is not None]
+    if not items:
+        return []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [_assign(conn, text, sig, when) for text, sig, when in items]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return ids
+
+
+# -------------------- Reading -------------------- #
+def top_clusters(conn: sqlite3.Connection, k: int = TOP_K) -> List[dict]:
+    clusters = conn.execute(
+        "SELECT id, representative, size, first_seen, last_seen FROM failed_clusters ORDER BY size DESC, id LIMIT ?",
+        (k,),
+    ).fetchall()
+    if not clusters:
+        return []
+    ids = [c[0] for c in clusters]
+    examples = {}
+    for cluster_id, text, count in conn.execute(
+        f"SELECT cluster_id, text, count FROM failed_cluster_examples WHERE cluster_id IN ({','.join('?' * len(ids))}) "
+        "ORDER BY count DESC",
+        ids,
+    ):
+        examples.setdefault(cluster_id, []).append({"text": text, "count": count})
+    return [
+        {"id": cid, "representative": rep, "size": size, "first_seen": first, "last_seen": last,
+         "examples": examples.get(cid, [])}
+        for cid, rep, size, first, last in clusters
+    ]
+
+
+def example_list(clusters: List[dict], limit: int = FAILED_LIST_LIMIT) -> List[str]:
+    """The old flat failed_queries_list, approximated from top_clusters() examples."""
+    texts = (ex["text"] for c in clusters for ex in c["examples"] for _ in range(ex["count"]))
+    return list(itertools.islice(texts, limit))
+
+
+def cluster_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM failed_clusters").fetchone()[0]
+
+
+# -------------------- Rebuild -------------------- #
+def rebuild(primary: sqlite3.Connection, shard_conns: List[sqlite3.Connection], batch: int = 1000) -> int:
+    """Recluster from scratch using the failed turns still in chat_history (archived months are not read)."""
+    ensure_schema(primary)
+    with primary:
+        for table in ("failed_lsh", "failed_cluster_examples", "failed_clusters"):
+            primary.execute(f"DELETE FROM {table}")
+    total = 0
+    for shard in shard_conns:
+        cursor = shard.execute(
+            f"SELECT ch.question, ch.timestamp FROM {answers.TURN_JOIN} WHERE {answers.FAILED_SQL} ORDER BY ch.id"
+        )
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            record(primary, [prepare(question, timestamp) for question, timestamp in rows])
+            total += len(rows)
+    return total
+
+
+def main(argv=None):
+    from sharding import shard_paths
+
+    parser = argparse.ArgumentParser(description="Near-duplicate clusters of failed queries.")
+    parser.add_argument("command", choices=["rebuild", "top"])
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    parser.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args(argv)
+
+    primary = sqlite3.connect(args.db, timeout=30)
+    ensure_schema(primary)
+    if args.command == "rebuild":
+        paths = shard_paths(args.db, args.shards)
+        shard_conns = [primary if p == args.db else sqlite3.connect(p, timeout=30) for p in paths]
+        n = rebuild(primary, shard_conns)
+        print(f"{n} failed queries in {cluster_count(primary)} clusters", file=sys.stderr)
+    else:
+        for c in top_clusters(primary, args.k):
+            print(f"{c['size']:8d}  {c['representative']}")
+            for e in c["examples"]:
+                print(f"{'':10s}{e['count']:6d}  {e['text']}")
+    primary.close()
+
+
+if __name__ == "__main__":
+    main()
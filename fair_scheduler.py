@@ -0,0 +1,240 @@
+"""
+Fair per-user admission for chat processing and inference.
+
+Without a scheduler every /chat goes straight to the threadpool, so one
+client looping under a single user_id can take all the threads and every
+other user waits behind it. FairScheduler sits in front of the work, and
+requests wait for a slot as coroutines on the event loop. Queued requests
+hold no threads, and only `slots` turns run at a time.
+
+- Per-user queues. Eligible users are served in weighted fair queuing
+  order (self-clocked WFQ). Each request gets the finish tag
+      max(V, user's last tag) + cost / weight(user)
+  and the smallest tag goes next; V is the tag of the last request
+  dispatched. With equal weights ("rr" policy) this is round-robin
+  between users.
+- A user with `per_user_inflight` requests running is not eligible until
+  one finishes. The default of 1 also keeps a user's turns in order for
+  the dialogue session.
+- A user with `per_user_queue` requests waiting is rejected with
+  UserQueueFull (429). When `max_queued` requests wait in total, new
+  ones are shed with Overloaded (503). Both carry a Retry-After estimate
+  from the recent service time.
+- A request carries a deadline (X-Request-Timeout seconds or
+  X-Request-Deadline epoch). It is dropped while queued once the
+  deadline passes, and never starts after it. The remaining budget is
+  passed to the work.
+
+Everything except the work itself runs on the event loop, so no locks.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+SLOTS = int(os.environ.get("WELLBOT_SCHED_SLOTS", 4))
+PER_USER_INFLIGHT = int(os.environ.get("WELLBOT_SCHED_USER_INFLIGHT", 1))
+PER_USER_QUEUE = int(os.environ.get("WELLBOT_SCHED_USER_QUEUE", 16))
+MAX_QUEUED = int(os.environ.get("WELLBOT_SCHED_MAX_QUEUED", 512))
+POLICY = os.environ.get("WELLBOT_SCHED_POLICY", "rr")
+DEFAULT_TIMEOUT = float(os.environ.get("WELLBOT_REQUEST_TIMEOUT", 30))
+
+
+class Overloaded(Exception):
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UserQueueFull(Overloaded):
+    status_code = 429
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """"alice:2,batch-bot:0.25" -> {"alice": 2.0, "batch-bot": 0.25}"""
+    weights = {}
+    for item in filter(None, (v.strip() for v in value.split(","))):
+        user, _, weight = item.rpartition(":")
+        weights[user] = float(weight)
+    return weights
+
+
+def deadline_from_headers(headers, default_timeout: float = DEFAULT_TIMEOUT) -> float:
+    """Absolute deadline (time.time()) from X-Request-Deadline / X-Request-Timeout, else now + default."""
+    now = time.time()
+    try:
+        if headers.get("x-request-deadline"):
+            return float(headers["x-request-deadline"])
+        if headers.get("x-request-timeout"):
+            return now + float(headers["x-request-timeout"])
+    except ValueError:
+        pass
+    return now + default_timeout
+
+
+class _Ticket:
+    __slots__ = ("user_id", "tag", "deadline", "future")
+
+    def __init__(self, user_id: str, tag: float, deadline: float, future: asyncio.Future):
+        self.user_id = user_id
+        self.tag = tag
+        self.deadline = deadline
+        self.future = future
+
+
+class _User:
+    __slots__ = ("queue", "in_flight", "last_tag", "queued_in_heap")
+
+    def __init__(self):
+        self.queue: Deque[_Ticket] = deque()
+        self.in_flight = 0
+        self.last_tag = 0.0
+        self.queued_in_heap = False
+
+
+class FairScheduler:
+    def __init__(self, slots: int = SLOTS, per_user_inflight: int = PER_USER_INFLIGHT,
+                 per_user_queue: int = PER_USER_QUEUE, max_queued: int = MAX_QUEUED, policy: str = POLICY,
+                 weight_of: Optional[Callable[[str], float]] = None):
+        if policy not in ("rr", "wfq"):
+            raise ValueError("policy must be rr or wfq")
+        self.slots = slots
+        self.per_user_inflight = per_user_inflight
+        self.per_user_queue = per_user_queue
+        self.max_queued = max_queued
+        self.policy = policy
+        self.weight_of = weight_of or (lambda user_id: 1.0)
+        self._users: Dict[str, _User] = {}
+        self._heap = []  # (head tag, seq, user_id) of eligible users
+        self._seq = itertools.count()
+        self._virtual = 0.0
+        self.running = 0
+        self.queued = 0
+        self._service_ewma = 0.05  # seconds
+        self.admitted = self.completed = self.shed = self.rejected_user = self.expired = 0
+
+    # -------------------- Admission -------------------- #
+    def retry_after(self) -> int:
+        backlog = (self.queued + self.running) / max(self.slots, 1)
+        return max(1, math.ceil(backlog * self._service_ewma))
+
+    def _enqueue(self, user_id: str, deadline: float, cost: float) -> _Ticket:
+        if self.queued >= self.max_queued:
+            self.shed += 1
+            raise Overloaded("server is overloaded", self.retry_after())
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _User()
+        if len(user.queue) >= self.per_user_queue:
+            self.rejected_user += 1
+            raise UserQueueFull("too many requests queued for this user", self.retry_after())
+        weight = 1.0 if self.policy == "rr" else max(self.weight_of(user_id), 1e-6)
+        tag = max(self._virtual, user.last_tag) + cost / weight
+        user.last_tag = tag
+        ticket = _Ticket(user_id, tag, deadline, asyncio.get_running_loop().create_future())
+        user.queue.append(ticket)
+        self.queued += 1
+        self._make_eligible(user_id, user)
+        return ticket
+
+    def _make_eligible(self, user_id: str, user: _User):
+        if user.queue and not user.queued_in_heap and user.in_flight < self.per_user_inflight:
+            heapq.heappush(self._heap, (user.queue[0].tag, next(self._seq), user_id))
+            user.queued_in_heap = True
+
+    def _dispatch(self):
+        while self.running < self.slots and self._heap:
+            _, _, user_id = heapq.heappop(self._heap)
+            user = self._users[user_id]
+            user.queued_in_heap = False
+            ticket = user.queue.popleft()
+            self.queued -= 1
+            self._virtual = ticket.tag
+            user.in_flight += 1
+            self.running += 1
+            ticket.future.set_result(None)
+            self._make_eligible(user_id, user)
+
+    def _release(self, user_id: str, seconds: Optional[float] = None):
+        user = self._users[user_id]
+        user.in_flight -= 1
+        self.running -= 1
+        if seconds is not None:
+            self.completed += 1
+            self._service_ewma += 0.1 * (seconds - self._service_ewma)
+        self._make_eligible(user_id, user)
+        if not user.queue and not user.in_flight:
+            del self._users[user_id]
+        self._dispatch()
+
+    def _withdraw(self, ticket: _Ticket):
+        """Remove a ticket that was never granted (deadline hit or caller went away)."""
+        user = self._users.get(ticket.user_id)
+        if user is None or ticket not in user.queue:
+            return
+        was_head = user.queue[0] is ticket
+        user.queue.remove(ticket)
+        self.queued -= 1
+        if was_head and user.queued_in_heap:
+            # Rebuild the user's heap entry with the new head's tag.
+            self._heap = [e for e in self._heap if e[2] != ticket.user_id]
+            heapq.heapify(self._heap)
+            user.queued_in_heap = False
+            self._make_eligible(ticket.user_id, user)
+        if not user.queue and not user.in_flight:
+            del self._users[ticket.user_id]
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, deadline: Optional[float] = None, cost: float = 1.0):
+        """Wait for this user's turn; yields the remaining time budget in seconds."""
+        deadline = deadline or time.time() + DEFAULT_TIMEOUT
+        if deadline <= time.time():
+            self.expired += 1
+            raise DeadlineExceeded("request deadline already passed")
+        ticket = self._enqueue(user_id, deadline, cost)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), deadline - time.time())
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done():
+                self._release(user_id)  # granted just as we gave up: hand the slot on
+            else:
+                ticket.future.cancel()
+                self._withdraw(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                self.expired += 1
+                raise DeadlineExceeded("request deadline passed while queued")
+            raise
+
+        self.admitted += 1
+        start = time.monotonic()
+        try:
+            yield deadline - time.time()
+        finally:
+            self._release(user_id, time.monotonic() - start)
+
+    def status(self) -> dict:
+        return {
+            "policy": self.policy,
+            "slots": self.slots,
+            "running": self.running,
+            "queued": self.queued,
+            "active_users": len(self._users),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "shed": self.shed,
+            "rejected_user_queue": self.rejected_user,
+            "expired": self.expired,
+            "service_ewma_ms": round(self._service_ewma * 1000, 2),
+        }
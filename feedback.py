@@ -0,0 +1,220 @@
+"""
+Feedback rows linked to the chat turn they rate.
+
+Feedback used to copy the turn's question and answer text into its own row,
+so every rating stored the answer twice. Analytics could only group ratings
+by scanning and re-parsing that text. /chat now returns the turn id, and
+feedback stores it in feedback.turn_id, a foreign key into chat_history with
+its own index. A linked row keeps question and answer NULL; readers take the
+text from the turn through FEEDBACK_JOIN.
+
+Rating breakdowns come from primary-key joins:
+
+- per day: the feedback timestamp
+- per intent: chat_history.intent. Only rated turns are labelled, when
+  feedback first links to them, with the rule intent of the question
+  ("symptoms" for symptom reports, "other" otherwise).
+- per illness: answers.illness, the top illness of a diagnosis reply. It is
+  stored once per distinct answer when the answer is interned.
+
+Legacy clients that still post question/answer text are linked to the
+user's latest turn with that (user_id, question, answer). When no turn
+matches, the text is kept as before. `python feedback.py migrate` backfills
+links for existing rows the same way. Archiving materializes the text of
+linked rows before their turns leave chat_history.
+
+Usage:
+    python feedback.py migrate [--vacuum]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import answers
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+
+# SQL fragments for reading feedback with the text of its turn.
+FEEDBACK_JOIN = "feedback f LEFT JOIN chat_history ch ON ch.id = f.turn_id LEFT JOIN answers a ON a.id = ch.answer_id"
+FEEDBACK_COLUMNS = f"COALESCE(f.question, ch.question), f.answer, {answers.ANSWER_COLUMNS}"
+
+Counts = Dict[str, Tuple[int, int]]  # key -> (positive, negative)
+
+
+def migrate_schema(conn: sqlite3.Connection):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(feedback)")]
+    if "turn_id" not in columns:
+        conn.execute("ALTER TABLE feedback ADD COLUMN turn_id INTEGER REFERENCES chat_history(id)")
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_history)")]
+    if "intent" not in columns:
+        conn.execute("ALTER TABLE chat_history ADD COLUMN intent TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_turn ON feedback(turn_id)")
+
+
+def answer_text(copied: Optional[str], legacy: Optional[str], body: Optional[bytes],
+                codec: Optional[int]) -> Optional[str]:
+    """Answer of a feedback row selected with FEEDBACK_COLUMNS."""
+    return copied if copied is not None else answers.resolve(legacy, body, codec)
+
+
+def turn_intent(question: str) -> str:
+    # Imported here: the dialogue engine loads the knowledge base, and sharding imports this module.
+    from chatbot.src import dialogue_manager as dm
+
+    analysis = dm.analyze_message(question or "")
+    return analysis.intent or ("symptoms" if analysis.symptoms else "other")
+
+
+# -------------------- Linking -------------------- #
+def turn_owner(conn: sqlite3.Connection, turn_id: int) -> Optional[str]:
+    row = conn.execute("SELECT user_id FROM chat_history WHERE id=?", (turn_id,)).fetchone()
+    return row[0] if row else None
+
+
+def find_turn(conn: sqlite3.Connection, user_id: str, question: str, answer: str,
+              before: Optional[str] = None) -> Optional[int]:
+    """Latest turn of user_id with this question and answer (at or before `before`), via idx_chat_history_user."""
+    sql = (
+        f"SELECT ch.id FROM {answers.TURN_JOIN} WHERE ch.user_id = ? AND ch.question = ? "
+        "AND (a.hash = ? OR ch.answer = ?)"
+    )
+    args = [user_id, question, answers.answer_hash(answer), answer]
+    if before is not None:
+        sql += " AND ch.timestamp <= ?"
+        args.append(before)
+    row = conn.execute(sql + " ORDER BY ch.id DESC LIMIT 1", args).fetchone()
+    return row[0] if row else None
+
+
+def label_turns(conn: sqlite3.Connection, turn_ids: Iterable[int]):
+    """Store the intent of rated turns that don't have one yet (caller commits)."""
+    ids = sorted(set(turn_ids))
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT id, question FROM chat_history WHERE intent IS NULL AND id IN ({','.join('?' * len(part))})",
+            part,
+        ).fetchall()
+        conn.executemany("UPDATE chat_history SET intent=? WHERE id=?", [(turn_intent(q), i) for i, q in rows])
+
+
+def save(conn: sqlite3.Connection, user_id: str, rating: Optional[int], comment: str, turn_id: Optional[int] = None,
+         question: Optional[str] = None, answer: Optional[str] = None) -> Optional[int]:
+    """Insert one feedback row (caller holds the lock and commits); returns the linked turn id, if any."""
+    if turn_id is None and question is not None and answer is not None:
+        turn_id = find_turn(conn, user_id, question, answer)
+    if turn_id is not None:
+        question = answer = None
+        label_turns(conn, [turn_id])
+    conn.execute(
+        "INSERT INTO feedback(user_id, question, answer, rating, comment, turn_id) VALUES (?,?,?,?,?,?)",
+        (user_id, question, answer, rating, comment, turn_id),
+    )
+    return turn_id
+
+
+def materialize(conn: sqlite3.Connection, turn_ids: List[int]):
+    """Copy the turn text into feedback rows linked to turn_ids, before those turns are deleted (caller commits)."""
+    for i in range(0, len(turn_ids), 500):
+        part = turn_ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT f.id, {FEEDBACK_COLUMNS} FROM {FEEDBACK_JOIN} "
+            f"WHERE f.turn_id IN ({','.join('?' * len(part))}) AND f.question IS NULL",
+            part,
+        ).fetchall()
+        conn.executemany(
+            "UPDATE feedback SET question=?, answer=? WHERE id=?",
+            [(question, answer_text(*a), fid) for fid, question, *a in rows],
+        )
+
+
+# -------------------- Analytics -------------------- #
+def shard_stats(conn: sqlite3.Connection) -> Dict[str, Counts]:
+    """(positive, negative) ratings of one shard per day, per turn intent and per diagnosed illness."""
+    rated = "SUM(f.rating = 1), SUM(f.rating = 0)"
+    by_day = conn.execute(
+        f"SELECT DATE(f.timestamp), {rated} FROM feedback f WHERE f.rating IS NOT NULL GROUP BY DATE(f.timestamp)"
+    ).fetchall()
+    by_intent = conn.execute(
+        f"SELECT COALESCE(ch.intent, 'other'), {rated} FROM feedback f JOIN chat_history ch ON ch.id = f.turn_id "
+        "WHERE f.rating IS NOT NULL GROUP BY 1"
+    ).fetchall()
+    by_illness = conn.execute(
+        f"SELECT a.illness, {rated} FROM feedback f JOIN chat_history ch ON ch.id = f.turn_id "
+        "JOIN answers a ON a.id = ch.answer_id WHERE f.rating IS NOT NULL AND a.illness IS NOT NULL GROUP BY 1"
+    ).fetchall()
+    return {name: {key: (up, down) for key, up, down in rows}
+            for name, rows in (("by_day", by_day), ("by_intent", by_intent), ("by_illness", by_illness))}
+
+
+def merge_stats(parts: List[Dict[str, Counts]]) -> Dict[str, Dict[str, dict]]:
+    merged = {}
+    for name in ("by_day", "by_intent", "by_illness"):
+        totals = {}
+        for part in parts:
+            for key, (up, down) in part[name].items():
+                pos, neg = totals.get(key, (0, 0))
+                totals[key] = (pos + up, neg + down)
+        merged[name] = {key: {"positive": up, "negative": down} for key, (up, down) in sorted(totals.items())}
+    return merged
+
+
+# -------------------- Backfill -------------------- #
+def migrate_rows(conn: sqlite3.Connection, batch: int = 2000) -> Tuple[int, int]:
+    """Link feedback rows written before turn_id to their turns; returns (linked, unmatched)."""
+    answers.migrate_schema(conn)
+    migrate_schema(conn)
+    answers.label_illnesses(conn)
+    conn.commit()
+    linked = unmatched = 0
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, user_id, question, answer, timestamp FROM feedback "
+            "WHERE id > ? AND turn_id IS NULL AND question IS NOT NULL AND answer IS NOT NULL ORDER BY id LIMIT ?",
+            (last, batch),
+        ).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        links = []
+        for fid, user_id, question, answer, timestamp in rows:
+            turn_id = find_turn(conn, user_id, question, answer, timestamp)
+            if turn_id is None:
+                # Timestamps can disagree (clock changes, imported rows): fall back to the latest match.
+                turn_id = find_turn(conn, user_id, question, answer)
+            if turn_id is None:
+                unmatched += 1
+            else:
+                links.append((turn_id, fid))
+        with conn:
+            conn.executemany("UPDATE feedback SET turn_id=?, question=NULL, answer=NULL WHERE id=?", links)
+            label_turns(conn, [turn_id for turn_id, _ in links])
+        linked += len(links)
+    return linked, unmatched
+
+
+def main(argv=None):
+    from sharding import shard_paths
+
+    parser = argparse.ArgumentParser(description="Link feedback written before turn ids to its chat turns.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM each shard afterwards to return the space")
+    args = parser.parse_args(argv)
+
+    for path in shard_paths(args.db, args.shards):
+        conn = sqlite3.connect(path, timeout=30)
+        linked, unmatched = migrate_rows(conn)
+        if args.vacuum:
+            conn.execute("VACUUM")
+        conn.close()
+        print(f"{path}: {linked} feedback rows linked, {unmatched} without a matching turn", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
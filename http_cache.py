@@ -0,0 +1,91 @@
+"""
+Conditional GET support for read-mostly endpoints (/kb, /profile, /analytics).
+
+Each resource has a version counter that writers bump after committing.
+Counters live in a shared-memory array allocated at import, so with serve.py
+(which imports backend before forking) every worker sees every bump. ETags
+are built from the counter alone, so a matching If-None-Match is answered with
+304 before any database access. The epoch in the tag changes on restart,
+because counters start again from zero.
+
+Profiles share PROFILE_SLOTS counters by username hash; a collision only
+costs a client one unnecessary refetch.
+"""
+import gzip
+import multiprocessing
+import os
+import time
+import zlib
+from typing import Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+GZIP_MIN_BYTES = 1024
+PROFILE_SLOTS = 4096
+
+
+class Versions:
+    KB = 0
+    ANALYTICS = 1
+
+    def __init__(self, profile_slots: int = PROFILE_SLOTS):
+        self.profile_slots = profile_slots
+        self._counters = multiprocessing.RawArray("Q", 2 + profile_slots)
+        self._lock = multiprocessing.Lock()
+        self.epoch = f"{int(time.time()):x}{os.getpid():x}"
+
+    def profile_index(self, username: str) -> int:
+        return 2 + zlib.crc32(username.encode("utf-8")) % self.profile_slots
+
+    def bump(self, index: int):
+        with self._lock:
+            self._counters[index] += 1
+
+    def bump_profile(self, username: str):
+        self.bump(self.profile_index(username))
+
+    def etag(self, name: str, index: int) -> str:
+        return f'"{name}-{self.epoch}-{self._counters[index]}"'
+
+    def profile_version(self, username: str) -> int:
+        return self._counters[self.profile_index(username)]
+
+    def profile_etag(self, username: str) -> str:
+        return self.etag("profile", self.profile_index(username))
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    base = etag.strip('"')
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate.removeprefix("W/").strip('"')
+        # The gzip representation carries a "-gz" suffix on the same version.
+        if candidate in (base, base + "-gz"):
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str, cache_control: str) -> Optional[Response]:
+    """A 304 response if the client's copy is current, else None."""
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+
+def json_response(request: Request, payload, etag: str, cache_control: str) -> Response:
+    """orjson-encoded payload, gzipped when large and accepted by the client."""
+    body = orjson.dumps(payload)
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+        etag = etag[:-1] + '-gz"'
+    headers["ETag"] = etag
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,210 @@
+"""
+Bulk import/export of the kb table (admin Q/A pairs).
+
+Uploads are parsed incrementally (CSV with a header row, or JSONL), validated
+row by row, and upserted in chunks: each chunk is one transaction with one
+executemany for updates and one for inserts. Rows carrying an `id` update
+that entry; rows without one update the entry with the same question, or are
+inserted. Exports stream CSV or JSONL using keyset pagination, so no cursor is
+held open between chunks.
+"""
+import csv
+import io
+import json
+import sqlite3
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_ROWS = 1000
+MAX_QUESTION_CHARS = 1000
+MAX_ANSWER_CHARS = 20000
+MAX_REPORTED_ERRORS = 100
+FORMATS = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+# -------------------- Parsing -------------------- #
+class LineSplitter:
+    """Turns arbitrary byte chunks into complete text lines (keeps the newline)."""
+
+    def __init__(self):
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        data = self._tail + chunk
+        cut = data.rfind(b"\n") + 1
+        self._tail = data[cut:]
+        # Cutting at a newline byte never splits a UTF-8 sequence. Only b"\n" ends a
+        # line: str.splitlines would also break on U+2028, \x85 and friends,
+        # which JSONL exports (ensure_ascii=False) keep inside strings.
+        return [line + "\n" for line in data[:cut - 1].decode("utf-8").split("\n")] if cut else []
+
+    def close(self) -> List[str]:
+        tail, self._tail = self._tail, b""
+        return [tail.decode("utf-8")] if tail.strip() else []
+
+
+class RowParser:
+    """Incremental CSV/JSONL parser yielding (line_no, dict or error str)."""
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise BulkFormatError(f"format must be one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+        self.line_no = 0
+        self._pending = ""  # CSV record spanning lines (quoted newline)
+        self._pending_start = 0
+
+    def lines(self, lines: Iterable[str]) -> Iterator[Tuple[int, object]]:
+        for line in lines:
+            self.line_no += 1
+            if self.line_no == 1:
+                line = line.lstrip("\ufeff")
+            if self.fmt == "jsonl":
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield self.line_no, f"invalid JSON: {e}"
+                    continue
+                yield self.line_no, record if isinstance(record, dict) else "expected a JSON object"
+                continue
+
+            if not self._pending:
+                self._pending_start = self.line_no
+            self._pending += line
+            if self._pending.count('"') % 2:
+                continue  # inside a quoted field; wait for the rest of the record
+            record, self._pending = self._pending, ""
+            if not record.strip():
+                continue
+            fields = next(csv.reader([record]))
+            if self.header is None:
+                self.header = [h.strip().lower() for h in fields]
+                if "question" not in self.header or "answer" not in self.header:
+                    raise BulkFormatError("CSV header must contain question and answer columns")
+                continue
+            if len(fields) != len(self.header):
+                yield self._pending_start, f"expected {len(self.header)} fields, got {len(fields)}"
+                continue
+            yield self._pending_start, dict(zip(self.header, fields))
+
+    def finish(self) -> Iterator[Tuple[int, object]]:
+        if self._pending.strip():
+            yield self._pending_start, "unterminated quoted field"
+
+
+def validate(record: dict) -> Tuple[Optional[tuple], Optional[str]]:
+    """(id or None, question, answer) for a valid row, else an error message."""
+    question = record.get("question")
+    answer = record.get("answer")
+    if not isinstance(question, str) or not question.strip():
+        return None, "question is required"
+    if not isinstance(answer, str) or not answer.strip():
+        return None, "answer is required"
+    if len(question) > MAX_QUESTION_CHARS:
+        return None, f"question longer than {MAX_QUESTION_CHARS} characters"
+    if len(answer) > MAX_ANSWER_CHARS:
+        return None, f"answer longer than {MAX_ANSWER_CHARS} characters"
+    entry_id = record.get("id")
+    if entry_id in (None, ""):
+        entry_id = None
+    else:
+        try:
+            entry_id = int(entry_id)
+        except (TypeError, ValueError):
+            return None, "id must be an integer"
+    return (entry_id, question.strip(), answer.strip()), None
+
+
+# -------------------- Import -------------------- #
+class Summary:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.invalid = 0
+        self.chunks = 0
+        self.errors = []
+
+    def error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "invalid": self.invalid,
+            "chunks": self.chunks,
+            "errors": self.errors,
+        }
+
+
+def ensure_index(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kb_question ON kb(question)")
+
+
+def upsert_chunk(conn: sqlite3.Connection, rows: List[tuple]) -> Tuple[int, int]:
+    """Write one chunk in a single transaction; returns (inserted, updated)."""
+    # Last row wins when a chunk repeats an id or question.
+    by_id = {i: (q, a) for i, q, a in rows if i is not None}
+    by_question = {q: a for i, q, a in rows if i is None}
+
+    existing = {}
+    questions = list(by_question)
+    for start in range(0, len(questions), 500):
+        part = questions[start:start + 500]
+        existing.update(conn.execute(
+            f"SELECT question, MIN(id) FROM kb WHERE question IN ({', '.join('?' * len(part))}) GROUP BY question",
+            part,
+        ).fetchall())
+
+    known_ids = set()
+    if by_id:
+        ids = list(by_id)
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            known_ids.update(r[0] for r in conn.execute(
+                f"SELECT id FROM kb WHERE id IN ({', '.join('?' * len(part))})", part
+            ))
+
+    updates = [(q, a, i) for i, (q, a) in by_id.items() if i in known_ids]
+    updates += [(q, a, existing[q]) for q, a in by_question.items() if q in existing]
+    inserts = [(i, q, a) for i, (q, a) in by_id.items() if i not in known_ids]
+    inserts += [(None, q, a) for q, a in by_question.items() if q not in existing]
+
+    with conn:
+        if updates:
+            conn.executemany("UPDATE kb SET question=?, answer=? WHERE id=?", updates)
+        if inserts:
+            conn.executemany("INSERT INTO kb(id, question, answer) VALUES (?, ?, ?)", inserts)
+    return len(inserts), len(updates)
+
+
+# -------------------- Export -------------------- #
+def iter_export(fetch_page, fmt: str, page_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """fetch_page(after_id, limit) -> [(id, question, answer)]; yields encoded chunks."""
+    if fmt not in FORMATS:
+        raise BulkFormatError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "csv":
+        yield "\ufeffid,question,answer\n".encode("utf-8")
+    after = 0
+    while True:
+        rows = fetch_page(after, page_rows)
+        if not rows:
+            return
+        out = io.StringIO()
+        if fmt == "csv":
+            csv.writer(out, lineterminator="\n").writerows(rows)
+        else:
+            for i, q, a in rows:
+                out.write(json.dumps({"id": i, "question": q, "answer": a}, ensure_ascii=False) + "\n")
+        yield out.getvalue().encode("utf-8")
+        after = rows[-1][0]
@@ -0,0 +1,550 @@
+"""
+Registry of intent model versions, with routing between them.
+
+chatbot/models/registry.json lists every registered model:
+
+    "models":  {version: {kind, path, sha256, metrics, registered}}
+    "routing": {"default": version,
+                "split": [{"version": v, "percent": 10}, ...],
+                "by": "user" | "request",
+                "shadow": {"version": v, "percent": 100, "until": iso-timestamp} | null}
+
+Supported kinds:
+- sklearn: intent_model.pkl + vectorizer.pkl from intent_model.py
+- online: a checkpoint from online_intent.py
+- student: a directory written by chatbot/src/distill.py
+- distilbert: a directory written by intent_train.py, loaded with torch
+
+The checksum is verified whenever a model is loaded.
+
+Serving:
+- At most `capacity` models stay resident. The least recently used one is
+  evicted, and so is any model that routing no longer references.
+- A split sends `percent` of traffic to a version. The bucket is
+  crc32(user_id) % 100 with "by": "user", so a user keeps the same model,
+  or random per request with "by": "request".
+- A shadow version also runs on a sample of requests in a background
+  thread. Its answer is never returned; only its agreement with the
+  served model is counted. Shadowing stops at `until`, and the shadow
+  model is then unloaded.
+
+Metrics per version:
+- requests
+- latency histogram (also exported as stage "model:<version>" on /metrics)
+- mean confidence
+- share of low-confidence answers
+- shadow agreement, latency and mean confidence, counted apart from the
+  requests the version serves
+
+These are accuracy proxies, since live traffic has no labels.
+
+Usage:
+    python model_registry.py register online chatbot/models/online_intent/v0002
+    python model_registry.py register student chatbot/models/intent_student --version student-1
+    python model_registry.py route --default online-v0002 --split student-1:10 --by user
+    python model_registry.py shadow student-1 --percent 50 --hours 24
+    python model_registry.py list
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from chatbot.src import instrumentation
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_PATH = os.environ.get("WELLBOT_MODEL_REGISTRY", os.path.join(BASE_DIR, "chatbot", "models", "registry.json"))
+CAPACITY = int(os.environ.get("WELLBOT_MODEL_CAPACITY", 3))  # default + one split + one shadow
+TEST_PATH = os.path.join(BASE_DIR, "dataset", "test.csv")
+LOW_CONFIDENCE = 0.5
+
+
+class RegistryError(Exception):
+    pass
+
+
+# -------------------- Loaders -------------------- #
+# kind -> artifact files covered by the checksum (None: every file in the directory)
+ARTIFACTS = {
+    "sklearn": ["intent_model.pkl", "vectorizer.pkl"],
+    "online": ["model.joblib"],
+    "student": ["student.npz", "config.json", "label_map.json"],
+    "distilbert": None,
+}
+
+
+class SklearnModel:
+    def __init__(self, path: str):
+        with open(os.path.join(path, "intent_model.pkl"), "rb") as f:
+            self.model = pickle.load(f)
+        with open(os.path.join(path, "vectorizer.pkl"), "rb") as f:
+            self.vectorizer = pickle.load(f)
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        proba = self.model.predict_proba(self.vectorizer.transform(texts))
+        return [(str(self.model.classes_[p.argmax()]), float(p.max())) for p in proba]
+
+
+class OnlineModel:
+    def __init__(self, path: str):
+        import joblib
+        import online_intent
+
+        self.model = joblib.load(os.path.join(path, "model.joblib"))
+        self.model.sparsify()  # see online_intent.ModelHolder.refresh
+        self.vectorizer = online_intent.VECTORIZER
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        proba = self.model.predict_proba(self.vectorizer.transform(texts))
+        return [(str(self.model.classes_[p.argmax()]), float(p.max())) for p in proba]
+
+
+class StudentModelAdapter:
+    def __init__(self, path: str):
+        from chatbot.src.student_model import StudentModel
+
+        self.model = StudentModel.load(path)
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        return [self.model.predict_with_score(t) for t in texts]
+
+
+class DistilBertModel:
+    def __init__(self, path: str):
+        import torch
+        from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+        self.torch = torch
+        self.tokenizer = DistilBertTokenizerFast.from_pretrained(path)
+        self.model = DistilBertForSequenceClassification.from_pretrained(path)
+        self.model.eval()
+        with open(os.path.join(path, "label_map.json")) as f:
+            self.id2label = {int(v): k for k, v in json.load(f).items()}
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=64)
+        with self.torch.no_grad():
+            proba = self.model(**inputs).logits.softmax(dim=-1)
+        best = proba.argmax(dim=-1)
+        return [(self.id2label[int(i)], float(p[i])) for i, p in zip(best, proba)]
+
+
+LOADERS = {
+    "sklearn": SklearnModel,
+    "online": OnlineModel,
+    "student": StudentModelAdapter,
+    "distilbert": DistilBertModel,
+}
+
+
+def resolve_path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def artifact_files(kind: str, path: str) -> List[str]:
+    names = ARTIFACTS[kind]
+    if names is None:
+        names = sorted(n for n in os.listdir(path) if os.path.isfile(os.path.join(path, n)))
+    return names
+
+
+def checksum(kind: str, path: str) -> str:
+    digest = hashlib.sha256()
+    for name in artifact_files(kind, path):
+        digest.update(name.encode("utf-8") + b"\0")
+        with open(os.path.join(path, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_model(entry: dict):
+    path = resolve_path(entry["path"])
+    if checksum(entry["kind"], path) != entry["sha256"]:
+        raise RegistryError(f"checksum mismatch for {entry['path']}; re-register it")
+    return LOADERS[entry["kind"]](path)
+
+
+# -------------------- Manifest -------------------- #
+def read_manifest(path: str = REGISTRY_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"models": {}, "routing": {"default": None, "split": [], "by": "user", "shadow": None}}
+
+
+def write_manifest(manifest: dict, path: str = REGISTRY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def evaluate(model, path: str = TEST_PATH) -> float:
+    import pandas as pd
+
+    df = pd.read_csv(path).dropna()
+    predicted = [label for label, _ in model.predict(df["text"].astype(str).tolist())]
+    return sum(p == t for p, t in zip(predicted, df["intent"])) / len(df)
+
+
+def register(manifest: dict, kind: str, path: str, version: Optional[str] = None, run_eval: bool = True) -> str:
+    if kind not in LOADERS:
+        raise RegistryError(f"unknown kind {kind!r}; choose from {', '.join(LOADERS)}")
+    full = resolve_path(path)
+    rel = os.path.relpath(full, BASE_DIR)
+    path = full if rel.startswith("..") else rel
+    version = version or f"{kind}-{os.path.basename(os.path.normpath(full))}"
+    if version in manifest["models"]:
+        raise RegistryError(f"version {version} is already registered")
+    entry = {"kind": kind, "path": path, "sha256": checksum(kind, full), "metrics": {},
+             "registered": datetime.utcnow().isoformat(timespec="seconds")}
+    if run_eval:
+        entry["metrics"]["accuracy"] = round(evaluate(load_model(entry)), 4)
+    manifest["models"][version] = entry
+    if manifest["routing"]["default"] is None:
+        manifest["routing"]["default"] = version
+    return version
+
+
+# -------------------- Serving -------------------- #
+def active_shadow(routing: dict) -> Optional[dict]:
+    shadow = routing.get("shadow")
+    if shadow and shadow.get("until") and datetime.utcnow().isoformat() >= shadow["until"]:
+        return None
+    return shadow
+
+
+def referenced_versions(routing: dict) -> set:
+    """Versions that routing can send traffic to, including an unexpired shadow."""
+    versions = {routing.get("default")} | {s["version"] for s in routing.get("split", [])}
+    shadow = active_shadow(routing)
+    if shadow:
+        versions.add(shadow["version"])
+    versions.discard(None)
+    return versions
+
+
+class ModelCache:
+    """Keeps at most `capacity` loaded models; least recently used is evicted first."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, Future] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, version: str, entry: dict):
+        with self._lock:
+            model = self._models.get(version)
+            if model is not None:
+                self._models.move_to_end(version)
+                return model
+            # One load per cold version; its other callers wait on the Future, and
+            # requests for resident versions (served traffic during a shadow load) don't wait at all.
+            loading = self._loading.get(version)
+            owner = loading is None
+            if owner:
+                loading = self._loading[version] = Future()
+        if not owner:
+            return loading.result()
+        try:
+            model = load_model(entry)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[version]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[version]
+            self.loads += 1
+            self._models[version] = model
+            while len(self._models) > self.capacity:
+                self._models.popitem(last=False)
+                self.evictions += 1
+        loading.set_result(model)
+        return model
+
+    def retain(self, versions: set):
+        with self._lock:
+            for version in [v for v in self._models if v not in versions]:
+                del self._models[version]
+                self.evictions += 1
+
+    def resident(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+
+class VersionStats:
+    def __init__(self, version: str):
+        self.latency = instrumentation.histogram(f"model:{version}")
+        self.requests = 0
+        self.confidence_sum = 0.0
+        self.low_confidence = 0
+        # Shadow runs are kept apart so they never mix with the traffic this version serves.
+        self.shadow_latency = instrumentation.histogram(f"model:{version}:shadow")
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+        self.shadow_confidence_sum = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, us: int, confidence: float):
+        self.latency.record(us)
+        with self._lock:
+            self.requests += 1
+            self.confidence_sum += confidence
+            self.low_confidence += confidence < LOW_CONFIDENCE
+
+    def record_shadow(self, us: int, confidence: float, agreed: bool):
+        self.shadow_latency.record(us)
+        with self._lock:
+            self.shadow_compared += 1
+            self.shadow_agreed += agreed
+            self.shadow_confidence_sum += confidence
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            n = self.requests
+            out = {
+                "requests": n,
+                "p50_us": self.latency.percentile(0.5),
+                "p99_us": self.latency.percentile(0.99),
+                "mean_confidence": round(self.confidence_sum / n, 4) if n else None,
+                "low_confidence_rate": round(self.low_confidence / n, 4) if n else None,
+            }
+            if self.shadow_compared:
+                out["shadow_compared"] = self.shadow_compared
+                out["shadow_agreement"] = round(self.shadow_agreed / self.shadow_compared, 4)
+                out["shadow_p50_us"] = self.shadow_latency.percentile(0.5)
+                out["shadow_p99_us"] = self.shadow_latency.percentile(0.99)
+                out["shadow_mean_confidence"] = round(self.shadow_confidence_sum / self.shadow_compared, 4)
+            return out
+
+
+class Registry:
+    """Routes predictions between registered versions; re-reads registry.json when it changes."""
+
+    def __init__(self, path: str = REGISTRY_PATH, capacity: int = CAPACITY, check_seconds: float = 10.0):
+        self.path = path
+        self.check_seconds = check_seconds
+        self.cache = ModelCache(capacity)
+        self.manifest = read_manifest(path)
+        self.stats: Dict[str, VersionStats] = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        # One shadow worker and at most one queued comparison: shadowing never backs up requests.
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_slots = threading.BoundedSemaphore(2)
+        self.shadow_dropped = 0
+        self.refresh(force=True)
+
+    @property
+    def active(self) -> bool:
+        return self.manifest["routing"].get("default") is not None
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_seconds:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.manifest = read_manifest(self.path)
+        self.cache.retain(referenced_versions(self.manifest["routing"]))
+
+    def route(self, user_id: Optional[str] = None) -> str:
+        routing = self.manifest["routing"]
+        if routing.get("by", "user") == "user" and user_id is not None:
+            bucket = zlib.crc32(user_id.encode("utf-8")) % 100
+        else:
+            bucket = random.randrange(100)
+        edge = 0
+        for split in routing.get("split", []):
+            edge += split["percent"]
+            if bucket < edge:
+                return split["version"]
+        return routing["default"]
+
+    def _stats(self, version: str) -> VersionStats:
+        stats = self.stats.get(version)
+        if stats is None:
+            with self._lock:
+                stats = self.stats.setdefault(version, VersionStats(version))
+        return stats
+
+    def _timed_predict(self, version: str, text: str) -> Tuple[str, float, int]:
+        entry = self.manifest["models"].get(version)
+        if entry is None:
+            raise RegistryError(f"routing references unregistered version {version}")
+        model = self.cache.get(version, entry)
+        start = time.perf_counter_ns()
+        [(label, confidence)] = model.predict([text])
+        return label, confidence, (time.perf_counter_ns() - start) // 1000
+
+    def _run(self, version: str, text: str) -> Tuple[str, float]:
+        label, confidence, us = self._timed_predict(version, text)
+        self._stats(version).record(us, confidence)
+        return label, confidence
+
+    def _compare(self, version: str, text: str, served: str):
+        try:
+            label, confidence, us = self._timed_predict(version, text)
+            self._stats(version).record_shadow(us, confidence, label == served)
+        except Exception:
+            pass  # a broken shadow model must never affect serving
+        finally:
+            self._shadow_slots.release()
+
+    def predict(self, text: str, user_id: Optional[str] = None) -> dict:
+        self.refresh()
+        if not self.active:
+            raise LookupError("no model registered; see `python model_registry.py register`")
+        version = self.route(user_id)
+        label, confidence = self._run(version, text)
+
+        shadow = active_shadow(self.manifest["routing"])
+        if shadow and shadow["version"] != version and random.randrange(100) < shadow.get("percent", 100):
+            if self._shadow_slots.acquire(blocking=False):
+                self._shadow_pool.submit(self._compare, shadow["version"], text, label)
+            else:
+                self.shadow_dropped += 1
+        return {"intent": label, "confidence": confidence, "model_version": version}
+
+    def predict_batch(self, texts: List[str], user_id: Optional[str] = None) -> List[dict]:
+        """predict() for many texts: one model call per routed version, no shadow comparisons."""
+        self.refresh()
+        if not self.active:
+            raise LookupError("no model registered; see `python model_registry.py register`")
+        groups: Dict[str, List[int]] = {}
+        for i in range(len(texts)):
+            groups.setdefault(self.route(user_id), []).append(i)
+        results: List[dict] = [None] * len(texts)
+        for version, idx in groups.items():
+            entry = self.manifest["models"].get(version)
+            if entry is None:
+                raise RegistryError(f"routing references unregistered version {version}")
+            model = self.cache.get(version, entry)
+            start = time.perf_counter_ns()
+            predictions = model.predict([texts[i] for i in idx])
+            per_text_us = (time.perf_counter_ns() - start) // 1000 // len(idx)
+            stats = self._stats(version)
+            for i, (label, confidence) in zip(idx, predictions):
+                stats.record(per_text_us, confidence)
+                results[i] = {"intent": label, "confidence": confidence, "model_version": version}
+        return results
+
+    def status(self) -> dict:
+        self.refresh()
+        return {
+            "routing": self.manifest["routing"],
+            "models": {
+                version: dict(entry, stats=self._stats(version).as_dict() if version in self.stats else None)
+                for version, entry in self.manifest["models"].items()
+            },
+            "resident": self.cache.resident(),
+            "capacity": self.cache.capacity,
+            "loads": self.cache.loads,
+            "evictions": self.cache.evictions,
+            "shadow_dropped": self.shadow_dropped,
+        }
+
+
+# -------------------- CLI -------------------- #
+def parse_split(value: str) -> dict:
+    version, _, percent = value.rpartition(":")
+    if not version:
+        raise argparse.ArgumentTypeError("expected VERSION:PERCENT")
+    return {"version": version, "percent": int(percent)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intent model registry: register versions and route traffic.")
+    parser.add_argument("--registry", default=REGISTRY_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_reg = sub.add_parser("register", help="add a model version (checksummed, evaluated on test.csv)")
+    p_reg.add_argument("kind", choices=list(LOADERS))
+    p_reg.add_argument("path", help="artifact directory")
+    p_reg.add_argument("--version", help="default: <kind>-<directory name>")
+    p_reg.add_argument("--no-eval", action="store_true")
+    p_route = sub.add_parser("route", help="set the default version and traffic split")
+    p_route.add_argument("--default")
+    p_route.add_argument("--split", type=parse_split, action="append", default=None, help="VERSION:PERCENT")
+    p_route.add_argument("--clear-split", action="store_true")
+    p_route.add_argument("--by", choices=["user", "request"])
+    p_shadow = sub.add_parser("shadow", help="shadow-test a version on live traffic")
+    p_shadow.add_argument("version", nargs="?")
+    p_shadow.add_argument("--percent", type=int, default=100)
+    p_shadow.add_argument("--hours", type=float, default=24.0)
+    p_shadow.add_argument("--stop", action="store_true")
+    p_rm = sub.add_parser("remove", help="unregister a version (must not be routed)")
+    p_rm.add_argument("version")
+    sub.add_parser("list", help="registered versions and routing")
+    args = parser.parse_args(argv)
+
+    manifest = read_manifest(args.registry)
+    models, routing = manifest["models"], manifest["routing"]
+    try:
+        if args.command == "register":
+            version = register(manifest, args.kind, args.path, args.version, not args.no_eval)
+            print(f"registered {version}: {models[version]['metrics']}", file=sys.stderr)
+        elif args.command == "route":
+            if args.default:
+                routing["default"] = args.default
+            if args.clear_split:
+                routing["split"] = []
+            if args.split is not None:
+                routing["split"] = args.split
+            if args.by:
+                routing["by"] = args.by
+            for version in [routing["default"]] + [s["version"] for s in routing["split"]]:
+                if version not in models:
+                    raise RegistryError(f"unknown version {version}")
+            if sum(s["percent"] for s in routing["split"]) > 100:
+                raise RegistryError("split percentages add up to more than 100")
+        elif args.command == "shadow":
+            if args.stop:
+                routing["shadow"] = None
+            else:
+                if args.version not in models:
+                    raise RegistryError(f"unknown version {args.version}")
+                until = datetime.utcnow() + timedelta(hours=args.hours)
+                routing["shadow"] = {"version": args.version, "percent": args.percent,
+                                     "until": until.isoformat(timespec="seconds")}
+        elif args.command == "remove":
+            if args.version in referenced_versions(routing):
+                raise RegistryError(f"{args.version} is still routed; change routing first")
+            models.pop(args.version, None)
+        else:
+            for version, entry in models.items():
+                mark = "*" if version == routing["default"] else " "
+                print(f"{mark} {version:24s} {entry['kind']:10s} {entry['sha256'][:12]}  {entry['metrics']}  {entry['path']}")
+            print(json.dumps(routing, indent=2))
+            return
+    except RegistryError as e:
+        parser.error(str(e))
+    write_manifest(manifest, args.registry)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Stateless batch analysis of texts: language, intent, symptoms, entities and illness candidates.
+
+/chat answers one message at a time. It also moves the user's session along
+and writes chat_history, so it cannot be used to score a dataset. analyze()
+takes a list of texts and leaves no trace:
+
+- language, rule-based intent, entities and symptoms come from the
+  dialogue engine's message analyzer, so the results agree with /chat
+- the intent model runs once per batch (one vectorize + predict_proba
+  over all texts), through the model registry when one is configured,
+  else the promoted online_intent checkpoint
+- illness candidates are scored through the symptom -> illness index
+  instead of a pass over the whole knowledge base per text
+
+A rule match wins over the model, because rule intents are the ones the
+dialogue engine acts on; intent_source says which one answered. If no
+model is available, texts without a rule match get intent null.
+
+Usage:
+    python nlu.py texts.txt > analysis.ndjson       # one text per line; "-" or no file reads stdin
+    python nlu.py --jsonl texts.jsonl --field text  # JSONL input
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+
+from chatbot.src import dialogue_manager as dm
+
+MAX_BATCH = int(os.environ.get("WELLBOT_NLU_MAX_BATCH", 5000))
+CHUNK_TEXTS = int(os.environ.get("WELLBOT_NLU_CHUNK", 500))
+TOP_K = 3
+
+IntentPredictor = Callable[[List[str]], List[dict]]
+
+
+# -------------------- Intent model -------------------- #
+def model_intents(registry, holder) -> IntentPredictor:
+    """Batch intent predictor over a model_registry.Registry, falling back to an online_intent.ModelHolder."""
+
+    def predict(texts: List[str], user_id: Optional[str] = None) -> List[dict]:
+        registry.refresh()
+        if registry.active:
+            return registry.predict_batch(texts, user_id)
+        predictions = holder.predict(texts)
+        version = holder.version
+        return [{"intent": label, "confidence": confidence, "model_version": version}
+                for label, confidence in predictions]
+
+    return predict
+
+
+# -------------------- Illness candidates -------------------- #
+_kb_order = (None, {})
+
+
+def _illness_order() -> Dict[str, int]:
+    """KB position of each illness; ties are broken the way detect_possible_illnesses orders them."""
+    global _kb_order
+    kb, order = _kb_order
+    if kb is not dm.KB:  # use_kb() swapped the knowledge base
+        order = {illness: i for i, illness in enumerate(dm.KB)}
+        _kb_order = (dm.KB, order)
+    return order
+
+
+def top_illnesses(symptoms: List[str], k: int = TOP_K) -> List[dict]:
+    counts = Counter()
+    index = dm.SYMPTOM_TO_ILLNESSES
+    for s in symptoms:
+        counts.update(index.get(s, ()))
+    order = _illness_order()
+    best = sorted(counts.items(), key=lambda item: (-item[1], order.get(item[0], 0)))[:k]
+    return [{"illness": illness, "matched": n} for illness, n in best]
+
+
+# -------------------- Analysis -------------------- #
+def analyze(texts: List[str], predict_intents: Optional[IntentPredictor] = None, top_k: int = TOP_K,
+            user_id: Optional[str] = None) -> List[dict]:
+    intents: List[Optional[dict]] = [None] * len(texts)
+    if predict_intents is not None and texts:
+        try:
+            intents = predict_intents(texts, user_id)
+        except LookupError:
+            pass  # no model yet: rule-based intents only
+
+    results = []
+    for text, model in zip(texts, intents):
+        analysis = dm.analyze_message(text)
+        if analysis.intent is not None:
+            intent = {"intent": analysis.intent, "intent_source": "rules", "confidence": None, "model_version": None}
+        elif model is not None:
+            intent = {"intent": model["intent"], "intent_source": "model",
+                      "confidence": round(model["confidence"], 4), "model_version": model["model_version"]}
+        else:
+            intent = {"intent": None, "intent_source": None, "confidence": None, "model_version": None}
+        results.append({
+            "text": text,
+            "language": analysis.language,
+            **intent,
+            "symptoms": analysis.symptoms,
+            "entities": analysis.entities,
+            "illnesses": top_illnesses(analysis.symptoms, top_k) if top_k else [],
+        })
+    return results
+
+
+def ndjson(results: Iterable[dict]) -> bytes:
+    return b"".join(orjson.dumps(r) + b"\n" for r in results)
+
+
+# -------------------- CLI -------------------- #
+def read_texts(lines: Iterable[str], field: Optional[str]) -> Iterator[str]:
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        yield str(json.loads(line)[field]) if field else line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch NLU: write one JSON analysis per input text.")
+    parser.add_argument("input", nargs="?", default="-", help="text file, one text per line (default: stdin)")
+    parser.add_argument("--jsonl", action="store_true", help="input lines are JSON objects")
+    parser.add_argument("--field", default="text", help="JSON field holding the text (with --jsonl)")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--chunk", type=int, default=CHUNK_TEXTS, help="texts per model call")
+    parser.add_argument("--no-model", action="store_true", help="rule-based intents only")
+    args = parser.parse_args(argv)
+
+    predict = None
+    if not args.no_model:
+        import model_registry
+        import online_intent
+        predict = model_intents(model_registry.Registry(), online_intent.ModelHolder())
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout.buffer
+    try:
+        batch = []
+        for text in read_texts(source, args.field if args.jsonl else None):
+            batch.append(text)
+            if len(batch) >= args.chunk:
+                out.write(ndjson(analyze(batch, predict, args.top_k)))
+                batch = []
+        if batch:
+            out.write(ndjson(analyze(batch, predict, args.top_k)))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Online variant of the intent model in intent_model.py.
+
+HashingVectorizer has no vocabulary to refit and SGDClassifier learns with
+partial_fit, so new examples are streamed in chunks on top of the latest
+checkpoint instead of retraining on the whole dataset. Every run writes a
+new versioned checkpoint:
+
+    chatbot/models/online_intent/v0003/model.joblib
+    chatbot/models/online_intent/v0003/manifest.json   (parent, accuracy, rows, sources, watermark)
+    chatbot/models/online_intent/CURRENT                (the promoted version)
+
+A checkpoint is promoted only if its accuracy on the held-out set is at
+least the current checkpoint's on the same set (minus --tolerance). The
+backend's ModelHolder watches CURRENT and swaps the new model in without a
+restart.
+
+The held-out set is the distinct sentences of dataset/train.csv and
+dataset/test.csv (test.csv only repeats train.csv sentences) whose hash
+falls in the first HOLDOUT_SHARE of the hash space. Rows with one of those
+sentences are never trained on, from any source, so the gate measures
+unseen text.
+
+Feedback rows become training examples only when an admin wrote the
+correct label into the comment ("intent:sleep_issue"). A thumbs up is not
+a label: learning the model's own prediction from it would reinforce its
+mistakes. The per-shard feedback watermark is stored in the manifest, so
+every row is learned once.
+
+Usage:
+    python online_intent.py train --csv dataset/train.csv --epochs 5
+    python online_intent.py update --csv new_examples.csv
+    python online_intent.py update --feedback
+    python online_intent.py eval [--version v0002]
+    python online_intent.py list
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, Set, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from sharding import shard_paths
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.environ.get("WELLBOT_INTENT_MODEL_DIR", os.path.join(BASE_DIR, "chatbot", "models", "online_intent"))
+TRAIN_PATH = os.path.join(BASE_DIR, "dataset", "train.csv")
+TEST_PATH = os.path.join(BASE_DIR, "dataset", "test.csv")
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+
+CHUNK_ROWS = 1000
+N_FEATURES = 2 ** 18
+LABEL_PREFIX = "intent:"
+HOLDOUT_SHARE = 0.2
+
+# Fixed feature space: every checkpoint of a lineage must hash the same way.
+VECTORIZER = HashingVectorizer(
+    n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False, norm="l2", lowercase=True
+)
+
+
+# -------------------- Checkpoints -------------------- #
+def version_dir(version: str) -> str:
+    return os.path.join(MODEL_DIR, version)
+
+
+def list_versions() -> List[str]:
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    return sorted(v for v in os.listdir(MODEL_DIR) if v.startswith("v") and os.path.isdir(version_dir(v)))
+
+
+def current_version() -> Optional[str]:
+    try:
+        with open(os.path.join(MODEL_DIR, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(version: str):
+    tmp = os.path.join(MODEL_DIR, "CURRENT.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(MODEL_DIR, "CURRENT"))
+
+
+def load_checkpoint(version: str) -> Tuple[SGDClassifier, dict]:
+    with open(os.path.join(version_dir(version), "manifest.json")) as f:
+        manifest = json.load(f)
+    return joblib.load(os.path.join(version_dir(version), "model.joblib")), manifest
+
+
+def save_checkpoint(model: SGDClassifier, manifest: dict) -> str:
+    versions = list_versions()
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+    tmp = version_dir(version) + ".tmp"
+    os.makedirs(tmp)
+    joblib.dump(model, os.path.join(tmp, "model.joblib"))
+    manifest = dict(manifest, version=version, created=datetime.utcnow().isoformat(timespec="seconds"))
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, version_dir(version))
+    return version
+
+
+# -------------------- Data sources -------------------- #
+def csv_labels(path: str) -> List[str]:
+    return sorted(pd.read_csv(path, usecols=["intent"])["intent"].dropna().unique())
+
+
+def iter_csv_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[List[str], List[str]]]:
+    for chunk in pd.read_csv(path, usecols=["text", "intent"], chunksize=chunk_rows):
+        chunk = chunk.dropna()
+        yield chunk["text"].astype(str).tolist(), chunk["intent"].astype(str).tolist()
+
+
+def iter_feedback_chunks(db_path: str, shard_count: int, marks: List[int],
+                         chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[List[str], List[str]]]:
+    """Admin-labeled examples from feedback rows above `marks`; advances marks in place."""
+    for shard_no, path in enumerate(shard_paths(db_path, shard_count)):
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        try:
+            cursor = conn.execute(
+                "SELECT f.id, COALESCE(f.question, ch.question), f.comment FROM feedback f "
+                "LEFT JOIN chat_history ch ON ch.id = f.turn_id WHERE f.id > ? ORDER BY f.id",
+                (marks[shard_no],),
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                marks[shard_no] = rows[-1][0]
+                texts, labels = [], []
+                for _, question, comment in rows:
+                    comment = (comment or "").strip()
+                    if question and comment.lower().startswith(LABEL_PREFIX):
+                        texts.append(question)
+                        labels.append(comment[len(LABEL_PREFIX):].strip())
+                if texts:
+                    yield texts, labels
+        finally:
+            conn.close()
+
+
+# -------------------- Held-out set -------------------- #
+def normalize(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def is_heldout(text: str) -> bool:
+    digest = hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=8).digest()
+    return digest[0] < 256 * HOLDOUT_SHARE
+
+
+def heldout_examples(paths: Tuple[str, ...] = (TRAIN_PATH, TEST_PATH)) -> Tuple[List[str], List[str]]:
+    """One (text, intent) per distinct held-out sentence of the dataset CSVs."""
+    seen = {}
+    for path in paths:
+        for texts, labels in iter_csv_chunks(path):
+            for text, label in zip(texts, labels):
+                key = normalize(text)
+                if key not in seen and is_heldout(key):
+                    seen[key] = (text, label)
+    return [t for t, _ in seen.values()], [y for _, y in seen.values()]
+
+
+def heldout_keys() -> Set[str]:
+    return {normalize(text) for text in heldout_examples()[0]}
+
+
+# -------------------- Training / evaluation -------------------- #
+def new_model() -> SGDClassifier:
+    return SGDClassifier(loss="log_loss", alpha=1e-5, random_state=0)
+
+
+def partial_fit_chunks(model: SGDClassifier, chunks, classes: List[str],
+                       exclude: Optional[Set[str]] = None) -> Tuple[int, int]:
+    """Stream chunks into the model; rows with labels outside `classes` or text in `exclude` are skipped."""
+    known = set(classes)
+    exclude = exclude or set()
+    learned = skipped = 0
+    for texts, labels in chunks:
+        keep = [i for i, label in enumerate(labels) if label in known and normalize(texts[i]) not in exclude]
+        skipped += len(labels) - len(keep)
+        if not keep:
+            continue
+        X = VECTORIZER.transform([texts[i] for i in keep])
+        y = np.array([labels[i] for i in keep])
+        model.partial_fit(X, y, classes=np.array(classes))
+        learned += len(keep)
+    return learned, skipped
+
+
+def evaluate(model: SGDClassifier, path: Optional[str] = None) -> float:
+    """Accuracy on the held-out set, or on every row of the CSV at `path`."""
+    chunks = iter_csv_chunks(path) if path else [heldout_examples()]
+    correct = total = 0
+    for texts, labels in chunks:
+        if not texts:
+            continue
+        predicted = model.predict(VECTORIZER.transform(texts))
+        correct += int((predicted == np.array(labels)).sum())
+        total += len(labels)
+    return correct / total if total else 0.0
+
+
+def run_update(csv_paths: List[str], feedback: bool, base: Optional[str], epochs: int, tolerance: float,
+               db_path: str = DEFAULT_DB, shard_count: int = 1) -> dict:
+    """Train on top of `base` (or from scratch when base is None), checkpoint, gate, maybe promote."""
+    if base:
+        model, parent = load_checkpoint(base)
+        classes = parent["classes"]
+        marks = [int(m) for m in parent.get("feedback_watermark", "").split(",") if m] or [0] * shard_count
+        if len(marks) != shard_count:
+            raise SystemExit(f"{base} was trained against {len(marks)} shard(s); WELLBOT_SHARDS={shard_count}")
+    else:
+        model, parent = new_model(), {}
+        classes = sorted(set().union(*(csv_labels(p) for p in csv_paths))) if csv_paths else []
+        marks = [0] * shard_count
+    if not classes:
+        raise SystemExit("no classes: train from a CSV first")
+
+    learned = skipped = 0
+    sources = []
+    exclude = heldout_keys()
+    for path in csv_paths:
+        for _ in range(epochs):
+            l, s = partial_fit_chunks(model, iter_csv_chunks(path), classes, exclude)
+            learned, skipped = learned + l, skipped + s
+        sources.append(os.path.relpath(path, BASE_DIR))
+    if feedback:
+        l, s = partial_fit_chunks(model, iter_feedback_chunks(db_path, shard_count, marks), classes, exclude)
+        learned, skipped = learned + l, skipped + s
+        sources.append("feedback")
+    if not learned:
+        return {"version": None, "learned": 0, "skipped": skipped, "promoted": False}
+
+    accuracy = evaluate(model)
+    version = save_checkpoint(model, {
+        "parent": base,
+        "classes": classes,
+        "accuracy": round(accuracy, 4),
+        "learned_rows": learned,
+        "total_rows": parent.get("total_rows", 0) + learned,
+        "skipped_rows": skipped,
+        "sources": sources,
+        "feedback_watermark": ",".join(str(m) for m in marks),
+        "n_features": N_FEATURES,
+        "holdout_share": HOLDOUT_SHARE,
+    })
+
+    # Re-scored rather than read from its manifest: older checkpoints were scored on test.csv.
+    current = current_version()
+    baseline = evaluate(load_checkpoint(current)[0]) if current else 0.0
+    promoted = accuracy >= baseline - tolerance
+    if promoted:
+        set_current(version)
+    return {"version": version, "learned": learned, "skipped": skipped, "accuracy": accuracy,
+            "baseline": baseline, "promoted": promoted}
+
+
+# -------------------- Serving -------------------- #
+class ModelHolder:
+    """The promoted model for serving; re-reads CURRENT at most every `check_seconds` and hot-swaps."""
+
+    def __init__(self, check_seconds: float = 10.0):
+        self.check_seconds = check_seconds
+        self.version: Optional[str] = None
+        self.model: Optional[SGDClassifier] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_seconds:
+            return
+        with self._lock:
+            self._checked = now
+            version = current_version()
+            if version and version != self.version:
+                model, _ = load_checkpoint(version)
+                # Serving only: sparse coef_ makes each prediction a sparse-sparse product instead
+                # of a pass over the dense (classes x 2^18) matrix. Checkpoints stay dense for training.
+                model.sparsify()
+                # Single assignment of the pair: readers see old or new, never a mix.
+                self.model, self.version = model, version
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        self.refresh()
+        model = self.model
+        if model is None:
+            raise LookupError("no promoted intent model; run `python online_intent.py train` first")
+        proba = model.predict_proba(VECTORIZER.transform(texts))
+        best = proba.argmax(axis=1)
+        return [(str(model.classes_[i]), float(p[i])) for i, p in zip(best, proba)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental intent model with versioned checkpoints.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("train", "update"):
+        p = sub.add_parser(name, help="train from scratch" if name == "train" else "continue from CURRENT")
+        p.add_argument("--csv", action="append", default=[], help="CSV with text,intent columns (repeatable)")
+        p.add_argument("--epochs", type=int, default=5 if name == "train" else 1, help="passes over each CSV")
+        p.add_argument("--tolerance", type=float, default=0.0, help="allowed accuracy drop for promotion")
+        if name == "update":
+            p.add_argument("--feedback", action="store_true", help="learn from new feedback rows")
+            p.add_argument("--base", help="checkpoint to continue from (default: CURRENT)")
+        p.add_argument("--db", default=DEFAULT_DB)
+        p.add_argument("--shards", type=int, default=int(os.environ.get("WELLBOT_SHARDS", 1)))
+    p_eval = sub.add_parser("eval", help="accuracy of a checkpoint on the held-out set")
+    p_eval.add_argument("--version")
+    p_eval.add_argument("--test", help="score every row of this CSV instead")
+    p_prom = sub.add_parser("promote", help="make a checkpoint current without the accuracy gate")
+    p_prom.add_argument("version")
+    sub.add_parser("list", help="list checkpoints")
+    args = parser.parse_args(argv)
+
+    if args.command in ("train", "update"):
+        if args.command == "train":
+            csv_paths, feedback, base = args.csv or [TRAIN_PATH], False, None
+        else:
+            csv_paths, feedback, base = args.csv, args.feedback, args.base or current_version()
+            if not base:
+                parser.error("nothing to update; run train first")
+            if not csv_paths and not feedback:
+                parser.error("give --csv and/or --feedback")
+        result = run_update(csv_paths, feedback, base, args.epochs, args.tolerance, args.db, args.shards)
+        if result["version"] is None:
+            print(f"nothing new to learn ({result['skipped']} rows skipped)", file=sys.stderr)
+        else:
+            verdict = "promoted" if result["promoted"] else "NOT promoted (accuracy dropped)"
+            print(f"{result['version']}: learned {result['learned']} rows, skipped {result['skipped']}; "
+                  f"accuracy {result['accuracy']:.4f} vs current {result['baseline']:.4f} -> {verdict}",
+                  file=sys.stderr)
+            if not result["promoted"]:
+                sys.exit(1)
+    elif args.command == "eval":
+        version = args.version or current_version()
+        if not version:
+            parser.error("no checkpoint")
+        print(f"{version}: accuracy {evaluate(load_checkpoint(version)[0], args.test):.4f}")
+    elif args.command == "promote":
+        if args.version not in list_versions():
+            parser.error(f"unknown version {args.version}")
+        set_current(args.version)
+    else:
+        current = current_version()
+        for version in list_versions():
+            manifest = load_checkpoint(version)[1]
+            mark = "*" if version == current else " "
+            print(f"{mark} {version}  acc={manifest['accuracy']:.4f}  rows={manifest['total_rows']}  "
+                  f"parent={manifest['parent']}  sources={','.join(manifest['sources'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+wellbot-replay: run scripted conversations through get_bot_reply in bulk.
+
+Input is JSONL or CSV. JSONL lines are either single turns
+    {"user_id": "u1", "message": "I have fever"}
+or whole conversations
+    {"user_id": "u1", "messages": ["hello", "I have fever", "and cough"]}
+CSV needs user_id and message columns. An optional conversation_id splits one
+user's turns into several conversations; otherwise each user_id is one
+conversation, replayed in file order.
+
+Conversations are sharded by a stable hash of user_id over worker processes.
+Each worker loads the knowledge base(s) once, replays every conversation with
+a fresh session (seeded per conversation so reply wording is reproducible)
+and streams results back; the parent writes them to --out as JSONL. With
+--compare-kb every conversation is replayed against both KB files and the
+differing diagnoses are reported.
+
+Usage:
+    ./wellbot-replay conversations.jsonl --out results.jsonl --workers 8
+    ./wellbot-replay conversations.csv --kb old_kb.json --compare-kb new_kb.json --out diff.jsonl
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import sys
+import time
+import zlib
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+EN_DIAGNOSIS = re.compile(r"\*\*Possible conditions:\*\* (.+)")
+HI_DIAGNOSIS = re.compile(r"संभावित बीमारियां: (.+)")
+_DONE = None
+
+
+# --- Input ---
+def read_conversations(path: str) -> "OrderedDict[tuple, list]":
+    """Group input turns into {(user_id, conversation_id): [messages]} preserving order."""
+    conversations = OrderedDict()
+
+    def add(row, messages):
+        user_id = str(row["user_id"])
+        key = (user_id, str(row.get("conversation_id") or user_id))
+        conversations.setdefault(key, []).extend(messages)
+
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                add(row, [row["message"]])
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                add(row, row["messages"] if "messages" in row else [row["message"]])
+    return conversations
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+
+def extract_diagnosis(reply: str) -> list:
+    m = EN_DIAGNOSIS.search(reply) or HI_DIAGNOSIS.search(reply)
+    return [s.strip() for s in m.group(1).split(",")] if m else []
+
+
+# --- Worker ---
+def replay_conversation(dm, session_key: str, messages: list) -> dict:
+    random.seed(session_key)
+    dm.user_sessions.pop(session_key, None)
+    replies, diagnoses = [], []
+    for msg in messages:
+        msg = msg.strip()
+        if not msg:
+            continue
+        reply = dm.get_bot_reply(user_id=session_key, user_message=msg)
+        replies.append(reply)
+        diagnosis = extract_diagnosis(reply)
+        if diagnosis:
+            diagnoses.append(diagnosis)
+    dm.user_sessions.pop(session_key, None)
+    return {"replies": replies, "diagnoses": diagnoses}
+
+
+def worker(shard: int, conversations: list, kb_paths: list, results):
+    from chatbot.src import dialogue_manager as dm
+    from chatbot.src.knowledge_base import load_kb
+
+    # Load (and index) every KB version once per worker.
+    kbs = []
+    for path in kb_paths:
+        kb = load_kb(path) if path else dm.KB
+        kbs.append((kb, dm.build_symptom_index(kb)))
+
+    try:
+        for (user_id, conversation_id), messages in conversations:
+            # Sessions are keyed per conversation so nothing leaks between them.
+            session_key = f"replay:{user_id}:{conversation_id}"
+            record = {"user_id": user_id, "conversation_id": conversation_id, "turns": len(messages)}
+            runs = []
+            for kb, index in kbs:
+                dm.use_kb(kb, index)
+                try:
+                    runs.append(replay_conversation(dm, session_key, messages))
+                except Exception as e:
+                    runs.append({"error": repr(e), "replies": [], "diagnoses": []})
+            record.update(runs[0])
+            if len(runs) > 1:
+                record["compare"] = runs[1]
+                record["diagnosis_changed"] = runs[0]["diagnoses"] != runs[1]["diagnoses"]
+            results.put(record)
+    finally:
+        results.put(_DONE)
+
+
+# --- Driver ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="wellbot-replay", description="Replay scripted conversations in bulk.")
+    parser.add_argument("input", help="conversations as .jsonl or .csv")
+    parser.add_argument("--out", default="-", help="output JSONL (default: stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--kb", help="knowledge base JSON (default: chatbot/src/knowledge_base.json)")
+    parser.add_argument("--compare-kb", help="second knowledge base JSON to diff diagnoses against")
+    args = parser.parse_args(argv)
+
+    conversations = read_conversations(args.input)
+    shards = [[] for _ in range(max(1, args.workers))]
+    for key, messages in conversations.items():
+        shards[shard_of(key[0], len(shards))].append((key, messages))
+    shards = [s for s in shards if s]
+
+    kb_paths = [args.kb]
+    if args.compare_kb:
+        kb_paths.append(args.compare_kb)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue(maxsize=10000)
+    procs = [ctx.Process(target=worker, args=(i, s, kb_paths, results), daemon=True) for i, s in enumerate(shards)]
+
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    done = replayed = turns = changed = errors = 0
+    try:
+        while done < len(procs):
+            try:
+                record = results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    break  # a worker died without reporting; don't wait forever
+                continue
+            if record is _DONE:
+                done += 1
+                continue
+            replayed += 1
+            turns += record["turns"]
+            changed += bool(record.get("diagnosis_changed"))
+            errors += "error" in record or "error" in record.get("compare", {})
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        for p in procs:
+            p.join()
+    elapsed = time.perf_counter() - start
+
+    summary = (
+        f"replayed {replayed} conversations ({turns} turns) on {len(procs)} workers in {elapsed:.2f}s: "
+        f"{replayed / elapsed:.1f} conversations/s, {turns / elapsed:.1f} turns/s"
+    )
+    if args.compare_kb:
+        summary += f"; diagnosis changed in {changed}"
+    if errors:
+        summary += f"; {errors} conversation(s) raised errors"
+    print(summary, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Offline resharding of the per-user tables (profiles, chat_history, feedback).
+
+Reads the shard count recorded in users.db, copies every row into staging
+files laid out for the new count (routed by the same crc32 hash the backend
+uses), then swaps them in and records the new count. Stop the backend first;
+the old shard files are kept as *.bak.
+
+Usage:
+    python reshard.py --to 4
+    python reshard.py --to 1          # fold everything back into users.db
+    WELLBOT_DB=/data/users.db python reshard.py --to 8
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+import answers
+import feedback
+from sharding import (
+    USER_SCHEMA, USER_TABLES, shard_index, shard_paths, stored_shard_count, set_shard_count,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get("WELLBOT_DB", os.path.join(BASE_DIR, "users.db"))
+
+# Column whose value decides the shard of a row.
+ROUTING_COLUMN = {"profiles": "username", "chat_history": "user_id", "feedback": "user_id"}
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> list:
+    # ids are shard-local, so they are not carried over.
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "id"]
+
+
+def open_staging(paths: list) -> list:
+    conns = []
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        for ddl in USER_SCHEMA:
+            conn.execute(ddl)
+        answers.migrate_schema(conn)
+        feedback.migrate_schema(conn)
+        conns.append(conn)
+    return conns
+
+
+def copy_turns(src: sqlite3.Connection, staging: list, caches: list, batch: int, rated: set, new_ids: dict) -> int:
+    """
+    chat_history rows reference shard-local answer ids, so answers are re-interned on the target.
+    Turns get new ids there; those of rated turns are recorded in new_ids for the feedback copy.
+    """
+    rows = src.execute(
+        f"SELECT ch.id, ch.user_id, ch.question, {answers.ANSWER_COLUMNS}, ch.timestamp, ch.intent, "
+        f"{answers.FAILED_SQL} FROM {answers.TURN_JOIN} ORDER BY ch.id"
+    )
+    copied = 0
+    while True:
+        chunk = rows.fetchmany(batch)
+        if not chunk:
+            return copied
+        for old_id, user_id, question, *answer, timestamp, intent, failed in chunk:
+            i = shard_index(user_id or "", len(staging))
+            turn_id = answers.insert_turn(staging[i], user_id, question, answers.resolve(*answer), caches[i], timestamp,
+                                          bool(failed))
+            if old_id in rated:
+                new_ids[old_id] = turn_id
+                staging[i].execute("UPDATE chat_history SET intent=? WHERE id=?", (intent, turn_id))
+        copied += len(chunk)
+
+
+def copy_rows(old_paths: list, staging: list, batch: int = 5000) -> dict:
+    counts = {table: 0 for table in USER_TABLES}
+    caches = [{} for _ in staging]
+    for path in old_paths:
+        if not os.path.exists(path):
+            continue
+        src = sqlite3.connect(path)
+        answers.migrate_schema(src)
+        feedback.migrate_schema(src)
+        rated = {t for (t,) in src.execute("SELECT DISTINCT turn_id FROM feedback WHERE turn_id IS NOT NULL")}
+        new_ids = {}
+        for table in USER_TABLES:
+            if table == "chat_history":
+                counts[table] += copy_turns(src, staging, caches, batch, rated, new_ids)
+                continue
+            cols = table_columns(src, table)
+            key = cols.index(ROUTING_COLUMN[table])
+            # A turn and its feedback route by the same user_id, so they land on the same shard.
+            # Links to turns already archived are dropped; those rows carry their own text.
+            turn = cols.index("turn_id") if table == "feedback" else None
+            insert = f"INSERT INTO {table}({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+            order = " ORDER BY id" if table != "profiles" else ""
+            rows = src.execute(f"SELECT {', '.join(cols)} FROM {table}{order}")
+            while True:
+                chunk = rows.fetchmany(batch)
+                if not chunk:
+                    break
+                routed = [[] for _ in staging]
+                for row in chunk:
+                    if turn is not None:
+                        row = row[:turn] + (new_ids.get(row[turn]),) + row[turn + 1:]
+                    routed[shard_index(row[key] or "", len(staging))].append(row)
+                for conn, part in zip(staging, routed):
+                    if part:
+                        conn.executemany(insert, part)
+                counts[table] += len(chunk)
+        src.close()
+    for conn in staging:
+        conn.commit()
+    return counts
+
+
+def replace_user_tables(primary: sqlite3.Connection, staging_path: str = None):
+    """Empty the user tables in the primary db, optionally refilling them from staging_path."""
+    if staging_path:
+        primary.execute("ATTACH DATABASE ? AS staging", (staging_path,))
+    with primary:
+        # answers keep their ids: the copied chat_history rows point at them.
+        primary.execute("DELETE FROM answers")
+        if staging_path:
+            primary.execute("INSERT INTO answers SELECT * FROM staging.answers")
+        for table in USER_TABLES:
+            primary.execute(f"DELETE FROM {table}")
+            if staging_path:
+                # ids are kept here: feedback.turn_id points at the staged chat_history ids.
+                cols = ", ".join(row[1] for row in primary.execute(f"PRAGMA table_info({table})"))
+                primary.execute(f"INSERT INTO {table}({cols}) SELECT {cols} FROM staging.{table}")
+    if staging_path:
+        primary.execute("DETACH DATABASE staging")
+
+
+def reshard(db_path: str, new_count: int) -> dict:
+    primary = sqlite3.connect(db_path)
+    for ddl in USER_SCHEMA:
+        primary.execute(ddl)
+    answers.migrate_schema(primary)
+    feedback.migrate_schema(primary)
+    old_count = stored_shard_count(primary) or 1
+    pending = primary.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name='chat_archive_parts'"
+    ).fetchone()[0] and primary.execute("SELECT COUNT(*) FROM chat_archive_parts WHERE deleted=0").fetchone()[0]
+    if pending:
+        primary.close()
+        raise SystemExit("an archive run was interrupted; run `python archive.py` before resharding")
+    if old_count == new_count:
+        primary.close()
+        return {"from": old_count, "to": new_count, "rows": {}}
+
+    old_paths = shard_paths(db_path, old_count)
+    new_paths = shard_paths(db_path, new_count)
+    staging_paths = [p + ".reshard" for p in new_paths]
+    staging = open_staging(staging_paths)
+    counts = copy_rows(old_paths, staging)
+    for conn in staging:
+        conn.close()
+
+    # Swap in. The primary file also holds users/kb, so it is rewritten in
+    # place instead of being replaced.
+    for old in old_paths:
+        if old != db_path and os.path.exists(old):
+            os.replace(old, old + ".bak")
+    for path, staged in zip(new_paths, staging_paths):
+        if path == db_path:
+            replace_user_tables(primary, staged)
+            os.remove(staged)
+        else:
+            os.replace(staged, path)
+    if db_path not in new_paths:
+        replace_user_tables(primary)
+
+    set_shard_count(primary, new_count)
+    primary.execute("VACUUM")
+    primary.close()
+    return {"from": old_count, "to": new_count, "rows": counts}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Change the number of user-data shards (run with the backend stopped).")
+    parser.add_argument("--to", type=int, required=True, help="new shard count")
+    parser.add_argument("--db", default=DEFAULT_DB, help="primary users.db (default: WELLBOT_DB or ./users.db)")
+    args = parser.parse_args(argv)
+    if args.to < 1:
+        parser.error("--to must be >= 1")
+
+    result = reshard(args.db, args.to)
+    if not result["rows"]:
+        print(f"{args.db} already uses {args.to} shard(s); nothing to do", file=sys.stderr)
+        return
+    moved = ", ".join(f"{t}={n}" for t, n in result["rows"].items())
+    print(f"resharded {result['from']} -> {result['to']} ({moved}); "
+          f"start the backend with WELLBOT_SHARDS={result['to']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Pre-fork production server for the WellBot backend.
+
+The master process imports backend (knowledge base, symptom indexes, DB schema)
+once, freezes the GC so the loaded objects are never touched by the collector,
+and then forks N uvicorn workers that share one listening socket. Read-only
+structures stay shared copy-on-write between workers. With --max-requests K,
+each worker exits gracefully after K requests (plus jitter) and the master
+forks a fresh one.
+
+Dialogue sessions (the symptoms collected over several turns) live in the
+memory of the process that serves the user, and the kernel hands each new
+connection on the shared socket to any worker. Several workers, or
+recycling one, would therefore lose a user's symptoms between turns. The
+defaults are one worker that is never recycled. To use more cores for chat,
+keep one API worker and set WELLBOT_DIALOGUE_WORKERS=N: that pool pins each
+user to one dialogue process (see dialogue_workers.py). More API workers are
+only allowed with --stateless, for deployments whose clients don't rely on
+multi-turn sessions.
+
+Usage:
+    python serve.py                                   # one worker, never recycled
+    WELLBOT_DIALOGUE_WORKERS=4 python serve.py
+    python serve.py --workers 4 --stateless --max-requests 10000
+"""
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+# --- Preload (runs once, in the master) ---
+def preload():
+    """Import everything workers need so it lands in shared pages before fork."""
+    # Keep the collector quiet while the big read-only structures are built,
+    # then move them all into the permanent generation.
+    gc.disable()
+    import backend
+    gc.collect()
+    gc.freeze()
+    return backend
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# --- Worker ---
+def run_worker(backend, sock: socket.socket, max_requests: int, log_level: str):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    random.seed()
+
+    # SQLite connections must not be shared across fork: open our own.
+    backend.connect_db()
+    backend.conn.execute("PRAGMA journal_mode=WAL")
+    backend.shards.execute_all("PRAGMA journal_mode=WAL")
+    gc.enable()
+
+    config = uvicorn.Config(
+        backend.app,
+        log_level=log_level,
+        limit_max_requests=max_requests or None,
+        access_log=False,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+# --- Master ---
+class Master:
+    def __init__(self, backend, sock, workers: int, max_requests: int, jitter: int, log_level: str):
+        self.backend = backend
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.log_level = log_level
+        self.children = {}  # pid -> spawn time
+        self.stopping = False
+
+    def spawn(self):
+        limit = self.max_requests + random.randint(0, self.jitter) if self.max_requests else 0
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.backend, self.sock, limit, self.log_level)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        print(f"[serve] worker {pid} started (max_requests={limit or 'unlimited'})", flush=True)
+
+    def signal_children(self, signum=signal.SIGTERM):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        self.signal_children()
+
+    def recycle_all(self, signum, frame):
+        """SIGHUP: ask every worker to finish in-flight requests and exit; they get replaced."""
+        self.signal_children()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.recycle_all)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            print(f"[serve] worker {pid} exited with {code}", flush=True)
+            if self.stopping:
+                continue
+            # Back off if workers are crashing on startup instead of recycling.
+            if code != 0 and time.monotonic() - started < 1.0:
+                time.sleep(1.0)
+            self.spawn()
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the WellBot backend with pre-forked workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BACKEND_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WELLBOT_WORKERS", 1)),
+                        help="API worker processes; more than one needs --stateless")
+    parser.add_argument("--stateless", action="store_true", default=os.environ.get("WELLBOT_STATELESS") == "1",
+                        help="allow several workers: clients don't rely on multi-turn dialogue sessions")
+    parser.add_argument("--max-requests", type=int, default=int(os.environ.get("WELLBOT_MAX_REQUESTS", 0)),
+                        help="recycle a worker after this many requests (0 = never); drops its live sessions")
+    parser.add_argument("--max-requests-jitter", type=int, default=int(os.environ.get("WELLBOT_MAX_REQUESTS_JITTER", 1000)),
+                        help="random extra requests per worker so they don't all recycle at once")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not args.stateless:
+        # Sessions are per process and connections are not routed by user.
+        parser.error("several workers would split a user's dialogue session between processes: "
+                     "use --workers 1 with WELLBOT_DIALOGUE_WORKERS=N, or pass --stateless")
+    if int(os.environ.get("WELLBOT_DIALOGUE_WORKERS", 0)) and args.workers > 1:
+        # Each API worker would fork its own dialogue pool and a user's turns would land in different ones.
+        parser.error("WELLBOT_DIALOGUE_WORKERS needs a single API process: use --workers 1")
+
+    backend = preload()
+    # The master never serves requests; drop its connections so no SQLite
+    # handle is inherited by the workers.
+    backend.close_db()
+    sock = bind_socket(args.host, args.port)
+    print(f"[serve] master {os.getpid()} listening on {args.host}:{args.port} with {args.workers} workers", flush=True)
+    Master(backend, sock, args.workers, args.max_requests, args.max_requests_jitter, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Hash-sharded storage for per-user tables.
+
+profiles, chat_history and feedback rows are routed to one of N SQLite files
+by crc32(username / user_id) % N; the global tables (users, kb) stay on the
+primary users.db. With N == 1 the single shard *is* the primary database, so
+existing installs keep working unchanged. The shard count is recorded in the
+primary's shard_meta table and checked on startup; use reshard.py to change it.
+"""
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import answers
+import feedback
+
+# --- Per-user tables (live on every shard) ---
+USER_TABLES = ("profiles", "chat_history", "feedback")
+
+USER_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS profiles(
+    username TEXT,
+    name TEXT,
+    age_group TEXT,
+    language TEXT
+)""",
+    """CREATE TABLE IF NOT EXISTS chat_history(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    question TEXT,
+    answer TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)""",
+    """CREATE TABLE IF NOT EXISTS feedback(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    question TEXT,
+    answer TEXT,
+    rating INTEGER,
+    comment TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_profiles_username ON profiles(username)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_history_user ON chat_history(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback(user_id)",
+]
+
+META_SCHEMA = "CREATE TABLE IF NOT EXISTS shard_meta(key TEXT PRIMARY KEY, value TEXT)"
+
+
+class ShardCountMismatch(RuntimeError):
+    pass
+
+
+def shard_index(key: str, count: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def shard_paths(primary_path: str, count: int) -> List[str]:
+    if count == 1:
+        return [primary_path]
+    base, ext = os.path.splitext(primary_path)
+    return [f"{base}.shard{i}{ext or '.db'}" for i in range(count)]
+
+
+class Shard:
+    """One SQLite file with its own connection; every statement sequence holds `lock`."""
+
+    def __init__(self, path: str, conn: sqlite3.Connection = None, lock=None):
+        self.path = path
+        self.conn = conn or sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = lock or threading.RLock()
+        self.owns_conn = conn is None
+        self.answer_ids = {}  # answers.intern cache
+
+    def ensure_schema(self):
+        with self.lock:
+            for ddl in USER_SCHEMA:
+                self.conn.execute(ddl)
+            answers.migrate_schema(self.conn)
+            feedback.migrate_schema(self.conn)
+            self.conn.commit()
+
+    def close(self):
+        if self.owns_conn:
+            self.conn.close()
+
+
+class ShardSet:
+    def __init__(self, shards: List[Shard]):
+        self.shards = shards
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard") if len(shards) > 1 else None
+
+    @classmethod
+    def open(cls, primary_path: str, count: int, primary_conn: sqlite3.Connection, primary_lock) -> "ShardSet":
+        """Open all shards; with count == 1 the primary connection is reused."""
+        check_shard_count(primary_conn, primary_lock, count)
+        if count == 1:
+            shards = [Shard(primary_path, primary_conn, primary_lock)]
+        else:
+            shards = [Shard(path) for path in shard_paths(primary_path, count)]
+        for shard in shards:
+            shard.ensure_schema()
+        return cls(shards)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def for_user(self, user_id: str) -> Shard:
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def map(self, fn: Callable[[Shard], object]) -> list:
+        """Run fn on every shard in parallel (sqlite3 releases the GIL while querying)."""
+        if self._pool is None:
+            return [fn(s) for s in self.shards]
+        return list(self._pool.map(fn, self.shards))
+
+    def execute_all(self, sql: str):
+        for shard in self.shards:
+            with shard.lock:
+                shard.conn.execute(sql)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        for shard in self.shards:
+            shard.close()
+
+
+def stored_shard_count(primary_conn: sqlite3.Connection):
+    primary_conn.execute(META_SCHEMA)
+    row = primary_conn.execute("SELECT value FROM shard_meta WHERE key='count'").fetchone()
+    return int(row[0]) if row else None
+
+
+def set_shard_count(primary_conn: sqlite3.Connection, count: int):
+    primary_conn.execute(META_SCHEMA)
+    primary_conn.execute("INSERT OR REPLACE INTO shard_meta(key, value) VALUES ('count', ?)", (str(count),))
+    primary_conn.commit()
+
+
+def check_shard_count(primary_conn: sqlite3.Connection, primary_lock, count: int):
+    with primary_lock:
+        stored = stored_shard_count(primary_conn)
+        if stored is None:
+            set_shard_count(primary_conn, count)
+        elif stored != count:
+            raise ShardCountMismatch(
+                f"users.db is laid out for {stored} shard(s) but WELLBOT_SHARDS={count}; "
+                f"run `python reshard.py --to {count}` first"
+            )
@@ -1,6 +1,11 @@
 #!/bin/bash
-# Start FastAPI backend in background
-uvicorn backend:app --host 0.0.0.0 --port 8000 &
+# Start FastAPI backend in background: one master preloads the KB and forks
+# a single worker, see serve.py. Dialogue sessions (symptoms collected over
+# several turns) live in that worker's memory, so it is never recycled and
+# WELLBOT_WORKERS must stay 1: the shared socket does not route a user back to
+# the same worker. Set WELLBOT_DIALOGUE_WORKERS=N to use more cores; that
+# pool keeps each user on one dialogue process.
+python serve.py --host 0.0.0.0 --port 8000 &
 
 # Wait a moment to ensure backend starts
 sleep 5
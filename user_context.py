@@ -0,0 +1,106 @@
+"""
+Per-user context for /chat: profile row, preferred language and the last N turns.
+
+A context is loaded once per user with two indexed queries on the user's
+shard, then served from memory. Later turns are appended to it, so it stays
+current without rereading chat_history.
+
+ContextCache is bounded by user count, least recently used first, and every
+entry expires after a TTL. An entry remembers the user's profile version
+from http_cache.Versions. POST /profile bumps that version in shared
+memory, so every serve.py worker reloads the context on its next turn, not
+just the worker that handled the update.
+
+WELLBOT_CONTEXT_TTL=0 disables caching: each turn loads the context again.
+That is what personalization costs without the cache.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Deque, Optional, Tuple
+
+MAX_USERS = int(os.environ.get("WELLBOT_CONTEXT_USERS", 10000))
+TTL_SECONDS = float(os.environ.get("WELLBOT_CONTEXT_TTL", 900))
+RECENT_TURNS = int(os.environ.get("WELLBOT_CONTEXT_TURNS", 6))
+
+# Profile form values (app.py) -> dialogue language codes
+LANGUAGES = {"english": "en", "en": "en", "hindi": "hi", "hi": "hi"}
+
+
+class UserContext:
+    """What the dialogue engine may use about a user; `language` is "en", "hi" or None."""
+
+    __slots__ = ("user_id", "profile", "language", "recent", "version", "expires")
+
+    def __init__(self, user_id: str, profile: Optional[dict], recent: Deque[Tuple[str, str]], version: int = 0):
+        self.user_id = user_id
+        self.profile = profile
+        self.language = LANGUAGES.get((profile or {}).get("language", "").strip().lower())
+        self.recent = recent
+        self.version = version
+        self.expires = 0.0
+
+    def __getstate__(self):
+        # Sent to dialogue worker processes (dialogue_workers.py).
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class ContextCache:
+    def __init__(self, loader: Callable[[str, int], UserContext], version_of: Callable[[str], int] = lambda u: 0,
+                 max_users: int = MAX_USERS, ttl: float = TTL_SECONDS, turns: int = RECENT_TURNS):
+        self.loader = loader          # (user_id, turns) -> UserContext
+        self.version_of = version_of  # user_id -> current profile version
+        self.max_users = max(1, max_users)
+        self.ttl = ttl
+        self.turns = turns
+        self._entries: "OrderedDict[str, UserContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.stale = 0
+
+    def get(self, user_id: str) -> UserContext:
+        version = self.version_of(user_id)
+        now = time.monotonic()
+        with self._lock:
+            ctx = self._entries.get(user_id)
+            if ctx is not None:
+                if ctx.version == version and ctx.expires > now:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return ctx
+                del self._entries[user_id]
+                self.stale += 1
+            self.misses += 1
+
+        ctx = self.loader(user_id, self.turns)
+        ctx.version = version
+        if self.ttl <= 0:
+            return ctx
+        ctx.expires = now + self.ttl
+        with self._lock:
+            self._entries[user_id] = ctx
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return ctx
+
+    def record_turn(self, user_id: str, question: str, answer: str):
+        with self._lock:
+            ctx = self._entries.get(user_id)
+            if ctx is not None:
+                ctx.recent.append((question, answer))
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {"users": size, "max_users": self.max_users, "ttl_seconds": self.ttl, "hits": self.hits,
+                "misses": self.misses, "stale": self.stale, "evictions": self.evictions}